@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from lbp_print import config, hashing
+from lbp_print.core import Cache, LocalResource, Tex
+
+XSLT = os.path.join(config.module_dir, "test", "assets", "simple.xslt")
+
+
+def tex(resource, **kwargs):
+    return Tex(resource, engine="lxml", **kwargs)
+
+
+@pytest.fixture(scope="session")
+def resource(corpus):
+    return LocalResource(corpus, custom_xslt=XSLT)
+
+
+@pytest.fixture(scope="session")
+def transformed(resource):
+    """The TeX of the corpus before cleanup."""
+    return tex(resource, enable_caching=False).xml_to_tex()
+
+
+class TestResource:
+    def test_create_hash(self, benchmark, resource):
+        def create_hash():
+            # Digests are memoized per file, which would hide the hashing.
+            hashing._file_digest.cache_clear()
+            return resource.create_hash()
+
+        assert benchmark(create_hash) == resource.digest
+
+    def test_get_schema_info(self, benchmark, resource):
+        assert benchmark(resource.get_schema_info) == {
+            "version": "1.0.0",
+            "type": "critical",
+        }
+
+
+class TestTex:
+    def test_whitespace_cleanup(self, benchmark, resource, transformed):
+        item = tex(resource, enable_caching=False)
+        benchmark(item.whitespace_cleanup, transformed)
+
+    def test_samewords(self, benchmark, resource, transformed):
+        item = tex(resource, enable_caching=False, clean_whitespace=False)
+        cleaned = item.whitespace_cleanup(transformed)
+        benchmark(item.clean, cleaned)
+
+    def test_cache_lookup(self, benchmark, resource, tmp_path):
+        cache = Cache(str(tmp_path))
+        item = tex(resource, cache=cache)
+        output = item.process(output_format="tex")
+
+        assert benchmark(item.process, output_format="tex") == output
+        assert item.cache_hits["tex"]
+
+    def test_process(self, benchmark, corpus, tmp_path):
+        def process():
+            return tex(
+                LocalResource(corpus, custom_xslt=XSLT),
+                enable_caching=False,
+                output_dir=str(tmp_path),
+            ).process(output_format="tex")
+
+        benchmark(process)
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from lbp_print.corpus import PARAGRAPHS_PER_UNIT, generate
+
+STORAGE_DEFAULT = "file://./.benchmarks"
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--corpus-scale",
+        default="1,10,100",
+        help="Comma separated sizes of the generated corpora, as multiples of 30 KB, the "
+        "size of da-49-l1q1.xml. Use 1000 for a corpus of about 30 MB.",
+    )
+
+
+def pytest_configure(config):
+    # Keep the results of every run in benchmarks/.benchmarks, so they can be compared
+    # across versions with --benchmark-compare.
+    if config.pluginmanager.hasplugin("benchmark"):
+        if not config.getoption("benchmark_disable"):
+            config.option.benchmark_autosave = True
+        if config.getoption("benchmark_storage") == STORAGE_DEFAULT:
+            config.option.benchmark_storage = "file://" + os.path.join(
+                os.path.dirname(__file__), ".benchmarks"
+            )
+
+
+def pytest_generate_tests(metafunc):
+    if "corpus" in metafunc.fixturenames:
+        scales = [
+            int(scale) for scale in metafunc.config.getoption("corpus_scale").split(",")
+        ]
+        metafunc.parametrize(
+            "corpus",
+            scales,
+            indirect=True,
+            scope="session",
+            ids=[f"x{scale}" for scale in scales],
+        )
+
+
+@pytest.fixture(scope="session")
+def corpus(request, tmp_path_factory):
+    """Name of a generated corpus file."""
+    scale = request.param
+    filename = str(tmp_path_factory.mktemp("corpus").joinpath(f"corpus-{scale}.xml"))
+    return generate(filename, paragraphs=scale * PARAGRAPHS_PER_UNIT)
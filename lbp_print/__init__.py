@@ -1,7 +1,7 @@
 import logging
 
-import lbp_print.core
 import lbp_print.config
+from lbp_print.api import Options, Result, build
 
 
 # Setup logging according to configuration
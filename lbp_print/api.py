@@ -0,0 +1,181 @@
+"""Library interface for converting batches of items.
+
+`build` runs the whole pipeline for many items in one call and returns a `Result` per item
+with the output, the cache hits and the time spent in each stage. All settings are passed
+in `Options` and handed down to the resources and `Tex` objects, so `build` never changes
+the module-level configuration and can be called from several threads at once.
+
+    >>> from lbp_print import Options, build
+    >>> results = build(["da-49-l1q1.xml"], Options(output_format="pdf", cache_dir="cache"))
+    >>> results[0].output, results[0].timings
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from lbp_print import config
+
+logger = logging.getLogger("lbp_print.api")
+
+SOURCES = ("local", "scta", "url")
+
+
+class Options:
+    """Settings of a build.
+
+    :param output_format: "tex" or "pdf".
+    :param source: Kind of the items: "local" files, "scta" ids or "url"s.
+    :param cache_dir: Cache dir of the results. Without one, nothing is cached and the
+        results are written to `output_dir`.
+    :param output_dir: Directory of the results without a cache dir. Defaults to a new
+        temporary directory per build, which is left for the caller to remove.
+    :param read_output: Return the content of the output files in the results.
+    :param jobs: Number of items processed at the same time.
+    :param offline: Work from the cache only. Defaults to `config.offline`.
+    :param latex_format: Compile against a precompiled preamble. Defaults to
+        `config.latex_format`.
+    """
+
+    def __init__(
+        self,
+        output_format: str = "tex",
+        source: str = "local",
+        xslt: str = None,
+        xslt_parameters: str = None,
+        engine: str = None,
+        clean_whitespace: bool = True,
+        annotate_samewords: bool = True,
+        cache_dir: str = None,
+        output_dir: str = None,
+        read_output: bool = False,
+        jobs: int = 1,
+        offline: bool = None,
+        latex_format: bool = None,
+    ) -> None:
+        if output_format not in ("tex", "pdf"):
+            raise ValueError(f"Unknown output format '{output_format}'.")
+        if source not in SOURCES:
+            raise ValueError(
+                f"Unknown source '{source}'. Choose one of: {', '.join(sorted(SOURCES))}."
+            )
+        self.output_format = output_format
+        self.source = source
+        self.xslt = xslt
+        self.xslt_parameters = xslt_parameters
+        self.engine = engine
+        self.clean_whitespace = clean_whitespace
+        self.annotate_samewords = annotate_samewords
+        self.cache_dir = cache_dir
+        self.output_dir = output_dir
+        self.read_output = read_output
+        self.jobs = jobs
+        self.offline = config.offline if offline is None else offline
+        self.latex_format = (
+            config.latex_format if latex_format is None else latex_format
+        )
+
+
+class Result:
+    """Outcome of the build of one item.
+
+    `timings` has the seconds spent in each stage that ran: resolve, hash, transform, clean,
+    samewords and compile. `cache_hits` tells for the cached stages (transform, tex and pdf)
+    whether the result came from the cache. A failed item has its exception in `error`.
+    """
+
+    def __init__(self, item: str) -> None:
+        self.item = item
+        self.output: Optional[str] = None
+        self.content: Optional[bytes] = None
+        # Cache key of the output.
+        self.digest: Optional[str] = None
+        self.cache_hits: Dict[str, bool] = {}
+        self.timings: Dict[str, float] = {}
+        self.error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self) -> str:
+        return f"<Result {self.item}: {self.error or self.output}>"
+
+
+def build(items: List[str], options: Options = None) -> List[Result]:
+    """Convert the items with the options.
+
+    Every item is processed independently, so a failing item does not stop the others.
+
+    :return: List of the results in the order of `items`.
+    """
+    options = options or Options()
+    output_dir = None
+    if not options.cache_dir:
+        output_dir = options.output_dir or tempfile.mkdtemp(prefix="lbp_print-")
+        os.makedirs(output_dir, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=max(options.jobs, 1)) as executor:
+        return list(
+            executor.map(lambda item: build_item(item, options, output_dir), items)
+        )
+
+
+def build_item(
+    item: str, options: Options, output_dir: str = None, cache: "Cache" = None
+) -> Result:
+    """Convert a single item. See `build`.
+
+    :param cache: Open cache of `options.cache_dir`, to avoid reading its registry again.
+    """
+    from lbp_print.core import LocalResource, RemoteResource, Tex, UrlResource
+
+    result = Result(item)
+    try:
+        start = time.perf_counter()
+        if options.source == "local":
+            resource = LocalResource(item, custom_xslt=options.xslt)
+        else:
+            resource = {"scta": RemoteResource, "url": UrlResource}[options.source](
+                item,
+                custom_xslt=options.xslt,
+                cache_dir=options.cache_dir or "",
+                offline=options.offline,
+            )
+        result.timings["resolve"] = time.perf_counter() - start
+        result.timings.update(resource.timings)
+        result.timings["resolve"] -= resource.timings.get("hash", 0.0)
+
+        tex = Tex(
+            resource,
+            xslt_parameters=options.xslt_parameters,
+            clean_whitespace=options.clean_whitespace,
+            enable_caching=bool(options.cache_dir),
+            annotate_samewords=options.annotate_samewords,
+            engine=options.engine,
+            cache_dir=options.cache_dir,
+            output_dir=output_dir,
+            latex_format=options.latex_format,
+            cache=cache,
+        )
+        output = tex.process(output_format=options.output_format)
+        digest = tex.pdf_digest if options.output_format == "pdf" else tex.tex_digest
+        if output_dir and options.output_format == "pdf":
+            # Without a cache, PDFs are compiled in the temporary dir of the resource.
+            output = shutil.copyfile(output, os.path.join(output_dir, digest + ".pdf"))
+        result.output = os.path.abspath(output)
+        result.digest = digest
+        result.cache_hits = dict(tex.cache_hits)
+        result.timings.update(tex.timings)
+        if options.read_output:
+            with open(output, mode="rb") as f:
+                result.content = f.read()
+    except Exception as e:
+        logger.error(f"Failed to build {item}.\n{type(e).__name__}: {e}")
+        result.error = e
+    return result
@@ -0,0 +1,126 @@
+"""Editions assembled from many transcriptions.
+
+With `--book`, the items are combined into one document in the given order. Every item is
+converted to TeX on its own, so it is cached separately and only the items that changed are
+converted again. The bodies of the items are then combined into one document with the
+preamble of the first item, which is compiled once in stead of once per item.
+"""
+
+from typing import List, Tuple
+
+import logging
+import os
+
+from lbp_print import hashing
+from lbp_print.core import Document, Tex, timed
+
+logger = logging.getLogger("lbp_print.book")
+
+BEGIN = "\\begin{document}"
+END = "\\end{document}"
+
+
+def split_document(buffer: str) -> Tuple[str, str]:
+    """Split a TeX document into its preamble and the body of the document environment.
+
+    :return: Tuple of the preamble and the body. The preamble is empty when the buffer has
+        no document environment.
+    """
+    preamble, begin, rest = buffer.partition(BEGIN)
+    if not begin:
+        return "", buffer
+    body, end, _ = rest.rpartition(END)
+    return preamble, body if end else rest
+
+
+class Book(Document):
+    """Object combining the TeX of several items into one document.
+
+    A book is saved and compiled like a single item, with a build dir kept per book name.
+    The settings of the output are those of the first section.
+    """
+
+    class Source:
+        def __init__(self, source_id: str, name: str) -> None:
+            self.source_id = source_id
+            self.id = name
+            self.input = name
+
+    def __init__(
+        self,
+        sections: List[Tex],
+        name: str,
+        source_id: str = None,
+        enable_caching: bool = True,
+        cache_dir: str = None,
+    ) -> None:
+        super().__init__(
+            self.Source(source_id or f"book:{name}", name),
+            name,
+            sections[0].tmp_dir,
+            enable_caching=enable_caching,
+            cache_dir=cache_dir,
+            output_dir=sections[0].output_dir,
+            latex_format=sections[0].latex_format,
+        )
+        self.sections = sections
+        self.tex_digest = hashing.text_digest(
+            "book", *[section.tex_digest for section in sections]
+        )
+        self.pdf_digest = hashing.text_digest(self.tex_digest, "latexmk --xelatex")
+
+    def process(self, output_format):
+        """Convert the sections to TeX, combine them and compile the result to PDF if
+        required.
+
+        :return: File object.
+        """
+        tex_files = []
+        for num, section in enumerate(self.sections, 1):
+            logger.info(f"Converting {section.id}. [{num}/{len(self.sections)}]")
+            tex_files.append(section.process(output_format="tex"))
+
+        if self.cache:
+            with self.cache.lock(self.tex_digest):
+                self.cache_hits["tex"] = self.cache.contains(
+                    basename=self.tex_digest + ".tex"
+                )
+                if self.cache_hits["tex"]:
+                    logger.info(f"Using cached version of {self.id}.")
+                    output_file = os.path.join(self.cache.dir, self.tex_digest + ".tex")
+                else:
+                    output_file = self.save(
+                        self.assemble(tex_files), digest=self.tex_digest, suffix=".tex"
+                    )
+        else:
+            output_file = self.save(
+                self.assemble(tex_files), digest=self.tex_digest, suffix=".tex"
+            )
+
+        if output_format == "pdf":
+            with timed(self.timings, "compile"):
+                output_file = self.compile(output_file)
+
+        return output_file
+
+    def assemble(self, tex_files: List[str]) -> str:
+        """Combine the bodies of the TeX files in one document with the preamble of the
+        first file.
+
+        :return: The TeX buffer of the book.
+        """
+        preamble = None
+        bodies = []
+        for section, tex_file in zip(self.sections, tex_files):
+            with open(tex_file, encoding="utf-8") as f:
+                section_preamble, body = split_document(f.read())
+            if preamble is None:
+                preamble = section_preamble
+            elif section_preamble and section_preamble != preamble:
+                logger.warning(
+                    f"The preamble of {section.id} differs from the preamble of the first "
+                    "item. Only the first is used."
+                )
+            bodies.append(f"% {section.id}\n" + body.strip("\n") + "\n")
+        logger.info(f"Combined {len(bodies)} items in {self.id}.")
+        return preamble + BEGIN + "\n" + "\n".join(bodies) + END + "\n"
@@ -0,0 +1,102 @@
+"""Whitespace cleanup of the TeX produced by the XSLT conversion.
+
+The cleanup rules used to be applied as a list of regular expression substitutions in a row,
+each compiling its pattern and copying the full buffer. The same rules are now compiled once
+at import and fused into a few passes. The whitespace passes only delete characters, so they
+can use a plain replacement, and their patterns start with a literal space so the regex
+engine can skip quickly to the next candidate.
+
+The result is identical to applying the original rules one after another:
+
+1. Remove redundant space around opening brackets, before closing brackets and before
+   punctuation.
+2. Remove space before empty lemma app notes, excessive whitespace, space between closing
+   brackets and punctuation, leading space at the beginning of lines, trailing space at
+   paragraph end and space inside parentheses.
+3. Add missing space between adjacent app notes.
+4. Escape `_` and `^` characters.
+5. Replace anything wrapped in quotes ("...") with `\\enquote{...}`.
+"""
+
+import logging
+import re
+
+logger = logging.getLogger("lbp_print.cleanup")
+
+# Space after "{", or before "{", "}" or punctuation.
+BRACKET_SPACE = re.compile(r" (?:(?=[{}.,?!:;])|(?<={ ))")
+
+# Spaces are removed as whole runs, where the context requires it, or one at a time, leaving
+# the last space of a run.
+REDUNDANT_SPACE = re.compile(
+    r" (?:"
+    # A single space before an empty lemma app note.
+    r"(?<!  )(?=\\edtext{})"
+    # Leading space at beginning of line.
+    r"|(?<=^ ) *"
+    # Space after opening parenthesis.
+    r"|(?<=\( ) *"
+    # Space before closing parenthesis and before the paragraph end.
+    r"| *(?=\)|%$)"
+    # Space between closing brackets and punctuation.
+    r"|(?<=} ) *(?=[.,?!:;])"
+    # Excessive whitespace.
+    r"|(?= )" r")",
+    flags=re.MULTILINE,
+)
+
+ADJACENT_APP_NOTES = re.compile(r"}(\\edtext{[^}]+})")
+
+QUOTE = re.compile(r'"')
+
+
+def enquote(buffer: str) -> str:
+    """Replace text in double quotes with `\\enquote{}`.
+
+    Quotes are paired from left to right. Two adjacent quotes do not enclose anything, so the
+    second of them is taken as the opening quote. Quotes that cannot be paired are left in the
+    buffer and reported with a warning.
+    """
+    output = []
+    position = 0
+    opening = None
+    unbalanced = []
+
+    for match in QUOTE.finditer(buffer):
+        start = match.start()
+        if opening is None:
+            opening = start
+        elif opening == start - 1:
+            unbalanced.append(opening)
+            opening = start
+        else:
+            output.append(buffer[position:opening])
+            output.append("\\enquote{")
+            output.append(buffer[opening + 1 : start])
+            output.append("}")
+            position = start + 1
+            opening = None
+
+    if opening is not None:
+        unbalanced.append(opening)
+    for index in unbalanced:
+        line = buffer.count("\n", 0, index) + 1
+        logger.warning(
+            f"Unbalanced quotation mark on line {line} of the TeX output. "
+            "It has not been converted to \\enquote."
+        )
+
+    output.append(buffer[position:])
+    return "".join(output)
+
+
+def whitespace_cleanup(buffer: str) -> str:
+    """Clean the TeX buffer for different whitespace problems.
+
+    :return: The cleaned buffer.
+    """
+    buffer = BRACKET_SPACE.sub("", buffer)
+    buffer = REDUNDANT_SPACE.sub("", buffer)
+    buffer = ADJACENT_APP_NOTES.sub(r"} \1", buffer)
+    buffer = buffer.replace("_", "\\_").replace("^", "\\^")
+    return enquote(buffer)
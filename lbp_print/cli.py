@@ -6,6 +6,9 @@ Usage:
   lbp_print (tex|pdf) [options] --local <file>...
   lbp_print (tex|pdf) [options] --scta <id>...
   lbp_print recipe <recipe> [options]
+  lbp_print cache (stats|verify) [options]
+  lbp_print cache prune [--max-size <size>] [--max-age <days>] [options]
+  lbp_print serve [--host <host>] [--port <port>] [options]
 
 Pull LBP-compliant files from SCTA repositories or use local, convert them into
 tex or pdf.
@@ -21,6 +24,12 @@ Commands:
   pdf                      Convert the xml to a tex-file and compile it into a
                            pdf.
   recipe <recipe>          Follow recipe in config file in <recipe>.
+  cache stats              Show the number and size of the cached files.
+  cache prune              Remove cached files by age and/or total size.
+  cache verify             Check the cache registry against the cached files
+                           and repair it.
+  serve                    Run a render service answering render requests over
+                           HTTP. See the README for the requests.
 
 Options:
   --scta                   Flag. When present, the <id> should be an expression
@@ -32,6 +41,9 @@ Options:
   --output, -o <dir>       Put results in the specified directory. If nothing is
                            set, it will output to current working dir.
   --cache-dir <dir>        The directory where cached files should be stored.
+  --engine <name>          XSLT engine: saxon, lxml (XSLT 1.0 only, no Java
+                           required) or auto (lxml when the script is XSLT 1.0,
+                           otherwise saxon). Defaults to saxon.
   --xslt-parameters <str>  Command line parameters that will be
                            passed to the XSLT script. Unfortunately, this only
                            works with one parameter at the moment.
@@ -39,7 +51,31 @@ Options:
   --config-file <file>     Location of a config file in json format.
                            [default: ~/.lbp_print.json]
   --no-cache               Skip the cache check.
+  --max-size <size>        Remove the least recently used cached files until
+                           the cache is no larger than <size>, e.g. 500M or 2G.
+  --max-age <days>         Remove cached files not used in <days> days.
   --no-samewords           Do not add sameword annotations to the output.
+  --offline                Work from the cache only, without network access.
+                           SCTA items and urls must have been processed before.
+  --downloads <n>          Number of SCTA items to resolve and download at the
+                           same time. Defaults to 8.
+  --book <name>            Combine the items, in the given order, into one
+                           document, which is compiled once and written to
+                           <name>.tex or <name>.pdf in the working dir.
+                           Only the items that changed are converted again.
+  --watch                  Keep running and rebuild the items given with --local
+                           when they or the --xslt script change.
+  --compile-jobs <n>       Number of PDF compilations to run at the same time.
+                           Defaults to the number of CPUs, limited by the
+                           available memory.
+  --latex-format           Load the preamble of the TeX files from a precompiled
+                           XeLaTeX format. Requires the mylatexformat package
+                           and a cache dir.
+  --host <host>            Address of the render service. [default: 127.0.0.1]
+  --port <port>            Port of the render service. [default: 8000]
+  -j, --jobs <n>           Number of items to process in parallel, each in its own
+                           process. Failing items do not stop the others.
+                           [default: 1]
   -V, --verbosity <level>  Set verbosity. Possibilities: silent, info, debug
                            [default: info].
   -v, --version            Show version and exit.
@@ -49,13 +85,17 @@ Options:
 import logging
 import os
 import json
+import shutil
 
 from docopt import docopt
 
 from lbp_print import config
-from lbp_print.core import LocalResource, RemoteResource, Tex
+from lbp_print import exceptions as lbp_exceptions
 from lbp_print.__about__ import __version__
 
+# The modules doing the work are imported by the functions using them, so showing the help
+# or the version does not load lxml, the network modules or the RDF libraries of lbppy.
+
 logger = logging.getLogger("lbp_print.cli")
 
 
@@ -126,9 +166,322 @@ def setup_arguments(cl_args):
     if args["--cache-dir"]:
         config.cache_dir = args["--cache-dir"]
 
+    if args.get("--compile-jobs"):
+        config.compile_jobs = int(args["--compile-jobs"])
+
+    if args.get("--offline"):
+        config.offline = True
+
+    if args.get("--latex-format"):
+        config.latex_format = True
+
+    if args.get("--downloads"):
+        config.network_jobs = int(args["--downloads"])
+
     return args
 
 
+def resolve(args, identifier):
+    """Create the resource object of an item given on the command line."""
+    from lbp_print.core import LocalResource, RemoteResource
+
+    if args["--scta"]:
+        return RemoteResource(identifier, custom_xslt=args["--xslt"])
+    elif args["--local"]:
+        return LocalResource(identifier, custom_xslt=args["--xslt"])
+
+
+def make_tex(args, item):
+    """Create the `Tex` object of a resource object with the command line settings."""
+    from lbp_print.core import Tex
+
+    # Determine xslt script file (either provided or selected based on the xml transcription)
+    if args["--xslt"]:
+        item.xslt = item.select_xlst_script(external=args["--xslt"])
+
+    if args["--no-cache"]:
+        caching = False
+    else:
+        caching = True
+
+    if args["--no-samewords"]:
+        samewords = False
+    else:
+        samewords = True
+
+    return Tex(
+        item,
+        xslt_parameters=args["--xslt-parameters"],
+        enable_caching=caching,
+        annotate_samewords=samewords,
+        engine=args["--engine"],
+    )
+
+
+def convert(args, item, output_format):
+    """Convert a resource object to the requested output format.
+
+    :return: Path of the output file.
+    """
+    tex = make_tex(args, item)
+    return keep_output(tex, tex.process(output_format=output_format))
+
+
+def keep_output(tex, output_file):
+    """Copy a PDF compiled without a cache to the output dir of the `Tex` object, as it is
+    compiled in the temporary dir of the resource, which is removed with the resource.
+
+    :return: Path of the output file.
+    """
+    if tex.cache or not output_file.endswith(".pdf"):
+        return output_file
+    return shutil.copy(output_file, tex.output_dir)
+
+
+def keep_book(document, output_file):
+    """Name the output of a book after the book, in its output dir. The TeX written to the
+    output dir without a cache is renamed, other output is copied.
+
+    :return: Path of the output file.
+    """
+    target = os.path.join(
+        document.output_dir, document.name + os.path.splitext(output_file)[1]
+    )
+    if not document.cache and output_file.endswith(".tex"):
+        os.replace(output_file, target)
+    else:
+        shutil.copyfile(output_file, target)
+    return target
+
+
+def compile_batch(args, transcriptions):
+    """Convert the resource objects to TeX one by one and compile the TeX files side by side
+    with the compile scheduler.
+
+    :return: List of the PDF files in the order of `transcriptions`.
+    """
+    from lbp_print import latex
+
+    jobs = []
+    for num, item in enumerate(transcriptions, 1):
+        logger.info(f"Converting {item.input}. [{num}/{len(transcriptions)}]")
+        tex = make_tex(args, item)
+        jobs.append((tex, tex.process(output_format="tex")))
+    return [
+        keep_output(tex, output_file)
+        for (tex, _), output_file in zip(jobs, latex.compile_all(jobs))
+    ]
+
+
+def init_worker(settings, level):
+    """Apply the configuration of the parent process in a worker process."""
+    for key, value in settings.items():
+        setattr(config, key, value)
+    logging.getLogger("lbp_print").setLevel(level)
+
+
+def process_item(args, identifier, output_format):
+    """Resolve and convert a single item. This runs in the worker processes of `--jobs`.
+
+    :return: Path of the output file.
+    """
+    return convert(args, resolve(args, identifier), output_format)
+
+
+def process_parallel(args, identifiers, output_format, jobs):
+    """Process the items in a pool of `jobs` worker processes.
+
+    Every item is processed independently, so a failing item does not stop the others. The
+    failures are collected and raised together when all items are done.
+
+    :return: List of output file paths in the order of `identifiers`.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    settings = {
+        key: getattr(config, key)
+        for key in (
+            "cache_dir",
+            "saxon_worker",
+            "transform_engine",
+            "offline",
+            "latex_format",
+        )
+    }
+    level = logging.getLogger("lbp_print").level
+    results = [None] * len(identifiers)
+    failures = []
+
+    logger.info(f"Processing {len(identifiers)} items with {jobs} jobs.")
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=init_worker, initargs=(settings, level)
+    ) as executor:
+        futures = {
+            executor.submit(process_item, dict(args), identifier, output_format): num
+            for num, identifier in enumerate(identifiers)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            num = futures[future]
+            try:
+                results[num] = future.result()
+            except Exception as e:
+                logger.error(
+                    f"Failed to process {identifiers[num]}. [{done}/{len(identifiers)}]\n"
+                    f"{type(e).__name__}: {e}"
+                )
+                failures.append((identifiers[num], e))
+            else:
+                logger.info(
+                    f"Finished {identifiers[num]}. [{done}/{len(identifiers)}]\n "
+                    f"The output file is located at {os.path.abspath(results[num])}"
+                )
+
+    if failures:
+        raise lbp_exceptions.BatchError(failures)
+    return results
+
+
+def build(args, transcriptions, output_format):
+    """Convert the resource objects to the output format, as a book with `--book`."""
+    from lbp_print import book
+
+    if args.get("--book"):
+        document = book.Book(
+            [make_tex(args, item) for item in transcriptions],
+            name=args["--book"],
+            enable_caching=not args["--no-cache"],
+        )
+        result_file = keep_book(document, document.process(output_format=output_format))
+        logger.info(
+            "Results returned sucessfully.\n "
+            "The output file is located at %s" % os.path.abspath(result_file)
+        )
+        return
+
+    if output_format == "pdf" and len(transcriptions) > 1:
+        for result_file in compile_batch(args, transcriptions):
+            logger.info(
+                "Results returned sucessfully.\n "
+                "The output file is located at %s" % os.path.abspath(result_file)
+            )
+        return
+
+    for num, item in enumerate(transcriptions, 1):
+        logger.info("-------")
+        logger.info(f"Processing {item.input}. [{num}/{len(transcriptions)}]")
+
+        result_file = convert(args, item, output_format)
+
+        # Handle output dir
+        # output_dir=args["--output"]
+
+        logger.info(
+            "Results returned sucessfully.\n "
+            "The output file is located at %s" % os.path.abspath(result_file)
+        )
+
+
+def watch_items(args, identifiers, transcriptions, output_format):
+    """Rebuild the local items when they or the custom xslt script change.
+
+    Only the changed items are initialized and converted again, all items when the xslt
+    script changed. A book is combined again from all items, the unchanged from the cache.
+    """
+    from lbp_print import watch
+
+    resources = dict(zip(identifiers, transcriptions))
+    xslt = os.path.abspath(args["--xslt"]) if args["--xslt"] else None
+
+    def rebuild(changed):
+        if xslt in changed:
+            stale = identifiers
+        else:
+            stale = [exp for exp in identifiers if os.path.abspath(exp) in changed]
+        for exp in stale:
+            resources[exp] = resolve(args, exp)
+        if args.get("--book"):
+            stale = identifiers
+        build(args, [resources[exp] for exp in stale], output_format)
+
+    try:
+        watch.watch(identifiers + ([xslt] if xslt else []), rebuild)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching.")
+
+
+def serve_command(args):
+    """Run the render service with the command line settings."""
+    from lbp_print import api, serve
+
+    serve.serve(
+        args["--host"],
+        int(args["--port"]),
+        api.Options(
+            source="local" if args["--local"] else "scta",
+            xslt=args["--xslt"],
+            xslt_parameters=args["--xslt-parameters"],
+            engine=args["--engine"],
+            annotate_samewords=not args["--no-samewords"],
+            cache_dir=None if args["--no-cache"] else config.cache_dir,
+            jobs=int(args["--jobs"] or 1),
+        ),
+    )
+
+
+def parse_size(size: str) -> int:
+    """Convert a size such as 500M or 2G to a number of bytes."""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    size = size.strip().upper().rstrip("B")
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def format_size(size: int) -> str:
+    for unit in ("B", "K", "M"):
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}G"
+
+
+def cache_command(args):
+    """Run the `cache` subcommands on the configured cache dir."""
+    from lbp_print.core import Cache
+
+    cache = Cache(config.cache_dir)
+
+    if args["stats"]:
+        stats = cache.stats()
+        print(f"Cache dir: {cache.dir}")
+        print(f"Entries: {stats['entries']} ({format_size(stats['size'])})")
+        for stage, stage_stats in sorted(stats["stages"].items()):
+            print(
+                f"  {stage}: {stage_stats['entries']} "
+                f"({format_size(stage_stats['size'])})"
+            )
+
+    elif args["prune"]:
+        if not (args["--max-size"] or args["--max-age"]):
+            logger.error("Pruning requires --max-size and/or --max-age.")
+            return
+        removed = cache.prune(
+            max_size=parse_size(args["--max-size"]) if args["--max-size"] else None,
+            max_age=float(args["--max-age"]) * 86400 if args["--max-age"] else None,
+        )
+        logger.info(f"Removed {len(removed)} files from the cache.")
+
+    elif args["verify"]:
+        report = cache.verify()
+        for problem, names in report.items():
+            for name in names:
+                logger.warning(f"{name} was {problem}.")
+        if any(report.values()):
+            logger.info("The cache registry has been repaired.")
+        else:
+            logger.info("The cache registry is consistent with the cached files.")
+
+
 def main():
 
     args = setup_arguments(docopt(__doc__, version=__version__))
@@ -137,16 +490,13 @@ def main():
     logger.setLevel(args["--verbosity"].upper())
     logger.debug("Logging initialized at debug level.")
 
-    # Initialize the object
-    transcriptions = []
-    if args["--scta"]:
-        for num, exp in enumerate(args["<id>"], 1):
-            logger.info(f'Initializing {exp}. [{num}/{len(args["<id>"])}]')
-            transcriptions.append(RemoteResource(exp, custom_xslt=args["--xslt"]))
-    elif args["--local"]:
-        for num, exp in enumerate(args["<file>"], 1):
-            logger.info(f'Initializing {exp}. [{num}/{len(args["<file>"])}]')
-            transcriptions.append(LocalResource(exp, custom_xslt=args["--xslt"]))
+    if args["cache"]:
+        cache_command(args)
+        return
+
+    if args.get("serve"):
+        serve_command(args)
+        return
 
     if args["pdf"]:
         output_format = "pdf"
@@ -155,35 +505,43 @@ def main():
     else:
         output_format = None
 
-    for num, item in enumerate(transcriptions, 1):
-        # Determine xslt script file (either provided or selected based on the xml transcription)
-        logger.info("-------")
-        logger.info(f"Processing {item.input}. [{num}/{len(transcriptions)}]")
-
-        if args["--xslt"]:
-            item.xslt = item.select_xlst_script(args["--xslt"])
-
-        if args["--no-cache"]:
-            caching = False
-        else:
-            caching = True
+    if args["--scta"]:
+        identifiers = args["<id>"]
+    elif args["--local"]:
+        identifiers = args["<file>"]
+    else:
+        identifiers = []
 
-        if args["--no-samewords"]:
-            samewords = False
-        else:
-            samewords = True
+    if args.get("--watch") and not args["--local"]:
+        logger.error("Only items given with --local can be watched.")
+        return
 
-        result_file = Tex(
-            item,
-            xslt_parameters=args["--xslt-parameters"],
-            enable_caching=caching,
-            annotate_samewords=samewords,
-        ).process(output_format=output_format)
+    jobs = int(args["--jobs"] or 1)
+    if jobs > 1 and not (args.get("--book") or args.get("--watch")):
+        process_parallel(args, identifiers, output_format, jobs)
+        return
 
-        # Handle output dir
-        # output_dir=args["--output"]
+    # Initialize the object
+    if args["--scta"]:
+        from lbp_print import network
 
-        logger.info(
-            "Results returned sucessfully.\n "
-            "The output file is located at %s" % os.path.abspath(result_file)
+        # Remote items spend most of their time waiting for the network.
+        logger.info(f"Initializing {len(identifiers)} items.")
+        transcriptions = network.resolve_all(
+            lambda exp: resolve(args, exp), identifiers, jobs=config.network_jobs
         )
+    else:
+        transcriptions = []
+        for num, exp in enumerate(identifiers, 1):
+            logger.info(f"Initializing {exp}. [{num}/{len(identifiers)}]")
+            transcriptions.append(resolve(args, exp))
+
+    if args.get("--watch"):
+        try:
+            build(args, transcriptions, output_format)
+        except Exception as e:
+            logger.error(f"The build failed.\n{type(e).__name__}: {e}")
+        watch_items(args, identifiers, transcriptions, output_format)
+        return
+
+    build(args, transcriptions, output_format)
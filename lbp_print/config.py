@@ -6,5 +6,43 @@ import logging
 import os
 
 cache_dir = os.path.join(os.path.expanduser("~"), ".lbp_cache")
+# Cache hits only record their access time in the registry when the recorded one is older
+# than this many seconds, so lookups do not rewrite the registry every time. Pruning by age
+# is as precise as this.
+cache_access_resolution = 3600
 module_dir = os.path.dirname(__file__)
 log_level = logging.INFO
+
+# Keep one Saxon JVM running for all transformations in the process (requires Java 11).
+saxon_worker = True
+
+# Default XSLT transformation engine: "saxon", "lxml" or "auto" (lxml for XSLT 1.0 scripts).
+transform_engine = "saxon"
+
+# Number of remote items resolved and downloaded at the same time.
+network_jobs = 8
+# Retries of a failed network request and the delay in seconds before the first retry, which
+# doubles with every further retry.
+network_retries = 3
+network_backoff = 0.5
+# Timeout in seconds of a single network request.
+network_timeout = 30
+# Idle keep-alive connections kept per host for reuse by later downloads.
+network_pool_size = 8
+
+# Seconds before the cached information about a remote resource is looked up again.
+metadata_ttl = 7 * 24 * 3600
+# Work from the cache only, without network access.
+offline = False
+
+# Number of PDF compilations to run at the same time. When None, this is the number of CPUs,
+# limited by the available memory at `compile_job_memory` bytes per compilation.
+compile_jobs = None
+compile_job_memory = 512 * 1024 ** 2
+
+# Dump the preamble of the TeX files to a XeLaTeX format file, which is loaded in stead of
+# processing the preamble in every pass. Requires the mylatexformat package.
+latex_format = False
+
+# Seconds between checks for changed files in watch mode.
+watch_interval = 0.5
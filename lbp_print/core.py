@@ -3,38 +3,82 @@
 """LombardPress print.
 """
 
-from hashlib import blake2b
+from contextlib import contextmanager, suppress
 from tempfile import TemporaryDirectory
-from typing import Union, List
+from typing import Dict, List, Optional, Union
 
 import json
 import logging
-import lxml
+import lxml.etree
 import os
-import queue
 import re
 import shutil
-import subprocess
+import tempfile
 import threading
-import urllib.request
+import time
+import urllib.error
 
-import lbppy
-import samewords
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
+from lbp_print import cleanup
+from lbp_print.__about__ import __version__
 from lbp_print import config
+from lbp_print import engines
+from lbp_print import hashing
+from lbp_print import latex
+from lbp_print import runner
 from lbp_print import exceptions as lbp_exceptions
 
 logger = logging.getLogger("lbp_print.core")
 
+TEI_NS = "{http://www.tei-c.org/ns/1.0}"
+
+# Name of the TeX file in the persistent build dirs.
+BUILD_NAME = "document"
+
+# Pipeline stage of cache entries by suffix.
+STAGES = {
+    "raw.tex": "transform",
+    "tex": "tex",
+    "pdf": "pdf",
+    "fmt": "format",
+    "nofmt": "format",
+}
+# Dirs of the cache dir kept by `lbp_print.network` and `lbp_print.metadata`. Their files are
+# not in the registry, and are counted and pruned by their modification time.
+FILE_DIRS = ("downloads", "metadata")
+
+
+@contextmanager
+def timed(timings: Dict[str, float], stage: str):
+    """Add the time spent in the block to the time of the stage in `timings`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
 
 class Cache:
-    """Object storing and verifying data about the cache directory and registry."""
+    """Object storing and verifying data about the cache directory and registry.
+
+    The registry (`registry.json` in the cache dir) is the index of the cache. It records the
+    size, creation and last access time, resource id and pipeline stage of every entry, and
+    all lookups go through it. It is rewritten atomically after every change, so concurrent
+    processes never see a partially written registry.
+    """
 
     def __init__(self, directory):
         self.dir = self.verify_dir(directory)
         self.registry_file = (
             os.path.join(self.dir, "registry.json") if self.dir else None
         )
+        self.entries = self.load_registry()
+        # Serializes the reloads of `entries` by the threads sharing the object.
+        self.entries_lock = threading.Lock()
 
     def verify_dir(self, directory):
         """If a cache dir is specified, check whether it exists."""
@@ -45,38 +89,381 @@ class Cache:
                     f"Specified cache directory ({candidate}) does not exist. "
                     "It will be created now."
                 )
-                os.mkdir(candidate)
+                # Another process may create it at the same time.
+                os.makedirs(candidate, exist_ok=True)
             return os.path.abspath(candidate)
         else:
             raise Exception("Cache dir is not configured.")
 
+    def load_registry(self, locked: bool = False) -> Dict[str, dict]:
+        """Read the registry. A cache dir without a valid registry, such as one created by an
+        earlier version, is indexed from its content.
+
+        :param locked: Whether the caller holds the registry lock. Otherwise it is taken to
+            rebuild the registry, so the rebuild does not overwrite the update of another
+            process.
+        :return: Dictionary of the entries by file name.
+        """
+        entries = self.read_registry()
+        if entries is not None:
+            return entries
+        if locked:
+            return self.rebuild_registry()
+        with self.lock("registry"):
+            # Another process may have rebuilt or updated it in the meantime.
+            entries = self.read_registry()
+            return self.rebuild_registry() if entries is None else entries
+
+    def read_registry(self) -> Optional[Dict[str, dict]]:
+        """:return: The entries of the registry file, or None if it is missing or corrupt."""
+        try:
+            with open(self.registry_file, encoding="utf-8") as f:
+                return json.load(f)["entries"]
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError):
+            logger.warning(
+                f"The cache registry ({self.registry_file}) is corrupt. It will be rebuilt."
+            )
+        return None
+
+    def rebuild_registry(self) -> Dict[str, dict]:
+        """Index the content of the cache dir and save it as the registry. The registry lock
+        should be held.
+
+        :return: Dictionary of the entries by file name.
+        """
+        entries = {basename: self.describe(basename) for basename in self.files()}
+        logger.debug(f"Indexed {len(entries)} files in the cache.")
+        self.save_registry(entries)
+        return entries
+
+    def files(self) -> List[str]:
+        """List the cached files, leaving out the registry, locks, unfinished files and the
+        metadata and download dirs."""
+        return [
+            basename
+            for basename in os.listdir(self.dir)
+            if basename != "registry.json"
+            and not basename.startswith(".")
+            and os.path.isfile(os.path.join(self.dir, basename))
+        ]
+
+    @contextmanager
+    def lock(self, key: str):
+        """Hold an exclusive lock on `key`, shared by all processes using the cache dir.
+
+        Locking requires `fcntl` and is skipped on platforms without it.
+        """
+        if fcntl is None:
+            yield
+            return
+        lock_dir = os.path.join(self.dir, ".locks")
+        os.makedirs(lock_dir, exist_ok=True)
+        f = self._acquire(os.path.join(lock_dir, key + ".lock"), key)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+    @staticmethod
+    def _acquire(path: str, key: str):
+        """Open and lock a lock file.
+
+        `prune` may remove a lock file while another process waits for it, so the lock is
+        taken again when the file was removed or replaced in the meantime.
+
+        :return: The locked file object.
+        """
+        while True:
+            f = open(path, mode="a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info(f"Waiting for another process working on {key}.")
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if os.path.samestat(os.fstat(f.fileno()), os.stat(path)):
+                    return f
+            except FileNotFoundError:
+                pass
+            f.close()
+
+    def publish(self, write, basename: str) -> str:
+        """Create a file in the cache dir by calling `write` with the name of a temporary file
+        and moving it into place, so other processes never see a partially written file.
+
+        :return: String of cache file.
+        """
+        filename = os.path.join(self.dir, basename)
+        tmp_name = os.path.join(
+            self.dir, f".tmp-{os.getpid()}-{threading.get_ident()}-{basename}"
+        )
+        try:
+            write(tmp_name)
+            os.replace(tmp_name, filename)
+        except BaseException:
+            # `write` may have failed before creating the file.
+            with suppress(FileNotFoundError):
+                os.remove(tmp_name)
+            raise
+        return filename
+
+    def save_registry(self, entries: Dict[str, dict] = None) -> None:
+        """Write the registry to a temporary file and move it into place."""
+        entries = self.entries if entries is None else entries
+
+        def write(tmp_name):
+            with open(tmp_name, mode="w", encoding="utf-8") as f:
+                json.dump({"version": 1, "entries": entries}, f, separators=(",", ":"))
+
+        self.publish(write, "registry.json")
+
+    def update_registry(self, changes: Dict[str, Union[dict, None]]) -> None:
+        """Apply changes to the registry on disk, which may have been updated by other
+        processes since it was loaded. An entry set to None is removed."""
+        with self.lock("registry"):
+            # The entries are only replaced once saved, as other threads using the object
+            # may reload them in the meantime.
+            entries = self.load_registry(locked=True)
+            for basename, entry in changes.items():
+                if entry is None:
+                    entries.pop(basename, None)
+                else:
+                    entries[basename] = entry
+            self.save_registry(entries)
+            self.entries = entries
+
+    def describe(self, basename: str, resource: str = None, stage: str = None) -> dict:
+        """Create the registry entry of a file in the cache dir."""
+        stat = os.stat(os.path.join(self.dir, basename))
+        if stage is None:
+            stage = STAGES.get(basename.split(".", 1)[-1])
+        return {
+            "size": stat.st_size,
+            "created": stat.st_mtime,
+            "accessed": stat.st_mtime,
+            "resource": resource,
+            "stage": stage,
+        }
+
     def contains(self, basename):
         """Check whether the hash of the current transcription object is present in the cache
-        directory.
+        registry. A hit updates the access time of the entry when the recorded one is older
+        than `config.cache_access_resolution`, so most hits do not write the registry.
 
         :return: Bool
         """
-        if self.dir:
-            location = os.path.join(self.dir, basename)
-            if os.path.isfile(location):
-                return True
-            else:
-                return False
+        entry = self.entries.get(basename)
+        if entry is None:
+            # It may have been added by another process.
+            with self.entries_lock:
+                self.entries = self.load_registry()
+                entry = self.entries.get(basename)
+        if entry is not None:
+            now = time.time()
+            if now - entry["accessed"] >= config.cache_access_resolution:
+                self.update_registry({basename: dict(entry, accessed=now)})
+            return True
+        return False
+
+    def read(self, digest: str, suffix: str) -> str:
+        """Read the content of a cache entry.
+
+        :return: The content or None if the entry is not in the cache."""
+        if self.contains(basename=digest + suffix):
+            with open(os.path.join(self.dir, digest + suffix), encoding="utf-8") as f:
+                return f.read()
+
+    def write(
+        self, content: str, digest: str, suffix: str, resource: str = None
+    ) -> str:
+        """Write content directly to the cache dir.
+
+        :return: String of cache file."""
+        logger.debug(f"Writing {digest + suffix} to cache dir ({self.dir})")
+
+        def write(tmp_name):
+            with open(tmp_name, mode="w", encoding="utf-8") as f:
+                f.write(content)
+
+        filename = self.publish(write, digest + suffix)
+        self.register(digest + suffix, resource)
+        return filename
+
+    def store(self, filename, digest: str, suffix: str, resource: str = None) -> str:
+        """Store result in cache dir.
+
+        :return: String of cache file."""
+        logger.debug(f"Storing {filename} in cache dir ({self.dir})")
+        stored = self.publish(
+            lambda tmp_name: shutil.copyfile(filename, tmp_name), digest + suffix
+        )
+        self.register(digest + suffix, resource)
+        return stored
 
-    def store(self, filename, digest: str, suffix: str) -> str:
-        """Store result in cache dir and remove earlier version of resource id.
+    def register(self, basename: str, resource: str = None) -> None:
+        entry = self.describe(basename, resource=resource)
+        entry["created"] = entry["accessed"] = time.time()
+        self.update_registry({basename: entry})
 
-        :return: String of cache file or None if no cache dir."""
-        logger.debug(f"Storing {filename} in cache dir ({self.dir})")
-        return shutil.copyfile(filename, os.path.join(self.dir, digest + suffix))
+    def remove(self, basename: str) -> None:
+        """Remove a file from the cache and the registry."""
+        with suppress(FileNotFoundError):
+            os.remove(os.path.join(self.dir, basename))
+        self.update_registry({basename: None})
+
+    def dir_entries(self) -> Dict[str, dict]:
+        """Describe the files of the downloads and metadata dirs like registry entries.
+
+        :return: Dictionary of the entries by path relative to the cache dir.
+        """
+        entries = {}
+        for name in FILE_DIRS:
+            directory = os.path.join(self.dir, name)
+            if not os.path.isdir(directory):
+                continue
+            for basename in os.listdir(directory):
+                if basename.endswith(".tmp"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(directory, basename))
+                except FileNotFoundError:
+                    continue
+                entries[os.path.join(name, basename)] = {
+                    "size": stat.st_size,
+                    "accessed": stat.st_mtime,
+                    "stage": name,
+                }
+        return entries
+
+    def build_dir(self, key: str) -> str:
+        """Return the persistent build dir of the LaTeX compilation with `key`."""
+        directory = os.path.join(self.dir, "build", key)
+        os.makedirs(directory, exist_ok=True)
+        # Mark it as used for `prune`.
+        os.utime(directory)
+        return directory
+
+    def stats(self) -> dict:
+        """Summarize the content of the cache.
+
+        :return: Dictionary with the number of entries and their total size, overall and by
+            stage. Downloads and metadata count as stages of their own.
+        """
+        entries = list(self.entries.values()) + list(self.dir_entries().values())
+        stats = {"entries": len(entries), "size": 0, "stages": {}}
+        for entry in entries:
+            stage = stats["stages"].setdefault(
+                entry["stage"] or "other", {"entries": 0, "size": 0}
+            )
+            stage["entries"] += 1
+            stage["size"] += entry["size"]
+            stats["size"] += entry["size"]
+        return stats
+
+    def prune(self, max_size: int = None, max_age: float = None) -> List[str]:
+        """Remove entries not accessed within `max_age` seconds, then remove the least
+        recently accessed entries until the total size is at most `max_size` bytes. The
+        downloads and the metadata are pruned with the entries, by their modification time.
+        Lock files not held by a process are removed as well.
+
+        :return: List of the removed file names.
+        """
+        self.entries = self.load_registry()
+        entries = dict(self.entries, **self.dir_entries())
+        by_access = sorted(entries, key=lambda name: entries[name]["accessed"])
+        removed = []
+        if max_age is not None:
+            limit = time.time() - max_age
+            removed = [name for name in by_access if entries[name]["accessed"] < limit]
+        if max_size is not None:
+            size = sum(entries[name]["size"] for name in by_access)
+            size -= sum(entries[name]["size"] for name in removed)
+            for name in by_access:
+                if size <= max_size:
+                    break
+                if name not in removed:
+                    removed.append(name)
+                    size -= entries[name]["size"]
+
+        for name in removed:
+            try:
+                os.remove(os.path.join(self.dir, name))
+            except FileNotFoundError:
+                pass
+        self.update_registry({name: None for name in removed if name in self.entries})
+
+        # Build dirs are not in the registry. They are removed by age only.
+        build_root = os.path.join(self.dir, "build")
+        if max_age is not None and os.path.isdir(build_root):
+            for key in os.listdir(build_root):
+                directory = os.path.join(build_root, key)
+                if os.path.getmtime(directory) < limit:
+                    with self.lock("build-" + key):
+                        shutil.rmtree(directory, ignore_errors=True)
+                    removed.append(os.path.join("build", key))
+
+        self.remove_locks()
+        return removed
+
+    def remove_locks(self) -> None:
+        """Remove the lock files left behind by `lock` that are not held by a process."""
+        lock_dir = os.path.join(self.dir, ".locks")
+        if fcntl is None or not os.path.isdir(lock_dir):
+            return
+        for name in os.listdir(lock_dir):
+            path = os.path.join(lock_dir, name)
+            with open(path, mode="a") as f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                with suppress(FileNotFoundError):
+                    os.remove(path)
+
+    def verify(self) -> Dict[str, List[str]]:
+        """Compare the registry with the content of the cache dir and repair it. Entries of
+        missing files are removed, untracked files are added and sizes are corrected.
+
+        :return: Dictionary of the file names that were missing, untracked or changed.
+        """
+        self.entries = self.load_registry()
+        files = set(self.files())
+        report = {
+            "missing": sorted(set(self.entries) - files),
+            "untracked": sorted(files - set(self.entries)),
+            "changed": sorted(
+                name
+                for name in files & set(self.entries)
+                if os.path.getsize(os.path.join(self.dir, name))
+                != self.entries[name]["size"]
+            ),
+        }
+        changes = {name: None for name in report["missing"]}
+        for name in report["untracked"]:
+            changes[name] = self.describe(name)
+        for name in report["changed"]:
+            changes[name] = dict(
+                self.entries[name], size=os.path.getsize(os.path.join(self.dir, name))
+            )
+        self.update_registry(changes)
+        return report
 
 
 class Resource:
     def __init__(self, input):
         self.input = input
+        # Identifies the source across changes of its content.
+        self.source_id = input
         self.schema_info = {}
         self.file = None
+        self.content_digest = None
         self.tmp_dir = TemporaryDirectory()
+        self._tree = None
+        # Seconds spent in the stages of the initialization.
+        self.timings: Dict[str, float] = {}
 
     def select_xlst_script(self, schema_info={}, external=None) -> str:
         """Determine which xslt should be used.
@@ -126,25 +513,23 @@ class Resource:
             )
 
     def get_schema_info(self):
-        """Return the validation schema version."""
+        """Return the validation schema version.
+
+        The document is parsed incrementally and parsing stops at the end of the teiHeader, so
+        the body of the text is not read.
+        """
         try:
-            parsed_etree = lxml.etree.parse(self.file)
+            schemaref_number = self._find_schema_ref()
         except lxml.etree.XMLSyntaxError:
             logger.error("The provided XML file is invalid.")
             raise
 
         try:
-            schemaref_number = parsed_etree.xpath(
-                "/tei:TEI/tei:teiHeader[1]/tei:encodingDesc[1]/tei:schemaRef[1]/@n",
-                namespaces={"tei": "http://www.tei-c.org/ns/1.0"},
-            )[
-                0
-            ]  # The returned result is a list. Grab first element.
             return {
                 "version": schemaref_number.split("-")[2],
                 "type": schemaref_number.split("-")[1],
             }
-        except IndexError as e:
+        except (AttributeError, IndexError) as e:
             logger.warn(
                 "The document does not seem to contain a value in "
                 "TEI/teiHeader/encodingDesc/schemaRef[@n]. See "
@@ -162,23 +547,61 @@ class Resource:
             )
             raise
 
+    def _find_schema_ref(self):
+        """Return the value of `/TEI/teiHeader[1]/encodingDesc[1]/schemaRef[1]/@n` or None."""
+        path = [TEI_NS + "TEI", TEI_NS + "teiHeader", TEI_NS + "encodingDesc"]
+        context = lxml.etree.iterparse(
+            self.file,
+            events=("end",),
+            tag=(TEI_NS + "teiHeader", TEI_NS + "schemaRef"),
+            remove_comments=True,
+        )
+        for _, element in context:
+            if element.tag == TEI_NS + "teiHeader":
+                return None
+            ancestors = [a.tag for a in reversed(list(element.iterancestors()))]
+            if ancestors == path:
+                encoding_desc = element.getparent()
+                header = encoding_desc.getparent()
+                if (
+                    header.find(path[-1]) is encoding_desc
+                    and encoding_desc.find(element.tag) is element
+                ):
+                    return element.get("n")
+                return None
+        return None
+
+    @property
+    def tree(self):
+        """The parsed document.
+
+        It is parsed on first access and shared by the in-process stages that need it.
+        """
+        if self._tree is None:
+            try:
+                self._tree = lxml.etree.parse(self.file)
+            except lxml.etree.XMLSyntaxError:
+                logger.error("The provided XML file is invalid.")
+                raise
+        return self._tree
+
     def create_hash(self):
-        try:
-            with open(self.xslt, "br") as f:
-                xslt_digest = blake2b(f.read(), digest_size=16).hexdigest()
-            with open(self.file, "br") as f:
-                return blake2b(
-                    f.read(), digest_size=16, key=xslt_digest.encode("utf-8")
-                ).hexdigest()
-        except:
-            raise
+        """Return the digest of the transcription combined with the digest of the xslt script.
+
+        The digest of a downloaded transcription is computed during the download.
+        """
+        with timed(self.timings, "hash"):
+            content_digest = self.content_digest or hashing.file_digest(self.file)
+            return hashing.text_digest(content_digest, hashing.file_digest(self.xslt))
 
 
 class UrlResource(Resource):
     """Object for handling resources with a URL address."""
 
-    def __init__(self, url, custom_xslt=None):
+    def __init__(self, url, custom_xslt=None, cache_dir=None, offline=None):
         super().__init__(url)
+        self.cache_dir = cache_dir
+        self.offline = offline
         self.file = self._download_to_file(url)
         self.xslt = self.select_xlst_script(
             schema_info=self.get_schema_info(), external=custom_xslt
@@ -191,44 +614,50 @@ class UrlResource(Resource):
     def _download_to_file(self, url) -> str:
         """Download the remote object and store in a temporary file.
         """
-        tmp_file = open(os.path.join(self.tmp_dir.name, "download"), mode="w")
-
         logger.info("Downloading remote resource...")
-        with urllib.request.urlopen(url) as response:
-            transcription_content = response.read().decode("utf-8")
-            with open(tmp_file.name, mode="w", encoding="utf-8") as f:
-                f.write(transcription_content)
+        from lbp_print import network
+
+        filename = os.path.join(self.tmp_dir.name, "download")
+        self.content_digest = network.download(
+            url, filename, cache_dir=self.cache_dir, offline=self.offline
+        )
         logger.info("Download of remote resource finished.")
-        return f.name
+        return filename
 
 
 class LocalResource(Resource):
-    """Object for handling local files."""
+    """Object for handling local files.
+
+    The file is copied to the temporary dir of the resource and hashed in the same pass, and
+    all stages read the copy. A file edited in the meantime, e.g. while watching it, is not
+    converted and cached under the digest of its previous content.
+    """
 
     def __init__(self, filename, custom_xslt=None):
         super().__init__(filename)
-        self.file = filename
+        source = os.path.expanduser(filename)
+        if not os.path.isfile(source):
+            raise IOError(f"The supplied argument ({source}) is not a file.")
+        self.source_id = os.path.abspath(source)
+        self.file = self.snapshot(source)
         self.xslt = self.select_xlst_script(
             schema_info=self.get_schema_info(), external=custom_xslt
         )
         self.digest = self.create_hash()
         self.id = self.digest
-        self.file = self.copy_to_temp_dir(filename)
         logger.debug(f"Local resource initialized. {filename}")
         logger.debug("Object dict: {}".format(self.__dict__))
 
-    def copy_to_temp_dir(self, filename):
-        """Copy the input file to a temporary file object that we can delete later.
+    def snapshot(self, source: str) -> str:
+        """Copy the file to the temporary dir, computing the digest of the copied content.
 
-        :return: File object.
+        :return: Name of the copy.
         """
-        source = os.path.expanduser(filename)
-        destination = os.path.join(self.tmp_dir.name, self.digest + ".tex")
-        if os.path.isfile(source):
-            shutil.copyfile(source, destination)
-            return destination
-        else:
-            raise IOError(f"The supplied argument ({source}) is not a file.")
+        filename = os.path.join(self.tmp_dir.name, os.path.basename(source))
+        with timed(self.timings, "hash"):
+            with open(source, mode="rb") as src, open(filename, mode="wb") as dst:
+                self.content_digest = hashing.copy_digest(src, dst)
+        return filename
 
 
 class RemoteResource(Resource):
@@ -236,23 +665,58 @@ class RemoteResource(Resource):
 
     Keyword arguments:
     input -- SCTA resource id of the text to be processed.
+
+    lbppy and the network modules are imported by the methods using them, so local runs do
+    not load the RDF libraries.
     """
 
-    def __init__(self, input_id, custom_xslt=None):
+    def __init__(self, input_id, custom_xslt=None, cache_dir=None, offline=None):
+        from lbp_print import metadata
+
         super().__init__(input_id)
-        transcription = self._define_transcription_object(
-            self._find_remote_resource(input_id)
+        self.cache_dir = cache_dir
+        self.offline = offline
+        info = metadata.lookup(
+            f"scta:{input_id}",
+            lambda: self._resolve(input_id),
+            cache_dir=cache_dir,
+            offline=offline,
         )
-        self.file = self._download_to_file(transcription)
+        self.file = self._download_to_file(info["url"])
         self.xslt = self.select_xlst_script(
-            schema_info=self._get_schema_info(transcription), external=custom_xslt
+            schema_info=info["schema_info"], external=custom_xslt
         )
         self.digest = self.create_hash()
         self.id = self.digest
         logger.debug("Remote resource initialized.")
         logger.debug("Object dict: {}".format(self.__dict__))
 
+    def _resolve(self, input_id) -> dict:
+        """Look up the file url and schema information of the canonical transcription.
+
+        :return: Dictionary with the `url` and `schema_info` of the transcription.
+        """
+        from lbp_print import network
+
+        resource = self._find_remote_resource(input_id)
+        transcription = network.retry(
+            lambda: self._define_transcription_object(resource),
+            f"Looking up the transcription of {input_id}",
+        )
+        return {
+            "url": network.retry(
+                lambda: self._get_file_url(transcription),
+                f"Looking up the file of {input_id}",
+            ),
+            "schema_info": network.retry(
+                lambda: self._get_schema_info(transcription),
+                f"Looking up the schema of {input_id}",
+            ),
+        }
+
     def _is_direct_transcription(self, transcription_obj):
+        import lbppy
+
         return isinstance(transcription_obj, lbppy.Transcription)
 
     def _get_schema_info(self, transcription_object):
@@ -272,6 +736,8 @@ class RemoteResource(Resource):
             }
 
     def _find_remote_resource(self, resource_input):
+        import lbppy
+        from lbp_print import network
 
         url_match = re.match(r"(http://)?(scta.info/resource)?", resource_input)
         url_string = ""
@@ -283,7 +749,9 @@ class RemoteResource(Resource):
 
         url_string += resource_input
         try:
-            return lbppy.Resource.find(url_string)
+            return network.retry(
+                lambda: lbppy.Resource.find(url_string), f"Looking up {url_string}"
+            )
         except AttributeError:
             logger.error(
                 f'A resource with the provided ID ("{url_string}") could not be located. '
@@ -299,6 +767,8 @@ class RemoteResource(Resource):
         Return a canonical transcription of either Manifestation (critical) or Expression (
         diplomatic) objects.
         """
+        import lbppy
+
         if isinstance(resource, lbppy.Expression):
             return (
                 resource.canonical_manifestation().resource().canonical_transcription()
@@ -308,25 +778,27 @@ class RemoteResource(Resource):
         elif isinstance(resource, lbppy.Transcription):
             return resource
 
-    def _download_to_file(self, transcription_obj):
+    def _get_file_url(self, transcription_obj) -> str:
+        """Return the url of the XML file of the transcription."""
+        if self._is_direct_transcription(transcription_obj):
+            return transcription_obj.file().file().geturl()
+        else:
+            return transcription_obj.resource().file().file().geturl()
+
+    def _download_to_file(self, url):
         """Download the remote object and store in a temporary file.
 
         :return: File object
         """
-        tmp_file = open(os.path.join(self.tmp_dir.name, "tmp"), mode="w")
-
         logger.info("Downloading remote resource...")
-        if self._is_direct_transcription(transcription_obj):
-            url_object = transcription_obj.file().file().geturl()
-        else:
-            url_object = transcription_obj.resource().file().file().geturl()
+        from lbp_print import network
 
-        with urllib.request.urlopen(url_object) as response:
-            transcription_content = response.read().decode("utf-8")
-            with open(tmp_file.name, mode="w", encoding="utf-8") as f:
-                f.write(transcription_content)
+        filename = os.path.join(self.tmp_dir.name, "tmp")
+        self.content_digest = network.download(
+            url, filename, cache_dir=self.cache_dir, offline=self.offline
+        )
         logger.info("Download of remote resource finished.")
-        return f.name
+        return filename
 
 
 class SaxonRecord:
@@ -368,7 +840,236 @@ class SaxonLog:
         return 0
 
 
-class Tex:
+class Document:
+    """Object handling the output of a TeX document: saving it and compiling it to PDF.
+
+    `Tex` converts an item to a document, and `lbp_print.book.Book` combines items into one.
+    """
+
+    def __init__(
+        self,
+        resource,
+        name: str,
+        tmp_dir: TemporaryDirectory,
+        enable_caching: bool = True,
+        cache_dir: str = None,
+        output_dir: str = None,
+        latex_format: bool = None,
+        cache: Cache = None,
+    ) -> None:
+        """
+        :param resource: Object with the `id` of the document and the `source_id` naming
+            its build dir.
+        :param name: Short name of the document in the log of batch compilations.
+        :param tmp_dir: Directory of the compilations without a cache.
+        :param cache_dir: Defaults to `config.cache_dir`.
+        :param output_dir: Directory of the results when caching is disabled. Defaults to the
+            current working directory.
+        :param latex_format: Defaults to `config.latex_format`.
+        :param cache: Open cache to use in stead of opening the cache dir, such as the one
+            kept by a long-running process.
+        """
+        self.resource = resource
+        self.id = resource.id
+        self.name = name
+        self.tmp_dir = tmp_dir
+        if cache is None and enable_caching:
+            cache = Cache(cache_dir or config.cache_dir)
+        self.cache = cache
+        self.output_dir = output_dir or os.path.curdir
+        self.latex_format = (
+            config.latex_format if latex_format is None else latex_format
+        )
+        # Seconds spent in each stage, and whether the result of a stage came from the cache.
+        self.timings: Dict[str, float] = {}
+        self.cache_hits: Dict[str, bool] = {}
+
+    def save(self, buffer: str, digest: str, suffix: str) -> str:
+        """Write the buffer to the cache or, when caching is disabled, to the output dir,
+        which defaults to the current working directory.
+
+        :return: Name of the written file.
+        """
+        if self.cache:
+            logger.debug("Storing file in cache.")
+            return self.cache.write(
+                buffer, digest=digest, suffix=suffix, resource=self.id
+            )
+        else:
+            logger.debug(f"Storing file in output dir ({self.output_dir}).")
+            filename = os.path.join(self.output_dir, digest + suffix)
+            with open(filename, mode="w", encoding="utf-8") as f:
+                f.write(buffer)
+            return filename
+
+    def compile(self, input_file):
+        """Convert a tex file to pdf with XeLaTeX.
+
+        This requires `latexmk` and `xelatex`. With caching, a process compiling the same file
+        as another process waits for it and uses its result.
+
+        :return: Pdf file object.
+        """
+        if not self.cache:
+            output_dir = tempfile.mkdtemp(dir=self.tmp_dir.name, prefix="latex-")
+            return self.latexmk(input_file, output_dir)
+
+        with self.cache.lock(self.pdf_digest):
+            self.cache_hits["pdf"] = self.cache.contains(self.pdf_digest + ".pdf")
+            if self.cache_hits["pdf"]:
+                logger.debug("Using cached pdf.")
+                return os.path.join(self.cache.dir, self.pdf_digest + ".pdf")
+
+            # The build dir of the source is kept between runs, so latexmk can reuse the
+            # auxiliary files of the last compilation and skip the passes it does not need.
+            # The TeX file gets the same name in every run for the same reason.
+            build_key = hashing.text_digest(self.resource.source_id)
+            fmt = self.preamble_format(input_file) if self.latex_format else None
+            with self.cache.lock("build-" + build_key):
+                build_dir = self.cache.build_dir(build_key)
+                build_file = os.path.join(build_dir, BUILD_NAME + ".tex")
+                shutil.copyfile(input_file, build_file)
+                if fmt:
+                    build_fmt = os.path.join(build_dir, BUILD_NAME + ".fmt")
+                    shutil.copyfile(fmt, build_fmt)
+                    try:
+                        pdf = self.latexmk(build_file, build_dir, fmt=True)
+                    except lbp_exceptions.LatexFormatError:
+                        logger.warning(
+                            f"[{self.name}] XeLaTeX could not load the preamble format. "
+                            "Compiling without it."
+                        )
+                        os.remove(build_fmt)
+                        pdf = self.latexmk(build_file, build_dir)
+                        # The format is only at fault when the document compiles without
+                        # it. It is dumped again by the next compilation.
+                        self.cache.remove(os.path.basename(fmt))
+                else:
+                    pdf = self.latexmk(build_file, build_dir)
+                return self.cache.store(
+                    pdf, digest=self.pdf_digest, suffix=".pdf", resource=self.id
+                )
+
+    def preamble_format(self, input_file):
+        """Return the XeLaTeX format of the preamble of the tex file, from the cache or
+        dumped with `dump_format`.
+
+        Documents produced by the same xslt script mostly share their preamble, so the
+        format is cached under the digest of the preamble and reused by all of them. The
+        digest includes the version of XeLaTeX, which cannot load the formats of others.
+        A failed dump is recorded under the digest too, as the preambles XeLaTeX cannot
+        dump, such as those loading fonts with fontspec, would otherwise be dumped again by
+        every compilation. Pruning the record allows another attempt.
+
+        :return: Name of the format file or None if it could not be created.
+        """
+        with open(input_file, encoding="utf-8") as f:
+            preamble, begin, _ = f.read().partition("\\begin{document}")
+        if not begin:
+            return None
+
+        digest = hashing.text_digest(
+            preamble, "xelatex mylatexformat", latex.xelatex_version()
+        )
+        with self.cache.lock(digest):
+            if self.cache.contains(digest + ".fmt"):
+                logger.debug("Using cached preamble format.")
+                return os.path.join(self.cache.dir, digest + ".fmt")
+            if self.cache.contains(digest + ".nofmt"):
+                logger.debug("The preamble format could not be dumped before.")
+                return None
+            fmt = self.dump_format(preamble)
+            if fmt is None:
+                self.cache.write("", digest=digest, suffix=".nofmt", resource=self.id)
+                return None
+            return self.cache.store(fmt, digest=digest, suffix=".fmt", resource=self.id)
+
+    def dump_format(self, preamble: str):
+        """Dump a XeLaTeX format of the preamble with the mylatexformat package.
+
+        :return: Name of the format file or None if the dump failed.
+        """
+        build_dir = tempfile.mkdtemp(dir=self.tmp_dir.name, prefix="fmt-")
+        with open(os.path.join(build_dir, "preamble.tex"), "w", encoding="utf-8") as f:
+            f.write(preamble + "\\begin{document}\n\\end{document}\n")
+
+        logger.info(f"Dumping the preamble format of {self.id}.")
+        try:
+            returncode, _, _ = runner.run(
+                [
+                    "xelatex",
+                    "-ini",
+                    "-interaction=nonstopmode",
+                    "-jobname=preamble",
+                    "&xelatex",
+                    "mylatexformat.ltx",
+                    "preamble.tex",
+                ],
+                cwd=build_dir,
+                capture=False,
+            )
+        except OSError as e:
+            logger.warning(f"The preamble format could not be dumped: {e}")
+            return None
+        fmt = os.path.join(build_dir, "preamble.fmt")
+        if returncode != 0 or not os.path.isfile(fmt):
+            logger.warning(
+                "The preamble format could not be dumped. Compiling without it. "
+                f"See {os.path.join(build_dir, 'preamble.log')} for details."
+            )
+            return None
+        return fmt
+
+    def latexmk(self, input_file, output_dir, fmt: bool = False):
+        """Run latexmk on the tex file with the output in `output_dir`.
+
+        The complete output goes to a log file in `output_dir`. Only warnings, errors and a
+        summary are logged, prefixed with the name of the item, so the output of compilations
+        running at the same time can be told apart.
+
+        With `fmt`, XeLaTeX loads the preamble from the format file in `output_dir`, which has
+        the name of the tex file, in stead of processing it.
+
+        :raises LatexFormatError: When XeLaTeX cannot load the format.
+        :return: Name of the pdf file.
+        """
+        name = os.path.splitext(os.path.basename(input_file))[0]
+        log_file = os.path.join(output_dir, name + ".latexmk.log")
+        output = latex.LatexOutput(self.name)
+        args = ["latexmk", "--xelatex"]
+        if fmt:
+            args.append(f"--xelatex=xelatex -fmt={name} %O %S")
+        args += [f"--output-directory={output_dir}", "--halt-on-error", input_file]
+
+        logger.info(f"Start compilation of {self.id}")
+        start = time.time()
+        # XeLaTeX looks for the format in the working dir.
+        returncode, _, _ = runner.run(
+            args,
+            cwd=output_dir if fmt else None,
+            log_file=log_file,
+            on_line=output.line,
+            capture=False,
+        )
+
+        if returncode == 0:
+            logger.info(
+                f"[{self.name}] Compiled in {time.time() - start:.1f}s. {output.summary()}"
+            )
+            return os.path.join(output_dir, name + ".pdf")
+        elif fmt and output.format_error:
+            raise lbp_exceptions.LatexFormatError(
+                f"The format could not be loaded. See {log_file} for details."
+            )
+        else:
+            logger.error(
+                f"[{self.name}] The compilation failed. {output.summary()} "
+                f"See {log_file} for the complete output."
+            )
+            raise Exception("Latex compilation failed.")
+
+
+class Tex(Document):
     """Object handling the creation and processing of the TeX representation of the item."""
 
     def __init__(
@@ -378,250 +1079,180 @@ class Tex:
         clean_whitespace: bool = True,
         enable_caching: bool = True,
         annotate_samewords: bool = True,
+        engine: str = None,
+        cache_dir: str = None,
+        output_dir: str = None,
+        latex_format: bool = None,
+        cache: Cache = None,
     ) -> None:
-        self.id = transcription.id
+        """
+        :param cache_dir: Defaults to `config.cache_dir`.
+        :param output_dir: Directory of the results when caching is disabled. Defaults to the
+            current working directory.
+        :param latex_format: Defaults to `config.latex_format`.
+        :param cache: Open cache to use in stead of opening the cache dir, such as the one
+            kept by a long-running process.
+        """
+        super().__init__(
+            transcription,
+            os.path.splitext(os.path.basename(str(transcription.input)))[0],
+            transcription.tmp_dir,
+            enable_caching=enable_caching,
+            cache_dir=cache_dir,
+            output_dir=output_dir,
+            latex_format=latex_format,
+            cache=cache,
+        )
         self.xml = transcription.file
         self.xslt = transcription.xslt
         self.digest = transcription.digest
-        self.tmp_dir = transcription.tmp_dir
-        self.cache = Cache(config.cache_dir) if enable_caching else None
         self.xslt_parameters = xslt_parameters
         self.clean_whitespace = clean_whitespace
         self.annotate_samewords = annotate_samewords
+        self.engine = engines.get_engine(engine)
+
+        # Each stage of the pipeline is cached under a key made from the key of the previous
+        # stage, its own settings and the version of the tool running it. Changing a setting
+        # of a later stage therefore only reruns that stage and the ones following it.
+        selected = self.engine.select(self.xslt)
+        self.transform_digest = hashing.text_digest(
+            self.digest, selected.name, selected.version(), xslt_parameters or ""
+        )
+        samewords_version = ""
+        if annotate_samewords:
+            import samewords
+
+            samewords_version = f"samewords {samewords.__version__}"
+        self.tex_digest = hashing.text_digest(
+            self.transform_digest,
+            f"lbp_print {__version__}" if clean_whitespace else "",
+            samewords_version,
+        )
+        self.pdf_digest = hashing.text_digest(self.tex_digest, "latexmk --xelatex")
 
     def process(self, output_format):
         """Convert an XML file to TeX and compile it to PDF with XeLaTeX if required.
 
-        Depending on the requested output format, this returns either a TeX file or a PDF file
-        object.
+        The TeX is passed in memory from the conversion through the cleanup stages and written
+        once, to the cache or the current working directory. The output of the transformation
+        is cached separately, so only the cleanup is rerun when its settings change. Depending
+        on the requested output format, this returns either a TeX file or a PDF file object.
 
         :return: File object.
         """
-        output_file = self.clean(self.xml_to_tex())
+        if self.cache:
+            with self.cache.lock(self.tex_digest):
+                self.cache_hits["tex"] = self.cache.contains(
+                    basename=self.tex_digest + ".tex"
+                )
+                if self.cache_hits["tex"]:
+                    logger.info(f"Using cached version of {self.id}.")
+                    output_file = os.path.join(self.cache.dir, self.tex_digest + ".tex")
+                else:
+                    output_file = self.save(
+                        self.clean(self.transformed()),
+                        digest=self.tex_digest,
+                        suffix=".tex",
+                    )
+        else:
+            output_file = self.save(
+                self.clean(self.transformed()), digest=self.tex_digest, suffix=".tex"
+            )
 
         if output_format == "pdf":
-            output_file = self.compile(output_file)
+            with timed(self.timings, "compile"):
+                output_file = self.compile(output_file)
 
         return os.path.join(output_file)
 
-    def xml_to_tex(self):
-        """Convert the list of encoded files to tex, using the auxiliary XSLT script.
-
-        The function creates a output dir in the current working dir and puts the tex file in that
-        directory. The function requires saxon installed.
-
-        Keyword Arguments:
-        xml_buffer -- the content of the xml file under conversion
-        xslt_script -- the content of the xslt script used for the conversion
+    def transformed(self) -> str:
+        """Return the output of the transformation, from the cache if available.
 
-        Return: File object.
+        :return: The TeX buffer before cleanup.
         """
+        if not self.cache:
+            with timed(self.timings, "transform"):
+                return self.xml_to_tex()
+
+        with self.cache.lock(self.transform_digest):
+            buffer = self.cache.read(self.transform_digest, suffix=".raw.tex")
+            self.cache_hits["transform"] = buffer is not None
+            if buffer is not None:
+                logger.info(f"Using cached transformation of {self.id}.")
+                return buffer
+
+            with timed(self.timings, "transform"):
+                buffer = self.xml_to_tex()
+            self.cache.write(
+                buffer,
+                digest=self.transform_digest,
+                suffix=".raw.tex",
+                resource=self.id,
+            )
+            return buffer
 
-        if self.cache and self.cache.contains(basename=self.digest + ".tex"):
-            logger.info(f"Using cached version of {self.id}.")
-            return os.path.join(self.cache.dir, self.digest + ".tex")
-        else:
-            logger.info(f"Start conversion of {self.id}.")
-            logger.debug(f"Using XSLT: {self.xslt}.")
-
-            if self.xslt_parameters:
-                process = subprocess.Popen(
-                    [
-                        "java",
-                        "-jar",
-                        os.path.join(config.module_dir, "vendor/saxon9he.jar"),
-                        f"-s:{self.xml}",
-                        f"-xsl:{self.xslt}",
-                        self.xslt_parameters,
-                    ],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                )
-            else:
-                process = subprocess.Popen(
-                    [
-                        "java",
-                        "-jar",
-                        os.path.join(config.module_dir, "vendor/saxon9he.jar"),
-                        f"-s:{self.xml}",
-                        f"-xsl:{self.xslt}",
-                    ],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                )
-            out, err = process.communicate()
-
-            if err:
-                logs_output = SaxonLog(err)
-                if logs_output.exit_code == 1:
-                    raise lbp_exceptions.SaxonError(
-                        "The Saxon XSLT processing ran into an error:\n"
-                        + logs_output.text
-                    )
-                else:
-                    logger.warn(
-                        "The XSLT script reported the following warning(s)\n"
-                        + logs_output.text
-                    )
-
-            tex_buffer = out.decode("utf-8")
-            logger.info("The XML was successfully converted to TeX.")
+    def xml_to_tex(self) -> str:
+        """Convert the encoded file to tex, using the auxiliary XSLT script.
 
-            tmp_filename = os.path.join(self.tmp_dir.name, self.digest + ".tex")
-            with open(tmp_filename, mode="w+", encoding="utf-8") as fh:
-                fh.write(tex_buffer)
+        The transformation is run by the configured engine (see `lbp_print.engines`). The
+        default Saxon engine requires Java and runs in a worker shared by all documents in the
+        process, unless disabled in the config.
 
-            if self.cache:
-                logger.debug("Storing file in cache.")
-                filename = self.cache.store(fh.name, digest=self.digest, suffix=".tex")
+        :return: The TeX buffer.
+        """
+        logger.info(f"Start conversion of {self.id}.")
+        engine = self.engine.select(self.xslt)
+        logger.debug(f"Using XSLT: {self.xslt} ({engine.name}).")
+
+        parameters = [self.xslt_parameters] if self.xslt_parameters else []
+        # In-process engines share the parsed document with the resource.
+        source = self.resource.tree if engine.in_process else self.xml
+        out, err = engine.transform(source, self.xslt, parameters)
+
+        if err:
+            logs_output = SaxonLog(err)
+            if logs_output.exit_code == 1:
+                raise lbp_exceptions.SaxonError(
+                    "The XSLT processing ran into an error:\n" + logs_output.text
+                )
             else:
-                logger.debug("Storing file in current working directory.")
-                filename = shutil.copyfile(
-                    fh.name, os.path.join(os.path.curdir, self.digest + ".tex")
+                logger.warn(
+                    "The XSLT script reported the following warning(s)\n"
+                    + logs_output.text
                 )
 
-            logger.debug("Cleaning up tmp dir.")
-            self.tmp_dir.cleanup()
+        logger.info("The XML was successfully converted to TeX.")
+        return out.decode("utf-8")
 
-            return filename
+    def whitespace_cleanup(self, buffer: str) -> str:
+        """Clean the TeX buffer for different whitespace problems.
 
-    def whitespace_cleanup(self, tex_file: str) -> str:
-        """Clean the content of the tex file for different whitespace problems.
+        See `lbp_print.cleanup` for the rules.
 
-        :return: File object of the tex file after cleanup.
+        :return: The TeX buffer after cleanup.
         """
-
         logger.debug("Removing whitespace...")
-        patterns = [
-            # Remove redundant space around opening bracket.
-            (r" ?{ ?", r"{"),
-            # Remove redundant space before closing bracket.
-            (r" }", r"}"),
-            # Remove redundant space before punctuation.
-            (r" ([.,?!:;]+)", r"\1"),
-            # Remove space before empty lemma app notes.
-            (r" (\\edtext{})", r"\1"),
-            # Add missing space between adjacent app. notes.
-            (r"}(\\edtext{[^}]+})", r"} \1"),
-            # Remove excessive whitespace.
-            (r" +", " "),
-            # Remove redundant space between closing brackets. and punctuation.
-            (r"} ([.,?!:;]+)", r"}\1"),
-            # Remove leading space at beginning of line.
-            (r"^ +", r""),
-            # Remove trailing whitespace at paragraph end.
-            (r" %$", "%"),
-            # Remove trailing whitespace at opening parenthesis.
-            (r"\( ", r"("),
-            # Remove trailing whitespace at closing parenthesis.
-            (r" \)", r")"),
-            # Escape _ and ^ characters.
-            (r"([_\^])", r"\\\1"),
-            # Replace anything wrapped in quotes ("...") with \enquote{...}. This is a bit
-            # dangerous as it assumes that the editor always balances his quotes,
-            # and we cannot be sure of that. The proper way to do this would be with a stack
-            # tracking opening and closing quotes and alerting user on unbalanced quotes.
-            # That would of course require a separate function. Would it reduce performance
-            # significantly?
-            (r'"([^"]+?)"', r"\\enquote{\1}"),
-        ]
-
-        with open(tex_file) as f:
-            buffer = f.read()
-
-        for pattern, replacement in patterns:
-            buffer = re.sub(pattern, replacement, buffer, flags=re.MULTILINE)
-
-        with open(tex_file, "w") as f:
-            f.write(buffer)
-
+        buffer = cleanup.whitespace_cleanup(buffer)
         logger.debug("Whitespace removed.")
-        return tex_file
+        return buffer
 
-    def clean(self, tex_file):
-        """Orchestrate cleanup of tex file.
+    def clean(self, buffer: str) -> str:
+        """Orchestrate cleanup of the TeX buffer.
 
         This is split into two subfunctions for maintainability.
 
-        :return: File object of the text file after cleanup.
+        :return: The TeX buffer after cleanup.
         """
 
         if self.clean_whitespace:
-            tex_file = self.whitespace_cleanup(tex_file)
+            with timed(self.timings, "clean"):
+                buffer = self.whitespace_cleanup(buffer)
 
         if self.annotate_samewords:
-            with open(tex_file) as f:
-                buffer = f.read()
-
-            buffer = samewords.core.process_string(buffer)
-
-            with open(tex_file, "w") as f:
-                f.write(buffer)
+            import samewords.core
 
+            with timed(self.timings, "samewords"):
+                buffer = samewords.core.process_string(buffer)
             logger.debug("Samewords added.")
 
-        return tex_file
-
-    def compile(self, input_file):
-        """Convert a tex file to pdf with XeLaTeX.
-
-        This requires `latexmk` and `xelatex`.
-
-        :return: Pdf file object.
-        """
-
-        def read_output(pipe, func):
-            for line in iter(pipe.readline, b""):
-                func(line)
-            pipe.close()
-
-        def write_output(get):
-            for line in iter(get, None):
-                logger.info(line.decode("utf-8").replace("\n", ""))
-
-        if self.cache and self.cache.contains(self.digest + ".pdf"):
-            logger.debug("Using cached pdf.")
-            return os.path.join(self.cache.dir, self.digest + ".pdf")
-
-        else:
-            logger.info(f"Start compilation of {self.id}")
-            process = subprocess.Popen(
-                f"latexmk --xelatex --output-directory={self.tmp_dir.name} "
-                f"--halt-on-error "
-                f"{re.escape(input_file)}",
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                shell=True,
-                bufsize=1,
-            )
-            q = queue.Queue()
-            out_thread = threading.Thread(
-                target=read_output, args=(process.stdout, q.put)
-            )
-            err_thread = threading.Thread(
-                target=read_output, args=(process.stderr, q.put)
-            )
-            write_thread = threading.Thread(target=write_output, args=(q.get,))
-
-            for t in (out_thread, err_thread, write_thread):
-                t.start()
-
-            process.wait()
-            q.put(None)
-
-            if process.returncode == 0:
-                # Process finished. We clean the tex dir and return the filename.
-                tmp_file = os.path.join(
-                    self.tmp_dir.name,
-                    os.path.splitext(os.path.basename(input_file))[0] + ".pdf",
-                )
-                if self.cache:
-                    return self.cache.store(tmp_file, digest=self.digest, suffix=".pdf")
-                else:
-                    return tmp_file
-
-            else:
-                logger.error(
-                    "The compilation failed. See tex output above for more info."
-                )
-                raise Exception("Latex compilation failed.")
+        return buffer
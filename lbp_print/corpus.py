@@ -0,0 +1,273 @@
+"""Synthetic LombardPress documents for benchmarks and load tests.
+
+`generate` writes critical or diplomatic TEI documents of any size. They have the header of
+the test asset `da-49-l1q1.xml`, with the witnesses and the `schemaRef/@n` of the requested
+document type, and a body of paragraphs made from the Latin words of the asset. The number
+of paragraphs, the number of apparatus entries per word, the number of witnesses and the
+depth of nested `app` elements are set by the caller, and the same settings and seed always
+give the same document.
+
+    >>> from lbp_print import corpus
+    >>> corpus.generate("large.xml", paragraphs=2000, witnesses=4, depth=2)
+"""
+
+from typing import List
+
+import copy
+import os
+import random
+import re
+
+import lxml.etree
+
+from lbp_print import config
+
+TEMPLATE = os.path.join(config.module_dir, "test", "assets", "da-49-l1q1.xml")
+TEI_NS = "{http://www.tei-c.org/ns/1.0}"
+XML_ID = "{http://www.w3.org/XML/1998/namespace}id"
+
+DOCUMENT_TYPES = ("critical", "diplomatic")
+
+# Average number of paragraphs per 30 KB with the default settings, the size of the asset.
+PARAGRAPHS_PER_UNIT = 30
+
+
+class Generator:
+    """Object building the body of a synthetic document.
+
+    :param words: Average number of words in a paragraph.
+    :param apparatus_density: Share of the words of a critical text starting an apparatus
+        entry. In diplomatic texts, which have no apparatus, it is the share of abbreviated
+        words.
+    :param witnesses: Number of witnesses. Diplomatic texts are transcriptions of the first.
+    :param depth: Number of levels of `app` elements in every apparatus entry of a critical
+        text.
+    """
+
+    def __init__(
+        self,
+        document_type: str = "critical",
+        words: int = 60,
+        apparatus_density: float = 0.1,
+        witnesses: int = 2,
+        depth: int = 1,
+        seed: int = 0,
+    ) -> None:
+        if document_type not in DOCUMENT_TYPES:
+            raise ValueError(
+                f"Unknown document type '{document_type}'. "
+                f"Choose one of: {', '.join(DOCUMENT_TYPES)}."
+            )
+        if not 0 <= apparatus_density <= 1:
+            raise ValueError("The apparatus density must be between 0 and 1.")
+        if witnesses < 1 or depth < 1 or words < 1:
+            raise ValueError(
+                "There must be at least one word, witness and level of apparatus entries."
+            )
+        self.document_type = document_type
+        self.words = words
+        self.apparatus_density = apparatus_density
+        self.sigla = sigla(witnesses)
+        self.depth = depth
+        self.random = random.Random(seed)
+        self.vocabulary = vocabulary(lxml.etree.parse(TEMPLATE))
+        # Words and lines written so far, for the line breaks of diplomatic texts.
+        self.written = 0
+        self.lines = 0
+
+    def text(self, count: int) -> str:
+        return " ".join(self.random.choice(self.vocabulary) for _ in range(count))
+
+    def paragraph(self, element) -> None:
+        """Fill a `p` element with the text of a paragraph."""
+        end = self.written + max(
+            1, round(self.random.gauss(self.words, self.words / 4))
+        )
+        while self.written < end:
+            if self.random.random() < self.apparatus_density:
+                if self.document_type == "critical":
+                    # Additions have no lemma, but count as a word.
+                    self.written += max(1, self.apparatus(element, self.depth))
+                else:
+                    self.written += self.abbreviation(element)
+            else:
+                append_text(element, self.text(1))
+                self.written += 1
+            if self.document_type == "diplomatic" and self.written // 10 > self.lines:
+                self.line_break(element)
+        append_text(element, ".")
+
+    def apparatus(self, parent, depth: int) -> int:
+        """Add an apparatus entry with `depth` levels of `app` elements.
+
+        Entries without nesting are sometimes additions of a witness, which have an empty
+        lemma.
+
+        :return: Number of words of the lemma.
+        """
+        app = lxml.etree.SubElement(parent, TEI_NS + "app")
+        if depth == 1 and self.random.random() < 0.2:
+            lxml.etree.SubElement(app, TEI_NS + "lem", n=self.text(1))
+            rdg = lxml.etree.SubElement(
+                app,
+                TEI_NS + "rdg",
+                wit="#" + self.random.choice(self.sigla),
+                type="variation-present",
+            )
+            rdg.text = self.text(1)
+            return 0
+
+        lem = lxml.etree.SubElement(app, TEI_NS + "lem")
+        count = self.random.randint(1, 3)
+        append_text(lem, self.text(count))
+        if depth > 1:
+            count += self.apparatus(lem, depth - 1)
+            append_text(lem, self.text(1))
+            count += 1
+        lemma = reading_text(lem)
+        for siglum in self.sigla:
+            kind = self.random.random()
+            rdg = lxml.etree.SubElement(app, TEI_NS + "rdg", wit="#" + siglum)
+            if kind < 0.5:
+                rdg.text = lemma
+            elif kind < 0.8:
+                rdg.text = self.text(self.random.randint(1, 3))
+            elif kind < 0.9 and " " in lemma:
+                rdg.set("type", "variation-inversion")
+                rdg.text = " ".join(reversed(lemma.split(" ")))
+            else:
+                rdg.set("type", "variation-absent")
+        return count
+
+    def abbreviation(self, parent) -> int:
+        choice = lxml.etree.SubElement(parent, TEI_NS + "choice")
+        word = self.text(1)
+        lxml.etree.SubElement(choice, TEI_NS + "abbr").text = word[0] + "."
+        lxml.etree.SubElement(choice, TEI_NS + "expan").text = word
+        return 1
+
+    def line_break(self, parent) -> None:
+        """Add a line break of the transcribed witness, with a column or page break when a
+        column is full."""
+        self.lines += 1
+        witness = "#" + self.sigla[0]
+        if self.lines % 40 == 0:
+            page = self.lines // 80 + 1
+            column = "b" if self.lines % 80 else "a"
+            if column == "a":
+                lxml.etree.SubElement(parent, TEI_NS + "pb", ed=witness, n=f"{page}-r")
+            lxml.etree.SubElement(parent, TEI_NS + "cb", ed=witness, n=column)
+        lxml.etree.SubElement(parent, TEI_NS + "lb", ed=witness)
+
+
+def generate(
+    filename: str,
+    paragraphs: int = PARAGRAPHS_PER_UNIT,
+    document_type: str = "critical",
+    words: int = 60,
+    apparatus_density: float = 0.1,
+    witnesses: int = 2,
+    depth: int = 1,
+    schema_version: str = "1.0.0",
+    seed: int = 0,
+) -> str:
+    """Write a synthetic document to a file. See `Generator` for the settings.
+
+    :param paragraphs: Number of paragraphs. With the default settings, there are about
+        `PARAGRAPHS_PER_UNIT` paragraphs per 30 KB.
+    :param schema_version: Version of the LombardPress schema in `schemaRef/@n`.
+    :return: The name of the file.
+    """
+    tree = document(
+        paragraphs,
+        Generator(document_type, words, apparatus_density, witnesses, depth, seed),
+        schema_version,
+    )
+    tree.write(filename, encoding="UTF-8", xml_declaration=True)
+    return filename
+
+
+def document(paragraphs: int, generator: Generator, schema_version: str = "1.0.0"):
+    """Return the element tree of a synthetic document."""
+    tree = lxml.etree.parse(TEMPLATE)
+    root = tree.getroot()
+    document_type = generator.document_type
+
+    # The schema of the document type is used in the header and the xml-model instructions.
+    schema = f"{'.'.join(schema_version.split('.')[:2])}/{document_type}.rng"
+    for node in root.itersiblings(preceding=True):
+        if node.tag is lxml.etree.PI:
+            node.text = node.text.replace("critical.rng", f"{document_type}.rng")
+    schema_ref = root.find(f".//{TEI_NS}schemaRef")
+    schema_ref.set("n", f"lbp-{document_type}-{schema_version}")
+    schema_ref.set(
+        "url",
+        "https://raw.githubusercontent.com/lombardpress/lombardpress-schema/master/src/"
+        + schema,
+    )
+
+    list_wit = root.find(f".//{TEI_NS}listWit")
+    template = list_wit[0]
+    for witness in list(list_wit):
+        list_wit.remove(witness)
+    for num, siglum in enumerate(generator.sigla, 1):
+        witness = copy.deepcopy(template)
+        witness.set(XML_ID, siglum)
+        witness.set("n", f"witness{num}")
+        witness.text = f"Synthetic witness {num}"
+        list_wit.append(witness)
+        if document_type == "diplomatic":
+            break
+
+    text = root.find(f"{TEI_NS}text")
+    text.set("type", document_type)
+    front = text.find(f"{TEI_NS}front")
+    if front is not None:
+        text.remove(front)
+    body = text.find(f"{TEI_NS}body")
+    for child in list(body):
+        body.remove(child)
+    div = lxml.etree.SubElement(body, TEI_NS + "div")
+    div.set(XML_ID, "synthetic")
+    lxml.etree.SubElement(div, TEI_NS + "head").text = "Synthetic text"
+    for num in range(1, paragraphs + 1):
+        paragraph = lxml.etree.SubElement(div, TEI_NS + "p")
+        paragraph.set(XML_ID, f"synthetic-p{num}")
+        generator.paragraph(paragraph)
+    return tree
+
+
+def sigla(count: int) -> List[str]:
+    """Return the sigla of the witnesses: A to Z, then A1, B1 and so on."""
+    return [
+        chr(ord("A") + num % 26) + (str(num // 26) if num >= 26 else "")
+        for num in range(count)
+    ]
+
+
+def vocabulary(tree) -> List[str]:
+    """Return the Latin words of the body of a document, in the order they appear."""
+    body = tree.find(f".//{TEI_NS}body")
+    return [
+        word.lower()
+        for word in re.findall(r"[A-Za-z]+", " ".join(body.itertext()))
+        if len(word) > 1
+    ]
+
+
+def reading_text(element) -> str:
+    """Return the normalized text of a lemma, leaving out the readings of nested entries."""
+    parts = [element.text or ""]
+    for child in element:
+        if child.tag != TEI_NS + "rdg":
+            parts.append(reading_text(child))
+        parts.append(child.tail or "")
+    return " ".join(" ".join(parts).split())
+
+
+def append_text(parent, text: str) -> None:
+    """Append words to the text of an element, after its last child if it has one."""
+    if len(parent):
+        parent[-1].tail = (parent[-1].tail or "") + text + " "
+    else:
+        parent.text = (parent.text or "") + text + " "
@@ -0,0 +1,196 @@
+"""XSLT transformation engines.
+
+An engine turns an XML file and an XSLT script into TeX. Every engine returns the
+transformation output together with its diagnostics, formatted like the Saxon log output so
+`core.SaxonLog` can decide whether the transformation failed.
+"""
+
+from typing import Dict, List, Tuple, Union
+
+import logging
+import os
+import threading
+
+import lxml.etree
+
+from lbp_print import config
+from lbp_print import hashing
+from lbp_print import saxon
+
+logger = logging.getLogger("lbp_print.engines")
+
+
+class TransformEngine:
+    """Base class of the transformation engines."""
+
+    name = None
+    # In-process engines accept an already parsed document in place of a file name.
+    in_process = False
+
+    def supports(self, xslt: str) -> bool:
+        """Check whether the engine is able to run the XSLT script."""
+        return True
+
+    def select(self, xslt: str) -> "TransformEngine":
+        """Return the engine that will run the XSLT script."""
+        return self
+
+    def version(self) -> str:
+        """Return the version of the XSLT processor, which is part of the cache keys."""
+        return ""
+
+    def transform(
+        self, xml: str, xslt: str, parameters: List[str] = None
+    ) -> Tuple[bytes, bytes]:
+        """Transform `xml` with `xslt`.
+
+        :return: Tuple of the transformation output and the log output.
+        """
+        raise NotImplementedError
+
+
+class SaxonEngine(TransformEngine):
+    """Run the transformation with Saxon, which supports XSLT 2.0 and later."""
+
+    name = "saxon"
+
+    def version(self) -> str:
+        return os.path.basename(saxon.saxon_jar())
+
+    def transform(
+        self, xml: str, xslt: str, parameters: List[str] = None
+    ) -> Tuple[bytes, bytes]:
+        return saxon.transform(xml, xslt, parameters)
+
+
+class LxmlEngine(TransformEngine):
+    """Run XSLT 1.0 scripts in-process with libxslt.
+
+    Compiled scripts are kept in memory, keyed by the digest of the XSLT file.
+    """
+
+    name = "lxml"
+    in_process = True
+
+    def __init__(self) -> None:
+        self.stylesheets: Dict[str, lxml.etree.XSLT] = {}
+        self.lock = threading.Lock()
+
+    def supports(self, xslt: str) -> bool:
+        return xslt_version(xslt) == "1.0"
+
+    def version(self) -> str:
+        return "libxslt " + ".".join(str(part) for part in lxml.etree.LIBXSLT_VERSION)
+
+    def compile(self, xslt: str) -> lxml.etree.XSLT:
+        digest = hashing.file_digest(xslt)
+        with self.lock:
+            if digest not in self.stylesheets:
+                logger.debug(f"Compiling {xslt} with lxml.")
+                self.stylesheets[digest] = lxml.etree.XSLT(lxml.etree.parse(xslt))
+            return self.stylesheets[digest]
+
+    def transform(
+        self,
+        xml: Union[str, lxml.etree._ElementTree],
+        xslt: str,
+        parameters: List[str] = None,
+    ) -> Tuple[bytes, bytes]:
+        try:
+            stylesheet = self.compile(xslt)
+        except (lxml.etree.XSLTParseError, lxml.etree.XMLSyntaxError) as e:
+            return b"", format_error_log(e.error_log, xslt, fatal=True)
+
+        arguments = {}
+        for parameter in parameters or []:
+            key, _, value = parameter.partition("=")
+            arguments[key] = lxml.etree.XSLT.strparam(value)
+
+        try:
+            if isinstance(xml, lxml.etree._ElementTree):
+                document = xml
+            else:
+                document = lxml.etree.parse(xml)
+            result = stylesheet(document, **arguments)
+        except (lxml.etree.XSLTApplyError, lxml.etree.XMLSyntaxError) as e:
+            return b"", format_error_log(e.error_log, document_name(xml), fatal=True)
+        return bytes(result), format_error_log(stylesheet.error_log, xslt)
+
+
+class AutoEngine(TransformEngine):
+    """Use lxml for XSLT 1.0 scripts and Saxon for everything else."""
+
+    name = "auto"
+
+    def select(self, xslt: str) -> TransformEngine:
+        lxml_engine = get_engine("lxml")
+        if lxml_engine.supports(xslt):
+            return lxml_engine
+        return get_engine("saxon")
+
+    def transform(
+        self, xml: str, xslt: str, parameters: List[str] = None
+    ) -> Tuple[bytes, bytes]:
+        return self.select(xslt).transform(xml, xslt, parameters)
+
+
+ENGINES = {engine.name: engine for engine in (SaxonEngine, LxmlEngine, AutoEngine)}
+_instances: Dict[str, TransformEngine] = {}
+_instances_lock = threading.Lock()
+
+
+def get_engine(name: str = None) -> TransformEngine:
+    """Return the engine registered under `name`, or the configured default.
+
+    Engines are shared within the process, so compiled scripts are reused between documents.
+    """
+    name = name or config.transform_engine
+    if name not in ENGINES:
+        raise ValueError(
+            f"Unknown transformation engine '{name}'. "
+            f"Choose one of: {', '.join(sorted(ENGINES))}."
+        )
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = ENGINES[name]()
+        return _instances[name]
+
+
+def xslt_version(xslt: str) -> str:
+    """Return the value of the `version` attribute on the root of the XSLT script."""
+    for _, element in lxml.etree.iterparse(xslt, events=("start",)):
+        return element.get("version")
+
+
+def document_name(xml: Union[str, lxml.etree._ElementTree]) -> str:
+    if isinstance(xml, lxml.etree._ElementTree):
+        return xml.docinfo.URL or "document"
+    return xml
+
+
+def format_error_log(error_log, filename: str, fatal: bool = False) -> bytes:
+    """Format libxml2/libxslt log entries like the Saxon log output.
+
+    When `fatal` is set, the last entry is reported as an error, otherwise all entries are
+    reported as warnings.
+    """
+    entries = list(error_log)
+    records = []
+    for num, entry in enumerate(entries, 1):
+        # xsl:message output is logged at error level, so only a failed run is an error.
+        if fatal and num == len(entries):
+            label = "Error"
+        else:
+            label = "Warning"
+        if entry.filename and not entry.filename.startswith("<"):
+            location = os.path.basename(entry.filename)
+        else:
+            location = os.path.basename(filename)
+        if entry.line:
+            header = f"{label} on line {entry.line} of {location}:"
+        else:
+            header = f"{label} in {location}:"
+        records.append(f"{header}\n  {entry.message}")
+    if fatal and not records:
+        records.append(f"Error in {os.path.basename(filename)}:\n  Processing failed.")
+    return "\n".join(records).encode("utf-8")
@@ -2,3 +2,26 @@ class SaxonError(Exception):
     """Raise when there is an unrecoverable error during Saxon XSLT processing."""
 
     pass
+
+
+class BatchError(Exception):
+    """Raise when one or more items of a batch could not be processed."""
+
+    def __init__(self, failures) -> None:
+        self.failures = failures
+        super().__init__(
+            f"{len(failures)} item(s) could not be processed: "
+            + ", ".join(str(identifier) for identifier, _ in failures)
+        )
+
+
+class OfflineError(Exception):
+    """Raise when a remote resource is needed in offline mode but is not cached."""
+
+    pass
+
+
+class LatexFormatError(Exception):
+    """Raise when XeLaTeX cannot load the precompiled format of a preamble."""
+
+    pass
@@ -0,0 +1,58 @@
+"""Content digests of the input files.
+
+Files are hashed in fixed-size chunks, so memory use does not depend on the size of the
+file. Digests are memoized for the lifetime of the process, keyed by the path, modification
+time and size of the file, so a stylesheet shared by all resources of a run is hashed once.
+"""
+
+from functools import lru_cache
+from hashlib import blake2b
+
+import os
+
+CHUNK_SIZE = 64 * 1024
+
+
+def text_digest(*parts: str) -> str:
+    """Return the blake2b digest of a sequence of strings, such as a cache key made from
+    other digests and settings."""
+    hasher = blake2b(digest_size=16)
+    for part in parts:
+        hasher.update(part.encode("utf-8") + b"\0")
+    return hasher.hexdigest()
+
+
+def stream_digest(fh, key: str = None) -> str:
+    """Return the blake2b digest of the content of a binary file object.
+
+    :param key: Optional key of the hash, such as the digest of another file.
+    """
+    hasher = blake2b(digest_size=16, key=key.encode("utf-8") if key else b"")
+    for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def copy_digest(src, dst) -> str:
+    """Copy the content of the binary file object `src` to `dst` and return its blake2b
+    digest, so a download is hashed while it is written."""
+    hasher = blake2b(digest_size=16)
+    for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+        hasher.update(chunk)
+        dst.write(chunk)
+    return hasher.hexdigest()
+
+
+@lru_cache(maxsize=1024)
+def _file_digest(path: str, mtime: int, size: int, key: str = None) -> str:
+    with open(path, "br") as fh:
+        return stream_digest(fh, key=key)
+
+
+def file_digest(path: str, key: str = None) -> str:
+    """Return the blake2b digest of the file at `path`.
+
+    The result is memoized until the modification time or size of the file changes.
+    """
+    stat = os.stat(path)
+    return _file_digest(os.path.abspath(path), stat.st_mtime_ns, stat.st_size, key)
@@ -0,0 +1,168 @@
+import java.io.ByteArrayOutputStream;
+import java.io.DataInputStream;
+import java.io.DataOutputStream;
+import java.io.EOFException;
+import java.io.File;
+import java.io.IOException;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
+import java.util.HashMap;
+import java.util.Map;
+
+import javax.xml.transform.stream.StreamSource;
+
+import net.sf.saxon.lib.StandardErrorListener;
+import net.sf.saxon.lib.StandardLogger;
+import net.sf.saxon.s9api.ItemType;
+import net.sf.saxon.s9api.Processor;
+import net.sf.saxon.s9api.QName;
+import net.sf.saxon.s9api.SaxonApiException;
+import net.sf.saxon.s9api.Serializer;
+import net.sf.saxon.s9api.XdmAtomicValue;
+import net.sf.saxon.s9api.XsltCompiler;
+import net.sf.saxon.s9api.XsltExecutable;
+import net.sf.saxon.s9api.XsltTransformer;
+
+/**
+ * Long-running Saxon process used by lbp_print.saxon.SaxonWorker.
+ *
+ * <p>Jobs are read from stdin and results written to stdout, both as length-prefixed frames
+ * (big-endian int32 length followed by UTF-8 or raw bytes). A job is a field count followed by
+ * the fields: xml file, xslt file and zero or more "key=value" parameters. A result is a status
+ * (0 ok, 1 failed), the serialized output and the diagnostics in the same format as the Saxon
+ * command line writes them to stderr. Compiled stylesheets are kept for the lifetime of the
+ * process, keyed by path, modification time and size.
+ */
+public class SaxonWorker {
+
+    static final int READY = 0x4c425053; // "LBPS"
+
+    static class CompiledStylesheet {
+        final XsltExecutable executable;
+        final byte[] diagnostics;
+
+        CompiledStylesheet(XsltExecutable executable, byte[] diagnostics) {
+            this.executable = executable;
+            this.diagnostics = diagnostics;
+        }
+    }
+
+    private final Processor processor = new Processor(false);
+    private final Map<String, CompiledStylesheet> stylesheets = new HashMap<>();
+
+    public static void main(String[] args) throws IOException {
+        DataInputStream in = new DataInputStream(System.in);
+        DataOutputStream out = new DataOutputStream(System.out);
+        // Nothing but frames may reach stdout.
+        System.setOut(System.err);
+
+        SaxonWorker worker = new SaxonWorker();
+        out.writeInt(READY);
+        out.flush();
+
+        while (true) {
+            String[] fields;
+            try {
+                fields = readJob(in);
+            } catch (EOFException e) {
+                return;
+            }
+            ByteArrayOutputStream result = new ByteArrayOutputStream();
+            ByteArrayOutputStream log = new ByteArrayOutputStream();
+            boolean ok = worker.run(fields, result, log);
+            out.writeInt(ok ? 0 : 1);
+            writeFrame(out, result.toByteArray());
+            writeFrame(out, log.toByteArray());
+            out.flush();
+        }
+    }
+
+    static String[] readJob(DataInputStream in) throws IOException {
+        int count = in.readInt();
+        String[] fields = new String[count];
+        for (int i = 0; i < count; i++) {
+            byte[] field = new byte[in.readInt()];
+            in.readFully(field);
+            fields[i] = new String(field, StandardCharsets.UTF_8);
+        }
+        return fields;
+    }
+
+    static void writeFrame(DataOutputStream out, byte[] content) throws IOException {
+        out.writeInt(content.length);
+        out.write(content);
+    }
+
+    static StandardErrorListener listener(PrintStream stream) {
+        StandardErrorListener listener = new StandardErrorListener();
+        listener.setLogger(new StandardLogger(stream));
+        return listener;
+    }
+
+    CompiledStylesheet compile(File xslt) throws SaxonApiException {
+        String key = xslt.getAbsolutePath() + ":" + xslt.lastModified() + ":" + xslt.length();
+        CompiledStylesheet compiled = stylesheets.get(key);
+        if (compiled == null) {
+            ByteArrayOutputStream diagnostics = new ByteArrayOutputStream();
+            PrintStream stream = new PrintStream(diagnostics, true);
+            XsltCompiler compiler = processor.newXsltCompiler();
+            compiler.setErrorListener(listener(stream));
+            try {
+                XsltExecutable executable = compiler.compile(new StreamSource(xslt));
+                compiled = new CompiledStylesheet(executable, diagnostics.toByteArray());
+            } catch (SaxonApiException e) {
+                stream.println("Errors were reported during stylesheet compilation");
+                throw new CompilationFailed(diagnostics.toByteArray(), e);
+            }
+            stylesheets.put(key, compiled);
+        }
+        return compiled;
+    }
+
+    boolean run(String[] fields, ByteArrayOutputStream result, ByteArrayOutputStream log) {
+        PrintStream stream = new PrintStream(log, true);
+        PrintStream stderr = System.err;
+        // xsl:message output goes to System.err, as on the command line.
+        System.setErr(stream);
+        try {
+            CompiledStylesheet compiled = compile(new File(fields[1]));
+            log.write(compiled.diagnostics, 0, compiled.diagnostics.length);
+
+            XsltTransformer transformer = compiled.executable.load();
+            transformer.setErrorListener(listener(stream));
+            for (int i = 2; i < fields.length; i++) {
+                int split = fields[i].indexOf('=');
+                if (split < 1) {
+                    stream.println("Error: invalid stylesheet parameter " + fields[i]);
+                    return false;
+                }
+                transformer.setParameter(
+                        new QName(fields[i].substring(0, split)),
+                        new XdmAtomicValue(fields[i].substring(split + 1), ItemType.UNTYPED_ATOMIC));
+            }
+            Serializer serializer = processor.newSerializer(result);
+            transformer.setSource(new StreamSource(new File(fields[0])));
+            transformer.setDestination(serializer);
+            transformer.transform();
+            return true;
+        } catch (CompilationFailed e) {
+            log.write(e.diagnostics, 0, e.diagnostics.length);
+            return false;
+        } catch (SaxonApiException | RuntimeException e) {
+            stream.println("Error: " + e.getMessage());
+            return false;
+        } finally {
+            stream.flush();
+            System.setErr(stderr);
+        }
+    }
+
+    static class CompilationFailed extends SaxonApiException {
+        final byte[] diagnostics;
+
+        CompilationFailed(byte[] diagnostics, SaxonApiException cause) {
+            super(cause);
+            this.diagnostics = diagnostics;
+        }
+    }
+}
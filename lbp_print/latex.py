@@ -0,0 +1,170 @@
+"""Scheduling of the PDF compilations of a batch.
+
+The compilation with latexmk and XeLaTeX is by far the slowest stage of the processing and
+runs in a separate process, so the compilations of a batch are run side by side. The number
+of compilations at the same time is limited by the number of CPUs and by the memory
+available for XeLaTeX processes.
+
+The output of a compilation goes to a log file. `LatexOutput` only shows its warnings and
+errors, and a summary when the compilation is done.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import logging
+import os
+import re
+
+from lbp_print import config
+from lbp_print import exceptions as lbp_exceptions
+from lbp_print import runner
+
+logger = logging.getLogger("lbp_print.latex")
+
+
+@lru_cache(maxsize=None)
+def xelatex_version() -> str:
+    """Return the first line of `xelatex --version`, or an empty string without XeLaTeX.
+
+    A format only loads in the XeLaTeX that dumped it, so the version is part of the key of
+    cached formats.
+    """
+    try:
+        _, stdout, _ = runner.run(["xelatex", "--version"])
+    except OSError:
+        return ""
+    return stdout.decode("utf-8", "replace").partition("\n")[0].strip()
+
+
+class LatexOutput:
+    """Filter of the output lines of latexmk and XeLaTeX.
+
+    Errors and warnings are logged with the name of the item, every warning once although
+    XeLaTeX repeats it in every pass. The other lines only go to the log file.
+    """
+
+    WARNING = re.compile(r"Warning[:(]")
+    PASS = re.compile(r"^Latexmk: Run number \d+ of rule '(xe|pdf)?latex'")
+    PAGES = re.compile(r"^Output written on .*\((\d+) pages?")
+    # Messages of TeX engines failing to load a format: a missing file, or one dumped by
+    # another version of the engine.
+    FORMAT_ERROR = re.compile(
+        r"I can't find the format file|Fatal format file error|"
+        r"^---! .* (was written by|doesn't match)"
+    )
+
+    def __init__(self, name: str) -> None:
+        self.prefix = f"[{name}] "
+        self.passes = 0
+        self.pages = 0
+        self.warnings = set()
+        self.errors = 0
+        self.format_error = False
+        self._error_context = False
+
+    def line(self, line: str) -> None:
+        if self.FORMAT_ERROR.search(line):
+            self.format_error = True
+            logger.warning(self.prefix + line)
+        elif line.startswith("! "):
+            self.errors += 1
+            self._error_context = True
+            logger.error(self.prefix + line)
+        elif self._error_context and re.match(r"^l\.\d+ ", line):
+            # The line of the TeX file where the error occurred.
+            self._error_context = False
+            logger.error(self.prefix + line)
+        elif self.WARNING.search(line):
+            if line not in self.warnings:
+                self.warnings.add(line)
+                logger.warning(self.prefix + line)
+        elif self.PASS.match(line):
+            self.passes += 1
+            logger.debug(self.prefix + line)
+        elif self.PAGES.match(line):
+            self.pages = int(self.PAGES.match(line).group(1))
+
+    def summary(self) -> str:
+        return (
+            f"{self.passes} XeLaTeX passes, {self.pages} pages, "
+            f"{len(self.warnings)} warnings, {self.errors} errors."
+        )
+
+
+def available_memory(meminfo: str = "/proc/meminfo") -> Optional[int]:
+    """Return the available physical memory in bytes, or None if it cannot be determined.
+
+    On Linux, this is `MemAvailable`, which includes the page cache the kernel can reclaim.
+    Elsewhere it is the free memory, which leaves the cache out.
+    """
+    try:
+        with open(meminfo) as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name == "MemAvailable":
+                    # The value is given in kB.
+                    return int(value.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_jobs() -> int:
+    """Return the number of compilations to run at the same time.
+
+    This is `config.compile_jobs` if set, otherwise the number of CPUs, limited to the
+    number of compilations of `config.compile_job_memory` bytes that fit in the available
+    memory.
+    """
+    if config.compile_jobs:
+        return config.compile_jobs
+    jobs = os.cpu_count() or 1
+    memory = available_memory()
+    if memory is not None:
+        jobs = min(jobs, memory // config.compile_job_memory)
+    return max(jobs, 1)
+
+
+def compile_all(jobs: List[Tuple["Tex", str]], max_jobs: int = None) -> List[str]:
+    """Compile the TeX files of a batch with at most `max_jobs` compilations at a time.
+
+    Every compilation runs in its own output directory and its log lines are prefixed with
+    the name of its item. A failing compilation does not stop the others. The failures are
+    collected and raised together when all compilations are done.
+
+    :param jobs: List of `Tex` objects with the name of the TeX file to compile.
+    :param max_jobs: Defaults to `default_jobs()`.
+    :return: List of the PDF files in the order of `jobs`.
+    """
+    max_jobs = min(max_jobs or default_jobs(), len(jobs)) or 1
+    results = [None] * len(jobs)
+    failures = []
+
+    logger.info(f"Compiling {len(jobs)} files with {max_jobs} jobs.")
+    with ThreadPoolExecutor(max_workers=max_jobs) as executor:
+        futures = {
+            executor.submit(tex.compile, tex_file): num
+            for num, (tex, tex_file) in enumerate(jobs)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            num = futures[future]
+            tex = jobs[num][0]
+            try:
+                results[num] = future.result()
+            except Exception as e:
+                logger.error(
+                    f"Failed to compile {tex.name}. [{done}/{len(jobs)}]\n"
+                    f"{type(e).__name__}: {e}"
+                )
+                failures.append((tex.resource.input, e))
+            else:
+                logger.info(f"Compiled {tex.name}. [{done}/{len(jobs)}]")
+
+    if failures:
+        raise lbp_exceptions.BatchError(failures)
+    return results
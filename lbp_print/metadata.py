@@ -0,0 +1,98 @@
+"""On-disk cache of the information looked up about remote resources.
+
+Resolving an SCTA id takes several queries to the SCTA database, but the answers rarely
+change. The results are stored as JSON files in the `metadata` dir of the cache dir and
+reused until they are older than `config.metadata_ttl` seconds. In offline mode
+(`config.offline`), entries are used regardless of their age and a missing entry is an
+error in stead of a lookup.
+"""
+
+from typing import Optional
+
+import json
+import logging
+import os
+import threading
+import time
+
+from lbp_print import config
+from lbp_print import hashing
+from lbp_print import exceptions as lbp_exceptions
+
+logger = logging.getLogger("lbp_print.metadata")
+
+
+class MetadataCache:
+    """Key-value store of JSON serializable lookup results."""
+
+    def __init__(self, directory: str) -> None:
+        self.dir = directory
+        os.makedirs(self.dir, exist_ok=True)
+
+    def filename(self, key: str) -> str:
+        return os.path.join(self.dir, hashing.text_digest(key) + ".json")
+
+    def get(self, key: str, ttl: float = None, offline: bool = None) -> Optional[dict]:
+        """Return the value stored under `key`, unless it is older than `ttl` seconds.
+
+        :param ttl: Maximum age. Defaults to `config.metadata_ttl`, and is ignored in offline
+            mode.
+        :param offline: Defaults to `config.offline`.
+        :return: The value or None.
+        """
+        ttl = config.metadata_ttl if ttl is None else ttl
+        offline = config.offline if offline is None else offline
+        try:
+            with open(self.filename(key), encoding="utf-8") as f:
+                entry = json.load(f)
+            # Mark it as used for `Cache.prune`.
+            os.utime(self.filename(key))
+        except (FileNotFoundError, ValueError):
+            return None
+        if not offline and time.time() - entry["stored"] > ttl:
+            logger.debug(f"The metadata of {key} has expired.")
+            return None
+        logger.debug(f"Using cached metadata of {key}.")
+        return entry["value"]
+
+    def set(self, key: str, value: dict) -> None:
+        """Store `value` under `key`, replacing the file atomically."""
+        filename = self.filename(key)
+        tmp_name = f"{filename}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(tmp_name, mode="w", encoding="utf-8") as f:
+            json.dump({"key": key, "stored": time.time(), "value": value}, f)
+        os.replace(tmp_name, filename)
+
+
+def get_cache(cache_dir: str = None) -> Optional[MetadataCache]:
+    """Return the metadata cache in the cache dir, or None without a cache dir.
+
+    :param cache_dir: Defaults to `config.cache_dir`. An empty string disables the cache.
+    """
+    cache_dir = config.cache_dir if cache_dir is None else cache_dir
+    if cache_dir:
+        return MetadataCache(os.path.join(os.path.expanduser(cache_dir), "metadata"))
+    return None
+
+
+def lookup(key: str, func, cache_dir: str = None, offline: bool = None) -> dict:
+    """Return the cached value of `key`, or call `func` and cache its result.
+
+    :param cache_dir: See `get_cache`.
+    :param offline: Defaults to `config.offline`.
+    :raises OfflineError: In offline mode, when `key` is not cached.
+    """
+    offline = config.offline if offline is None else offline
+    cache = get_cache(cache_dir)
+    value = cache.get(key, offline=offline) if cache else None
+    if value is not None:
+        return value
+    if offline:
+        raise lbp_exceptions.OfflineError(
+            f"The information about {key} is not cached and cannot be looked up in "
+            "offline mode."
+        )
+    value = func()
+    if cache:
+        cache.set(key, value)
+    return value
@@ -0,0 +1,389 @@
+"""Network access for remote resources.
+
+Looking up an SCTA resource takes several round trips to the SCTA database followed by the
+download of the transcription, so a batch of remote items mostly waits for the network.
+`resolve_all` resolves the items of a batch in a pool of threads, and `retry` repeats
+lookups and downloads that fail with a temporary error, waiting longer after each attempt.
+Downloads share a pool of keep-alive connections, so a batch of files from the same host
+does not open a new connection, and do a new TLS handshake, for every file. Like urllib,
+the pool uses the proxies of the `http_proxy`, `https_proxy` and `no_proxy` environment
+variables.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+import atexit
+import base64
+import http.client
+import io
+import logging
+import os
+import shutil
+import socket
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from lbp_print import config
+from lbp_print.__about__ import __version__
+from lbp_print import hashing
+from lbp_print import metadata
+from lbp_print import exceptions as lbp_exceptions
+
+logger = logging.getLogger("lbp_print.network")
+
+T = TypeVar("T")
+
+# Too many requests and server errors are worth another try.
+RETRY_STATUS = {429, 500, 502, 503, 504}
+REDIRECT_STATUS = {301, 302, 303, 307, 308}
+MAX_REDIRECTS = 5
+
+HEADERS = {"User-Agent": f"lbp_print/{__version__}"}
+
+
+def is_temporary(error: Exception) -> bool:
+    """Check whether a failed request may succeed when repeated."""
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code in RETRY_STATUS
+    return isinstance(
+        error,
+        (
+            urllib.error.URLError,
+            ConnectionError,
+            socket.timeout,
+            http.client.HTTPException,
+        ),
+    )
+
+
+def retry(
+    func: Callable[[], T], description: str, attempts: int = None, backoff: float = None
+) -> T:
+    """Call `func`, repeating the call when it fails with a temporary network error.
+
+    The delay before the nth retry is `backoff` * 2 ** (n - 1) seconds.
+
+    :param attempts: Maximum number of calls. Defaults to `config.network_retries` + 1.
+    :param backoff: Delay before the first retry. Defaults to `config.network_backoff`.
+    """
+    attempts = attempts or config.network_retries + 1
+    backoff = config.network_backoff if backoff is None else backoff
+    for attempt in range(1, attempts + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == attempts or not is_temporary(e):
+                raise
+            delay = backoff * 2 ** (attempt - 1)
+            logger.warning(
+                f"{description} failed ({e}). "
+                f"Retrying in {delay:.1f}s. [{attempt}/{attempts - 1}]"
+            )
+            time.sleep(delay)
+
+
+class ConnectionPool:
+    """Keep-alive HTTP and HTTPS connections shared by all downloads of the process.
+
+    A connection is returned to the pool when its response has been read completely and the
+    server keeps it open, and it is reused by the next request to the same host. At most
+    `size` idle connections are kept per host.
+    """
+
+    def __init__(self, size: int = None, timeout: float = None) -> None:
+        self.size = size or config.network_pool_size
+        self.timeout = timeout or config.network_timeout
+        self.idle: Dict[Tuple[str, str], List[http.client.HTTPConnection]] = {}
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    @staticmethod
+    def proxy(key: Tuple[str, str]) -> Optional[urllib.parse.SplitResult]:
+        """Return the proxy of the host, as configured for urllib, or None."""
+        scheme, netloc = key
+        proxy = urllib.request.getproxies().get(scheme)
+        if not proxy or urllib.request.proxy_bypass(netloc):
+            return None
+        if "://" not in proxy:
+            proxy = "http://" + proxy
+        return urllib.parse.urlsplit(proxy)
+
+    def connect(self, key: Tuple[str, str]) -> Tuple[http.client.HTTPConnection, bool]:
+        """Return an idle connection to the host, or a new one.
+
+        A connection through a proxy is a tunnel for HTTPS, and a connection to the proxy
+        for HTTP, which is then sent the absolute url of the request.
+
+        :return: Tuple of the connection and whether it has been used before.
+        """
+        with self.lock:
+            if self.idle.get(key):
+                return self.idle[key].pop(), True
+        scheme, netloc = key
+        proxy = self.proxy(key)
+        host = proxy.netloc.rpartition("@")[2] if proxy else netloc
+        if scheme == "https":
+            connection = http.client.HTTPSConnection(
+                host, timeout=self.timeout, context=ssl.create_default_context()
+            )
+            if proxy:
+                connection.set_tunnel(netloc, headers=proxy_headers(proxy))
+        else:
+            connection = http.client.HTTPConnection(host, timeout=self.timeout)
+        return connection, False
+
+    def release(self, key: Tuple[str, str], connection: http.client.HTTPConnection):
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.size:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def close(self) -> None:
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle = {}
+
+    def send(self, url: str, headers: Dict[str, str]):
+        """Send a GET request and return the response, following redirects.
+
+        A reused connection may have been closed by the server in the meantime, so a
+        request failing on one is repeated once on a new connection.
+
+        :raises HTTPError: When the status is 304 or 400 and above.
+        :return: Tuple of the response, its connection and the key of its host.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urllib.parse.urlsplit(url)
+            key = (parts.scheme, parts.netloc)
+            path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+            request_headers = dict(HEADERS, **headers)
+            if parts.scheme == "http":
+                proxy = self.proxy(key)
+                if proxy:
+                    path = urllib.parse.urlunsplit(parts[:4] + ("",))
+                    request_headers.update(proxy_headers(proxy))
+            reused = True
+            while reused:
+                connection, reused = self.connect(key)
+                try:
+                    connection.request("GET", path, headers=request_headers)
+                    response = connection.getresponse()
+                    break
+                except (ConnectionError, http.client.HTTPException):
+                    connection.close()
+                    if not reused:
+                        raise
+
+            if response.status in REDIRECT_STATUS and response.getheader("Location"):
+                response.read()
+                self.finish(key, connection, response)
+                url = urllib.parse.urljoin(url, response.getheader("Location"))
+            elif response.status == 304 or response.status >= 400:
+                body = response.read()
+                self.finish(key, connection, response)
+                raise urllib.error.HTTPError(
+                    url,
+                    response.status,
+                    response.reason,
+                    response.msg,
+                    io.BytesIO(body),
+                )
+            else:
+                return response, connection, key
+        raise urllib.error.URLError(f"Too many redirects from {url}.")
+
+    def finish(self, key, connection, response) -> None:
+        """Return the connection to the pool if the response has been read and the server
+        keeps the connection open, otherwise close it."""
+        if response.isclosed() and not response.will_close:
+            self.release(key, connection)
+        else:
+            connection.close()
+
+    @contextmanager
+    def urlopen(self, url: str, headers: Dict[str, str] = None):
+        """Open `url` on a pooled connection. The response should be read completely for
+        the connection to be reused."""
+        response, connection, key = self.send(url, headers or {})
+        try:
+            yield response
+        finally:
+            self.finish(key, connection, response)
+
+
+def proxy_headers(proxy: urllib.parse.SplitResult) -> Dict[str, str]:
+    """Return the Proxy-Authorization header of a proxy url with credentials."""
+    if proxy.username is None:
+        return {}
+    credentials = urllib.parse.unquote(proxy.username) + ":"
+    credentials += urllib.parse.unquote(proxy.password or "")
+    token = base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+    return {"Proxy-Authorization": f"Basic {token}"}
+
+
+_pool = None
+
+
+def get_pool() -> ConnectionPool:
+    """Return the connection pool of the current process.
+
+    A forked child gets its own pool in stead of sharing the sockets of its parent.
+    """
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        _pool = ConnectionPool()
+        atexit.register(_pool.close)
+    return _pool
+
+
+def link_or_copy(src: str, dst: str) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def reuse(stored: str, filename: str) -> None:
+    """Use a stored download, marking it as used for `Cache.prune`."""
+    os.utime(stored)
+    link_or_copy(stored, filename)
+
+
+def download(
+    url: str, filename: str, cache_dir: str = None, offline: bool = None
+) -> str:
+    """Download `url` to `filename`, retrying on temporary errors.
+
+    The response is written to the file in chunks and hashed on the way. With a cache dir,
+    the content is kept in its downloads dir together with the ETag and Last-Modified
+    validators of the response. The next download of the url is conditional, so the stored
+    content is reused when the server answers that it has not been modified. In offline
+    mode, the stored content is used without a request.
+
+    :param cache_dir: Defaults to `config.cache_dir`. An empty string disables the cache.
+    :param offline: Defaults to `config.offline`.
+    :return: The blake2b digest of the content.
+    """
+    cache_dir = config.cache_dir if cache_dir is None else cache_dir
+    offline = config.offline if offline is None else offline
+    cache = metadata.get_cache(cache_dir)
+    key = f"download:{url}"
+    entry = cache.get(key, ttl=float("inf"), offline=offline) if cache else None
+    if entry:
+        directory = download_dir(cache_dir)
+        stored = os.path.join(directory, entry["digest"])
+        if not os.path.isfile(stored):
+            entry = None
+
+    if offline:
+        if entry:
+            logger.debug(f"Using the stored download of {url}.")
+            reuse(stored, filename)
+            return entry["digest"]
+        raise lbp_exceptions.OfflineError(
+            f"{url} has not been downloaded before and cannot be downloaded in offline mode."
+        )
+
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+
+    def fetch():
+        try:
+            with get_pool().urlopen(url, headers=headers) as response:
+                with open(filename, mode="wb") as f:
+                    digest = hashing.copy_digest(response, f)
+                return digest, response.headers
+        except urllib.error.HTTPError as e:
+            # Only a conditional request can be answered with the stored content.
+            if e.code == 304 and headers:
+                return None, e.headers
+            raise
+
+    digest, response_headers = retry(fetch, f"Downloading {url}")
+    if digest is None:
+        logger.debug(f"{url} has not been modified since the last download.")
+        reuse(stored, filename)
+        return entry["digest"]
+
+    if cache:
+        directory = download_dir(cache_dir)
+        stored_file = os.path.join(directory, digest)
+        if not os.path.isfile(stored_file):
+            tmp_name = f"{stored_file}.{os.getpid()}-{threading.get_ident()}.tmp"
+            link_or_copy(filename, tmp_name)
+            os.replace(tmp_name, stored_file)
+        cache.set(
+            key,
+            {
+                "digest": digest,
+                "etag": response_headers.get("ETag"),
+                "last_modified": response_headers.get("Last-Modified"),
+            },
+        )
+        if entry and entry["digest"] != digest:
+            try:
+                os.remove(stored)
+            except OSError:
+                pass
+    return digest
+
+
+def download_dir(cache_dir: str = None) -> str:
+    directory = os.path.join(
+        os.path.expanduser(cache_dir or config.cache_dir), "downloads"
+    )
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def resolve_all(
+    resolve: Callable[[str], T], identifiers: List[str], jobs: int = None
+) -> List[T]:
+    """Call `resolve` on every identifier, running at most `jobs` calls at the same time.
+
+    Every identifier is resolved independently, so a failure does not stop the others. The
+    failures are collected and raised together when all identifiers are done.
+
+    :param jobs: Number of threads. Defaults to `config.network_jobs`.
+    :return: List of the results in the order of `identifiers`.
+    """
+    jobs = jobs or config.network_jobs
+    results = [None] * len(identifiers)
+    failures = []
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(resolve, identifier): num
+            for num, identifier in enumerate(identifiers)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            num = futures[future]
+            try:
+                results[num] = future.result()
+            except Exception as e:
+                logger.error(
+                    f"Failed to initialize {identifiers[num]}. "
+                    f"[{done}/{len(identifiers)}]\n{type(e).__name__}: {e}"
+                )
+                failures.append((identifiers[num], e))
+            else:
+                logger.info(
+                    f"Initialized {identifiers[num]}. [{done}/{len(identifiers)}]"
+                )
+
+    if failures:
+        raise lbp_exceptions.BatchError(failures)
+    return results
@@ -0,0 +1,98 @@
+"""Running external programs.
+
+Saxon, latexmk and XeLaTeX run as child processes. `run` reads their stdout and stderr in
+the calling thread, multiplexing both pipes with a selector, so a process needs no reader
+threads. The complete output can be written to a log file as it arrives, and complete
+lines are passed to a callback which decides what is worth showing.
+"""
+
+from typing import Callable, List, Tuple
+
+import logging
+import os
+import selectors
+import subprocess
+
+logger = logging.getLogger("lbp_print.runner")
+
+CHUNK_SIZE = 64 * 1024
+
+
+def run(
+    args: List[str],
+    cwd: str = None,
+    log_file: str = None,
+    on_line: Callable[[str], None] = None,
+    capture: bool = True,
+) -> Tuple[int, bytes, bytes]:
+    """Run a command to completion.
+
+    :param log_file: File receiving the output of both pipes as it arrives.
+    :param on_line: Called with every line of output, without the line ending.
+    :param capture: Keep the output in memory and return it.
+    :raises OSError: When the program cannot be started.
+    :return: Tuple of the exit code, stdout and stderr. The output is empty when not
+        captured.
+    """
+    logger.debug(f"Running {' '.join(args)}")
+    process = subprocess.Popen(
+        args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+    )
+    output = {process.stdout: [], process.stderr: []}
+    partial = {process.stdout: b"", process.stderr: b""}
+    log = open(log_file, mode="wb") if log_file else None
+
+    def received(pipe, chunk: bytes) -> None:
+        if capture:
+            output[pipe].append(chunk)
+        if log:
+            log.write(chunk)
+        if on_line:
+            lines = (partial[pipe] + chunk).split(b"\n")
+            partial[pipe] = lines.pop()
+            for line in lines:
+                on_line(decode(line))
+
+    try:
+        if os.name == "nt":
+            # Selectors only support sockets on Windows.
+            for pipe, chunk in zip(
+                (process.stdout, process.stderr), process.communicate()
+            ):
+                received(pipe, chunk)
+        else:
+            with selectors.DefaultSelector() as selector:
+                for pipe in output:
+                    selector.register(pipe, selectors.EVENT_READ)
+                while selector.get_map():
+                    for key, _ in selector.select():
+                        chunk = os.read(key.fd, CHUNK_SIZE)
+                        if chunk:
+                            received(key.fileobj, chunk)
+                        else:
+                            selector.unregister(key.fileobj)
+        for pipe, rest in partial.items():
+            if rest and on_line:
+                on_line(decode(rest))
+        process.wait()
+    finally:
+        for pipe in output:
+            pipe.close()
+        if log:
+            log.close()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+    return (
+        process.returncode,
+        b"".join(output[process.stdout]),
+        b"".join(output[process.stderr]),
+    )
+
+
+def decode(line: bytes) -> str:
+    return line.decode("utf-8", errors="replace").rstrip("\r")
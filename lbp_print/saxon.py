@@ -0,0 +1,179 @@
+"""Running Saxon XSLT transformations.
+
+Starting a JVM and compiling the stylesheet often takes longer than the transformation
+itself. The `SaxonWorker` keeps one JVM running for the lifetime of the Python process and
+reuses compiled stylesheets across jobs. If the worker cannot be started, `transform` falls
+back to running one Saxon process per document.
+"""
+
+from typing import List, Tuple
+
+import atexit
+import logging
+import os
+import struct
+import subprocess
+import tempfile
+import threading
+
+from lbp_print import config
+from lbp_print import runner
+
+logger = logging.getLogger("lbp_print.saxon")
+
+READY = 0x4C425053
+
+
+def saxon_jar() -> str:
+    return os.path.join(config.module_dir, "vendor/saxon9he.jar")
+
+
+def run_saxon(xml: str, xslt: str, parameters: List[str] = None) -> Tuple[bytes, bytes]:
+    """Run a single transformation in a new Saxon process.
+
+    :return: Tuple of the transformation output and the Saxon log output.
+    """
+    _, out, err = runner.run(
+        ["java", "-jar", saxon_jar(), f"-s:{xml}", f"-xsl:{xslt}"] + (parameters or [])
+    )
+    return out, err
+
+
+class SaxonWorkerError(Exception):
+    """Raise when the Saxon worker process cannot be started or has stopped."""
+
+    pass
+
+
+class SaxonWorker:
+    """A long-running JVM processing transformation jobs over its stdin and stdout.
+
+    The Java side lives in `java/SaxonWorker.java` and is started in source-file mode, which
+    requires Java 11 or later. Jobs are processed one at a time.
+    """
+
+    def __init__(self, jar: str = None) -> None:
+        self.jar = jar or saxon_jar()
+        self.source = os.path.join(config.module_dir, "java", "SaxonWorker.java")
+        self.process = None
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def start(self) -> None:
+        logger.debug("Starting Saxon worker.")
+        self.stderr = tempfile.TemporaryFile()
+        try:
+            self.process = subprocess.Popen(
+                ["java", "-cp", self.jar, self.source],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=self.stderr,
+            )
+        except OSError as e:
+            self.stderr.close()
+            raise SaxonWorkerError(f"The Saxon worker could not be started. {e}")
+        try:
+            (ready,) = struct.unpack(">i", self._read(4))
+        except SaxonWorkerError:
+            ready = None
+        if ready != READY:
+            self.stderr.seek(0)
+            message = self.stderr.read().decode("utf-8", errors="replace")
+            self.close()
+            raise SaxonWorkerError(f"The Saxon worker could not be started. {message}")
+        logger.debug("Saxon worker ready.")
+
+    def transform(
+        self, xml: str, xslt: str, parameters: List[str] = None
+    ) -> Tuple[bytes, bytes]:
+        """Send a job to the worker and wait for the result.
+
+        :return: Tuple of the transformation output and the Saxon log output.
+        """
+        with self.lock:
+            if not self.running():
+                self.start()
+            fields = [xml, xslt] + (parameters or [])
+            frame = struct.pack(">i", len(fields))
+            for field in fields:
+                encoded = field.encode("utf-8")
+                frame += struct.pack(">i", len(encoded)) + encoded
+            try:
+                self.process.stdin.write(frame)
+                self.process.stdin.flush()
+                self._read(4)  # Status. The log tells whether the job failed.
+                out = self._read_frame()
+                err = self._read_frame()
+            except (OSError, SaxonWorkerError):
+                self.close()
+                raise SaxonWorkerError("The Saxon worker stopped unexpectedly.")
+            return out, err
+
+    def running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def close(self) -> None:
+        if self.process:
+            logger.debug("Stopping Saxon worker.")
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process.stdout.close()
+            self.stderr.close()
+            self.process = None
+
+    def _read(self, size: int) -> bytes:
+        buffer = b""
+        while len(buffer) < size:
+            chunk = self.process.stdout.read(size - len(buffer))
+            if not chunk:
+                raise SaxonWorkerError("The Saxon worker closed its output.")
+            buffer += chunk
+        return buffer
+
+    def _read_frame(self) -> bytes:
+        (size,) = struct.unpack(">i", self._read(4))
+        return self._read(size)
+
+
+_worker = None
+_worker_failed = False
+# Guards the creation of the worker and the fallback, as documents are converted by several
+# threads at the same time.
+_worker_lock = threading.Lock()
+
+
+def get_worker() -> SaxonWorker:
+    """Return the worker shared by the current process.
+
+    A forked child gets its own worker instead of writing to the pipes of its parent's.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None or _worker.pid != os.getpid():
+            _worker = SaxonWorker()
+            atexit.register(_worker.close)
+        return _worker
+
+
+def transform(xml: str, xslt: str, parameters: List[str] = None) -> Tuple[bytes, bytes]:
+    """Transform `xml` with `xslt`, using the shared worker when enabled in the config.
+
+    :return: Tuple of the transformation output and the Saxon log output.
+    """
+    global _worker_failed
+    if config.saxon_worker and not _worker_failed:
+        try:
+            return get_worker().transform(xml, xslt, parameters)
+        except SaxonWorkerError as e:
+            with _worker_lock:
+                warn = not _worker_failed
+                _worker_failed = True
+            if warn:
+                logger.warning(
+                    f"{e} Falling back to one Saxon process per document. "
+                    "The worker requires Java 11 or later."
+                )
+    return run_saxon(xml, xslt, parameters)
@@ -0,0 +1,226 @@
+"""Render service.
+
+`lbp_print serve` keeps one process running for many render requests, so the transformation
+engines, the Saxon worker with its compiled stylesheets and the cache registry stay in
+memory in stead of being loaded for every document.
+
+Requests are JSON objects posted to `/render`::
+
+    {"item": "pg-b1q1", "source": "scta", "format": "pdf", "xslt_parameters": "key=value"}
+
+Only `item` is required. `source` and `format` default to the settings the service was
+started with. Local files can only be requested from a service started with `--local`.
+The response is the TeX or PDF file, with the cache key, the cache hits and the stage
+timings of the build in the `X-Lbp-Digest`, `X-Lbp-Cache-Hits` and `X-Lbp-Timings`
+headers. Failed builds are answered with status 500 and a JSON object with the error.
+`/status` returns the number of requests and jobs.
+
+The jobs run on a pool of `Options.jobs` threads. A request for the same item with the same
+settings as a job that is queued or running waits for that job in stead of starting
+another. Jobs are matched by their request rather than by the digest of their output, see
+`RenderService.submit`.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from tempfile import TemporaryDirectory
+from typing import Dict
+
+import http.server
+import json
+import logging
+import shutil
+import socketserver
+import threading
+
+from lbp_print import api
+from lbp_print import hashing
+from lbp_print.core import Cache
+
+logger = logging.getLogger("lbp_print.serve")
+
+CONTENT_TYPES = {"tex": "application/x-tex; charset=utf-8", "pdf": "application/pdf"}
+
+# Settings of the service that a request may change.
+REQUEST_KEYS = {
+    "source": "source",
+    "format": "output_format",
+    "xslt_parameters": "xslt_parameters",
+}
+
+
+class RenderService:
+    """Queue of render jobs with the settings of the service."""
+
+    def __init__(self, options: api.Options) -> None:
+        self.options = options
+        self.cache = Cache(options.cache_dir) if options.cache_dir else None
+        self.output_dir = None
+        if not options.cache_dir:
+            self._output_dir = TemporaryDirectory(prefix="lbp_print-serve-")
+            self.output_dir = options.output_dir or self._output_dir.name
+        self.executor = ThreadPoolExecutor(max_workers=max(options.jobs, 1))
+        self.jobs: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "deduplicated": 0, "done": 0, "failed": 0}
+
+    def job_options(self, request: dict) -> api.Options:
+        """Return the options of a request.
+
+        :raises ValueError: When the request is invalid.
+        """
+        if not isinstance(request, dict) or not isinstance(request.get("item"), str):
+            raise ValueError("The request should be a JSON object with an 'item'.")
+        unknown = set(request) - set(REQUEST_KEYS) - {"item"}
+        if unknown:
+            raise ValueError(
+                f"Unknown keys in the request: {', '.join(sorted(unknown))}."
+            )
+        settings = vars(self.options).copy()
+        for key, option in REQUEST_KEYS.items():
+            if key in request:
+                # Only the XSLT parameters may be left empty with null.
+                if not isinstance(request[key], str) and not (
+                    key == "xslt_parameters" and request[key] is None
+                ):
+                    raise ValueError(f"'{key}' should be a string.")
+                settings[option] = request[key]
+        if settings["source"] == "local" and self.options.source != "local":
+            raise ValueError(
+                "Local files can only be rendered by a service started with --local."
+            )
+        return api.Options(**settings)
+
+    def submit(self, request: dict) -> Future:
+        """Queue the job of a request, or return the job of an identical request that is
+        queued or running.
+
+        Jobs are keyed on the item, source, format and XSLT parameters of the request, the
+        only settings a request can change, and not on the digest of the output. Finding
+        the digest takes the resolution of the item, with SCTA lookups and a download, which
+        a duplicate request should not repeat. Jobs of different requests for the same
+        output, such as an SCTA id and the url of its transcription, wait for each other on
+        the cache lock of the digest, so the output is still built once when the service has
+        a cache.
+
+        :raises ValueError: When the request is invalid.
+        :return: Future of the `api.Result` of the job.
+        """
+        options = self.job_options(request)
+        key = hashing.text_digest(
+            request["item"],
+            options.source,
+            options.output_format,
+            options.xslt_parameters or "",
+        )
+        with self.lock:
+            self.counts["requests"] += 1
+            if key in self.jobs:
+                self.counts["deduplicated"] += 1
+                logger.debug(f"Joining the running job of {request['item']}.")
+                return self.jobs[key]
+            future = self.executor.submit(
+                api.build_item,
+                request["item"],
+                options,
+                output_dir=self.output_dir,
+                cache=self.cache,
+            )
+            self.jobs[key] = future
+        future.add_done_callback(lambda future: self.finished(key, future))
+        return future
+
+    def finished(self, key: str, future: Future) -> None:
+        with self.lock:
+            del self.jobs[key]
+            ok = future.exception() is None and future.result().ok
+            self.counts["done" if ok else "failed"] += 1
+
+    def status(self) -> dict:
+        with self.lock:
+            return dict(self.counts, jobs=len(self.jobs))
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+
+class RenderHandler(http.server.BaseHTTPRequestHandler):
+    """Handle the HTTP requests of the render service."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/status":
+            self.send_json(200, self.server.service.status())
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}."})
+
+    def do_POST(self):
+        if self.path != "/render":
+            self.send_json(404, {"error": f"Unknown path {self.path}."})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+            future = self.server.service.submit(request)
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+
+        result = future.result()
+        if not result.ok:
+            self.send_json(
+                500, {"error": f"{type(result.error).__name__}: {result.error}"}
+            )
+            return
+
+        output_format = "pdf" if result.output.endswith(".pdf") else "tex"
+        with open(result.output, mode="rb") as f:
+            f.seek(0, 2)
+            size = f.tell()
+            f.seek(0)
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPES[output_format])
+            self.send_header("Content-Length", str(size))
+            self.send_header("X-Lbp-Digest", result.digest)
+            self.send_header("X-Lbp-Cache-Hits", json.dumps(result.cache_hits))
+            self.send_header("X-Lbp-Timings", json.dumps(result.timings))
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile)
+
+    def send_json(self, status: int, content: dict) -> None:
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class RenderServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """HTTP server answering every request in its own thread."""
+
+    daemon_threads = True
+
+    def __init__(self, address, service: RenderService) -> None:
+        super().__init__(address, RenderHandler)
+        self.service = service
+
+
+def serve(host: str, port: int, options: api.Options) -> None:
+    """Run the render service until the process is interrupted."""
+    service = RenderService(options)
+    server = RenderServer((host, port), service)
+    logger.info(
+        f"Serving on http://{server.server_address[0]}:{server.server_address[1]} "
+        f"with {max(options.jobs, 1)} workers."
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopping the render service.")
+    finally:
+        server.server_close()
+        service.close()
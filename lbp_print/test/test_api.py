@@ -0,0 +1,81 @@
+import os
+import threading
+
+import pytest
+
+import lbp_print
+from lbp_print import config
+
+ASSETS = os.path.join(config.module_dir, "test", "assets")
+XML = os.path.join(ASSETS, "da-49-l1q1.xml")
+MODIFIED = os.path.join(ASSETS, "da-49-l1q1-modified.xml")
+XSLT = os.path.join(ASSETS, "simple.xslt")
+
+
+def options(**kwargs):
+    return lbp_print.Options(
+        xslt=XSLT, engine="lxml", annotate_samewords=False, **kwargs
+    )
+
+
+class TestBuild:
+    def test_results_with_cache(self, tmpdir):
+        cache_dir = str(tmpdir.join("cache"))
+        (first,) = lbp_print.build([XML], options(cache_dir=cache_dir))
+        (second,) = lbp_print.build([XML], options(cache_dir=cache_dir))
+        assert first.ok and second.ok
+        assert first.output == second.output
+        assert os.path.dirname(first.output) == cache_dir
+        assert first.cache_hits == {"tex": False, "transform": False}
+        assert second.cache_hits == {"tex": True}
+        assert {"resolve", "hash", "transform", "clean"} <= set(first.timings)
+        assert "transform" not in second.timings
+
+    def test_results_without_cache(self, tmpdir):
+        output_dir = str(tmpdir.join("output"))
+        results = lbp_print.build(
+            [XML, MODIFIED], options(output_dir=output_dir, read_output=True)
+        )
+        assert [os.path.dirname(result.output) for result in results] == [
+            output_dir,
+            output_dir,
+        ]
+        assert results[0].content != results[1].content
+        assert results[0].content.startswith(b"\\documentclass")
+
+    def test_failures_are_reported_per_item(self, tmpdir):
+        missing = str(tmpdir.join("missing.xml"))
+        results = lbp_print.build([missing, XML], options(output_dir=str(tmpdir)))
+        assert isinstance(results[0].error, IOError)
+        assert results[1].ok
+
+    def test_config_is_not_changed(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(config, "cache_dir", None)
+        lbp_print.build([XML], options(cache_dir=str(tmpdir.join("cache"))))
+        assert config.cache_dir is None
+        assert not os.path.exists(os.path.join(os.getcwd(), "registry.json"))
+
+    def test_concurrent_builds(self, tmpdir):
+        results = {}
+
+        def run(name):
+            results[name] = lbp_print.build(
+                [XML, MODIFIED],
+                options(cache_dir=str(tmpdir.join(name)), read_output=True, jobs=2),
+            )
+
+        threads = [threading.Thread(target=run, args=(name,)) for name in "abcd"]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        contents = {
+            tuple(result.content for result in batch) for batch in results.values()
+        }
+        assert len(contents) == 1
+
+    def test_invalid_options(self):
+        with pytest.raises(ValueError):
+            lbp_print.Options(output_format="docx")
+        with pytest.raises(ValueError):
+            lbp_print.Options(source="ftp")
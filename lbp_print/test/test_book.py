@@ -0,0 +1,86 @@
+import os
+import shutil
+
+import pytest
+
+from lbp_print import book
+from lbp_print import config
+from lbp_print.core import Document, LocalResource, Tex
+
+ASSETS = os.path.join(config.module_dir, "test", "assets")
+XML = os.path.join(ASSETS, "da-49-l1q1.xml")
+XSLT = os.path.join(ASSETS, "simple.xslt")
+
+
+@pytest.fixture
+def sources(tmpdir, monkeypatch):
+    """Three sections with different titles, a cache dir and a record of the conversions
+    and compilations."""
+    monkeypatch.setattr(config, "cache_dir", str(tmpdir.mkdir("cache")))
+    record = {"converted": [], "compiled": []}
+
+    xml_to_tex = Tex.xml_to_tex
+
+    def convert(self):
+        record["converted"].append(self.name)
+        return xml_to_tex(self)
+
+    def latexmk(self, input_file, output_dir, fmt=False):
+        record["compiled"].append(input_file)
+        pdf = os.path.join(output_dir, "document.pdf")
+        with open(pdf, "w") as f:
+            f.write("pdf")
+        return pdf
+
+    monkeypatch.setattr(Tex, "xml_to_tex", convert)
+    monkeypatch.setattr(Document, "latexmk", latexmk)
+
+    for num in range(1, 4):
+        source = tmpdir.join(f"q{num}.xml")
+        shutil.copyfile(XML, str(source))
+        source.write(source.read().replace("Quaestio", f"Quaestio {num}"))
+    return record
+
+
+def make_book(tmpdir):
+    sections = [
+        Tex(
+            LocalResource(str(tmpdir.join(f"q{num}.xml")), custom_xslt=XSLT),
+            engine="lxml",
+        )
+        for num in range(1, 4)
+    ]
+    return book.Book(sections, name="commentary", source_id=str(tmpdir))
+
+
+class TestBook:
+    def test_sections_are_combined_in_order(self, tmpdir, sources):
+        with open(make_book(tmpdir).process(output_format="tex")) as f:
+            tex = f.read()
+        assert tex.count("\\documentclass") == 1
+        assert tex.count("\\begin{document}") == 1
+        assert tex.count("\\end{document}") == 1
+        assert tex.count("\\beginnumbering") == 3
+        positions = [tex.index(f"Quaestio {num}") for num in range(1, 4)]
+        assert positions == sorted(positions)
+
+    def test_book_is_compiled_once(self, tmpdir, sources):
+        make_book(tmpdir).process(output_format="pdf")
+        assert len(sources["compiled"]) == 1
+
+    def test_only_changed_sections_are_converted(self, tmpdir, sources):
+        first = make_book(tmpdir)
+        first.process(output_format="tex")
+        source = tmpdir.join("q2.xml")
+        source.write(source.read().replace("Quaestio 2", "Question 2"))
+        second = make_book(tmpdir)
+        second.process(output_format="tex")
+        assert sources["converted"] == ["q1", "q2", "q3", "q2"]
+        assert first.tex_digest != second.tex_digest
+
+    def test_split_document(self):
+        assert book.split_document("pre\\begin{document}body\\end{document}\n") == (
+            "pre",
+            "body",
+        )
+        assert book.split_document("body") == ("", "body")
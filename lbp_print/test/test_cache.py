@@ -0,0 +1,467 @@
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+from lbp_print.core import Cache, LocalResource, Tex
+from lbp_print import config
+from lbp_print import exceptions as lbp_exceptions
+from lbp_print import latex
+
+
+class TestStageCache:
+    def test_cleanup_settings_reuse_transformation(self, tmpdir, monkeypatch):
+        """Show that changing a cleanup setting only reruns the cleanup."""
+        monkeypatch.setattr(config, "cache_dir", str(tmpdir))
+        path = os.path.join(config.module_dir, "test", "assets", "da-49-l1q1.xml")
+        xslt = os.path.join(config.module_dir, "test", "assets", "simple.xslt")
+        res = LocalResource(path, custom_xslt=xslt)
+        annotated = Tex(res, engine="lxml").process(output_format="tex")
+
+        def fail(self):
+            raise AssertionError("The transformation was rerun.")
+
+        monkeypatch.setattr(Tex, "xml_to_tex", fail)
+        plain = Tex(res, engine="lxml", annotate_samewords=False)
+        assert plain.process(output_format="tex") != annotated
+        assert plain.process(output_format="tex") == os.path.join(
+            config.cache_dir, plain.tex_digest + ".tex"
+        )
+
+    def test_stage_keys(self):
+        path = os.path.join(config.module_dir, "test", "assets", "da-49-l1q1.xml")
+        xslt = os.path.join(config.module_dir, "test", "assets", "simple.xslt")
+        res = LocalResource(path, custom_xslt=xslt)
+        default = Tex(res, engine="lxml", enable_caching=False)
+        parameter = Tex(
+            res, engine="lxml", enable_caching=False, xslt_parameters="fontsize=10pt"
+        )
+        plain = Tex(res, engine="lxml", enable_caching=False, clean_whitespace=False)
+        assert parameter.transform_digest != default.transform_digest
+        assert plain.transform_digest == default.transform_digest
+        assert plain.tex_digest != default.tex_digest
+        assert len({default.tex_digest, default.pdf_digest, parameter.tex_digest}) == 3
+
+
+class TestCacheRegistry:
+    def fill(self, cache, sizes):
+        for num, size in enumerate(sizes):
+            cache.write("x" * size, digest=str(num), suffix=".tex", resource="res")
+
+    def test_entries_are_registered(self, tmpdir):
+        cache = Cache(str(tmpdir))
+        self.fill(cache, [10, 20])
+        assert Cache(str(tmpdir)).entries["1.tex"]["size"] == 20
+        assert Cache(str(tmpdir)).entries["1.tex"]["stage"] == "tex"
+        assert cache.stats()["size"] == 30
+
+    def test_lookup_uses_registry(self, tmpdir):
+        cache = Cache(str(tmpdir))
+        tmpdir.join("untracked.tex").write("x")
+        assert not cache.contains("untracked.tex")
+        self.fill(cache, [10])
+        accessed = cache.entries["0.tex"]["accessed"]
+        assert cache.contains("0.tex")
+        assert cache.entries["0.tex"]["accessed"] >= accessed
+
+    def test_existing_cache_is_indexed(self, tmpdir):
+        tmpdir.join("abc.raw.tex").write("x" * 5)
+        tmpdir.join("abc.pdf").write("x" * 7)
+        cache = Cache(str(tmpdir))
+        assert cache.entries["abc.raw.tex"]["stage"] == "transform"
+        assert cache.stats()["size"] == 12
+        assert tmpdir.join("registry.json").isfile()
+
+    def test_recent_access_is_not_written(self, tmpdir):
+        cache = Cache(str(tmpdir))
+        self.fill(cache, [10])
+        registry = tmpdir.join("registry.json").read()
+        assert cache.contains("0.tex")
+        assert tmpdir.join("registry.json").read() == registry
+        assert "\n" not in registry
+
+    def test_old_access_is_updated(self, tmpdir):
+        cache = Cache(str(tmpdir))
+        self.fill(cache, [10])
+        cache.update_registry({"0.tex": dict(cache.entries["0.tex"], accessed=0)})
+        assert cache.contains("0.tex")
+        assert Cache(str(tmpdir)).entries["0.tex"]["accessed"] > 0
+
+    def test_prune_by_size_removes_least_recently_used(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(config, "cache_access_resolution", 0)
+        cache = Cache(str(tmpdir))
+        self.fill(cache, [10, 10, 10])
+        cache.contains("0.tex")
+        assert sorted(cache.prune(max_size=20)) == ["1.tex"]
+        assert sorted(cache.files()) == ["0.tex", "2.tex"]
+
+    def test_prune_by_age(self, tmpdir):
+        cache = Cache(str(tmpdir))
+        self.fill(cache, [10, 10])
+        cache.update_registry({"0.tex": dict(cache.entries["0.tex"], accessed=0)})
+        assert cache.prune(max_age=3600) == ["0.tex"]
+        assert list(cache.entries) == ["1.tex"]
+
+    def test_downloads_and_metadata_are_counted(self, tmpdir):
+        cache = Cache(str(tmpdir))
+        self.fill(cache, [10])
+        tmpdir.mkdir("downloads").join("abc").write("x" * 20)
+        tmpdir.mkdir("metadata").join("def.json").write("x" * 5)
+        tmpdir.join("metadata", "def.json.1-2.tmp").write("x")
+        stats = cache.stats()
+        assert stats["entries"] == 3
+        assert stats["size"] == 35
+        assert stats["stages"]["downloads"] == {"entries": 1, "size": 20}
+
+    def test_prune_removes_downloads_and_metadata(self, tmpdir):
+        cache = Cache(str(tmpdir))
+        self.fill(cache, [10])
+        tmpdir.mkdir("downloads").join("abc").write("x" * 20)
+        tmpdir.mkdir("metadata").join("def.json").write("x" * 5)
+        tmpdir.join("downloads", "abc").setmtime(0)
+        tmpdir.join("metadata", "def.json").setmtime(time.time() - 60)
+        assert cache.prune(max_age=3600) == [os.path.join("downloads", "abc")]
+        assert cache.prune(max_size=10) == [os.path.join("metadata", "def.json")]
+        assert list(cache.entries) == ["0.tex"]
+        assert tmpdir.join("downloads").listdir() == []
+
+    def test_verify_repairs_registry(self, tmpdir):
+        cache = Cache(str(tmpdir))
+        self.fill(cache, [10, 10])
+        tmpdir.join("0.tex").remove()
+        tmpdir.join("1.tex").write("x")
+        tmpdir.join("2.pdf").write("x")
+        assert cache.verify() == {
+            "missing": ["0.tex"],
+            "untracked": ["2.pdf"],
+            "changed": ["1.tex"],
+        }
+        assert cache.verify() == {"missing": [], "untracked": [], "changed": []}
+
+
+class TestCacheConcurrency:
+    def test_no_partial_files_are_left(self, tmpdir):
+        cache = Cache(str(tmpdir))
+        cache.write("content", digest="abc", suffix=".tex")
+        source = tmpdir.join("source.pdf")
+        source.write("pdf")
+        cache.store(str(source), digest="abc", suffix=".pdf")
+        assert sorted(os.listdir(str(tmpdir))) == [
+            ".locks",
+            "abc.pdf",
+            "abc.tex",
+            "registry.json",
+            "source.pdf",
+        ]
+
+    def test_failed_write_raises_its_own_error(self, tmpdir):
+        def write(tmp_name):
+            raise ValueError("Nothing to write.")
+
+        with pytest.raises(ValueError):
+            Cache(str(tmpdir)).publish(write, "abc.tex")
+
+    def test_prune_removes_unused_locks(self, tmpdir):
+        cache = Cache(str(tmpdir))
+        with cache.lock("unused"):
+            pass
+        with cache.lock("held"):
+            cache.prune(max_age=3600)
+            assert os.listdir(str(tmpdir.join(".locks"))) == ["held.lock"]
+
+    def test_lock_removed_while_waiting(self, tmpdir):
+        """A process waiting for a lock file that is removed takes the lock again."""
+        fcntl = pytest.importorskip("fcntl")
+        cache = Cache(str(tmpdir))
+        path = str(tmpdir.join(".locks", "abc.lock"))
+        with cache.lock("abc"):
+            pass
+        entered = threading.Event()
+        release = threading.Event()
+
+        def wait():
+            with cache.lock("abc"):
+                entered.set()
+                release.wait()
+
+        with open(path, mode="a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            thread = threading.Thread(target=wait)
+            thread.start()
+            time.sleep(0.2)
+            os.remove(path)
+        entered.wait()
+        with open(path, mode="a") as f:
+            with pytest.raises(BlockingIOError):
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        release.set()
+        thread.join()
+
+    def test_registry_is_rebuilt_under_the_lock(self, tmpdir):
+        cache = Cache(str(tmpdir))
+        tmpdir.join("registry.json").remove()
+        entry = {
+            "size": 1,
+            "created": 0,
+            "accessed": 0,
+            "resource": None,
+            "stage": "tex",
+        }
+        caches = []
+        with cache.lock("registry"):
+            thread = threading.Thread(target=lambda: caches.append(Cache(str(tmpdir))))
+            thread.start()
+            time.sleep(0.2)
+            # Saved by another process while the registry was missing.
+            cache.save_registry({"abc.tex": entry})
+        thread.join()
+        assert caches[0].entries == {"abc.tex": entry}
+
+    def test_concurrent_stores_are_registered(self, tmpdir, monkeypatch):
+        """Threads sharing a cache, like the jobs of the render service, keep all entries."""
+        save_registry = Cache.save_registry
+
+        def slow_save_registry(self, entries=None):
+            # Widen the window in which other threads reload the entries.
+            time.sleep(0.001)
+            save_registry(self, entries)
+
+        monkeypatch.setattr(Cache, "save_registry", slow_save_registry)
+        cache = Cache(str(tmpdir))
+
+        def store(num):
+            for step in range(10):
+                cache.contains(f"missing-{num}-{step}.tex")
+                cache.write("x", digest=f"{num}-{step}", suffix=".tex")
+
+        threads = [threading.Thread(target=store, args=(num,)) for num in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(Cache(str(tmpdir)).entries) == 100
+
+    def test_waiting_for_lock(self, tmpdir):
+        locked = threading.Event()
+
+        def produce():
+            cache = Cache(str(tmpdir))
+            with cache.lock("abc"):
+                locked.set()
+                time.sleep(0.2)
+                cache.write("content", digest="abc", suffix=".tex")
+
+        thread = threading.Thread(target=produce)
+        thread.start()
+        locked.wait()
+        cache = Cache(str(tmpdir))
+        with cache.lock("abc"):
+            assert cache.contains("abc.tex")
+        thread.join()
+
+    def test_concurrent_processing_transforms_once(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(config, "cache_dir", str(tmpdir))
+        path = os.path.join(config.module_dir, "test", "assets", "da-49-l1q1.xml")
+        xslt = os.path.join(config.module_dir, "test", "assets", "simple.xslt")
+        res = LocalResource(path, custom_xslt=xslt)
+        calls = []
+        xml_to_tex = Tex.xml_to_tex
+
+        def slow_xml_to_tex(self):
+            calls.append(self.id)
+            time.sleep(0.2)
+            return xml_to_tex(self)
+
+        monkeypatch.setattr(Tex, "xml_to_tex", slow_xml_to_tex)
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(
+                    Tex(res, engine="lxml").process(output_format="tex")
+                )
+            )
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1
+        assert len(set(results)) == 1 and len(results) == 2
+
+
+class TestBuildDir:
+
+    xml = os.path.join(config.module_dir, "test", "assets", "da-49-l1q1.xml")
+    xslt = os.path.join(config.module_dir, "test", "assets", "simple.xslt")
+
+    @pytest.fixture
+    def builds(self, tmpdir, monkeypatch):
+        """Replace latexmk and record the build dirs of the compilations."""
+        monkeypatch.setattr(config, "cache_dir", str(tmpdir.mkdir("cache")))
+        builds = []
+
+        def latexmk(self, input_file, output_dir, fmt=False):
+            builds.append((input_file, output_dir, fmt))
+            pdf = os.path.join(output_dir, "document.pdf")
+            with open(pdf, "w") as f:
+                f.write("pdf")
+            return pdf
+
+        monkeypatch.setattr(Tex, "latexmk", latexmk)
+        return builds
+
+    def test_build_dir_is_kept_for_new_versions(self, tmpdir, builds):
+        source = tmpdir.join("source.xml")
+        shutil.copyfile(self.xml, str(source))
+        first = Tex(LocalResource(str(source), custom_xslt=self.xslt), engine="lxml")
+        first.process(output_format="pdf")
+        source.write(source.read().replace("Quaestio", "Question"))
+        second = Tex(LocalResource(str(source), custom_xslt=self.xslt), engine="lxml")
+        second.process(output_format="pdf")
+        assert first.pdf_digest != second.pdf_digest
+        assert len(builds) == 2
+        assert builds[0] == builds[1]
+        assert os.path.basename(builds[0][0]) == "document.tex"
+
+    def test_sources_have_separate_build_dirs(self, tmpdir, builds):
+        for name in ("first.xml", "second.xml"):
+            shutil.copyfile(self.xml, str(tmpdir.join(name)))
+        first = LocalResource(str(tmpdir.join("first.xml")), custom_xslt=self.xslt)
+        second = LocalResource(str(tmpdir.join("second.xml")), custom_xslt=self.xslt)
+        # Different settings, so the second is not found in the cache.
+        Tex(first, engine="lxml").process(output_format="pdf")
+        Tex(second, engine="lxml", xslt_parameters="fontsize=10pt").process(
+            output_format="pdf"
+        )
+        assert builds[0][1] != builds[1][1]
+
+    def test_old_build_dirs_are_pruned(self, tmpdir, builds):
+        Tex(LocalResource(self.xml, custom_xslt=self.xslt), engine="lxml").process(
+            output_format="pdf"
+        )
+        build_dir = builds[0][1]
+        os.utime(build_dir, (0, 0))
+        Cache(config.cache_dir).prune(max_age=3600)
+        assert not os.path.exists(build_dir)
+
+
+class TestLatexFormat:
+
+    xml = os.path.join(config.module_dir, "test", "assets", "da-49-l1q1.xml")
+    xslt = os.path.join(config.module_dir, "test", "assets", "simple.xslt")
+
+    @pytest.fixture
+    def dumps(self, tmpdir, monkeypatch, builds):
+        """Replace the format dump and record the dumped preambles."""
+        monkeypatch.setattr(config, "latex_format", True)
+        dumps = []
+
+        def dump_format(self, preamble):
+            dumps.append(preamble)
+            fmt = os.path.join(self.tmp_dir.name, "preamble.fmt")
+            with open(fmt, "w") as f:
+                f.write("fmt")
+            return fmt
+
+        monkeypatch.setattr(Tex, "dump_format", dump_format)
+        return dumps
+
+    builds = TestBuildDir.builds
+
+    def test_format_is_used(self, dumps, builds):
+        Tex(LocalResource(self.xml, custom_xslt=self.xslt), engine="lxml").process(
+            output_format="pdf"
+        )
+        input_file, output_dir, fmt = builds[0]
+        assert fmt is True
+        assert os.path.isfile(os.path.join(output_dir, "document.fmt"))
+        assert "\\documentclass" in dumps[0]
+        assert "\\begin{document}" not in dumps[0]
+
+    def test_format_is_shared_by_documents(self, tmpdir, dumps, builds):
+        for name in ("first.xml", "second.xml"):
+            source = tmpdir.join(name)
+            shutil.copyfile(self.xml, str(source))
+            source.write(source.read().replace("Quaestio", name))
+            Tex(
+                LocalResource(str(source), custom_xslt=self.xslt), engine="lxml"
+            ).process(output_format="pdf")
+        assert len(builds) == 2
+        assert len(dumps) == 1
+        assert "format" in Cache(config.cache_dir).stats()["stages"]
+
+    def test_failed_dump_falls_back(self, dumps, builds, monkeypatch):
+        monkeypatch.setattr(Tex, "dump_format", lambda self, preamble: None)
+        Tex(LocalResource(self.xml, custom_xslt=self.xslt), engine="lxml").process(
+            output_format="pdf"
+        )
+        assert builds[0][2] is False
+
+    def test_failed_dump_is_not_repeated(self, tmpdir, dumps, builds, monkeypatch):
+        def dump_format(self, preamble):
+            dumps.append(preamble)
+            return None
+
+        monkeypatch.setattr(Tex, "dump_format", dump_format)
+        for name in ("first.xml", "second.xml"):
+            source = tmpdir.join(name)
+            shutil.copyfile(self.xml, str(source))
+            source.write(source.read().replace("Quaestio", name))
+            Tex(
+                LocalResource(str(source), custom_xslt=self.xslt), engine="lxml"
+            ).process(output_format="pdf")
+        assert [fmt for _, _, fmt in builds] == [False, False]
+        assert len(dumps) == 1
+
+    def test_format_depends_on_the_xelatex_version(self, tmpdir, dumps, monkeypatch):
+        tex = Tex(LocalResource(self.xml, custom_xslt=self.xslt), engine="lxml")
+        tmpdir.join("document.tex").write("\\documentclass{article}\\begin{document}")
+        formats = []
+        for version in ["XeTeX 3.14159265", "XeTeX 3.14159265", "XeTeX 3.141592653"]:
+            monkeypatch.setattr(latex, "xelatex_version", lambda: version)
+            formats.append(tex.preamble_format(str(tmpdir.join("document.tex"))))
+        assert formats[0] == formats[1] != formats[2]
+        assert len(dumps) == 2
+
+    def compile_with_errors(self, builds, monkeypatch, error, retry_fails=False):
+        """Process the asset with a latexmk failing with `error` when it loads the format,
+        and with `retry_fails` without the format."""
+
+        def latexmk(self, input_file, output_dir, fmt=False):
+            builds.append((input_file, output_dir, fmt))
+            if fmt or retry_fails:
+                raise error
+            pdf = os.path.join(output_dir, "document.pdf")
+            with open(pdf, "w") as f:
+                f.write("pdf")
+            return pdf
+
+        monkeypatch.setattr(Tex, "latexmk", latexmk)
+        Tex(LocalResource(self.xml, custom_xslt=self.xslt), engine="lxml").process(
+            output_format="pdf"
+        )
+
+    def test_unusable_format_is_removed(self, dumps, builds, monkeypatch):
+        error = lbp_exceptions.LatexFormatError("The format could not be loaded.")
+        self.compile_with_errors(builds, monkeypatch, error)
+        assert [fmt for _, _, fmt in builds] == [True, False]
+        assert not os.path.exists(os.path.join(builds[0][1], "document.fmt"))
+        assert "format" not in Cache(config.cache_dir).stats()["stages"]
+
+    def test_latex_errors_keep_the_format(self, dumps, builds, monkeypatch):
+        with pytest.raises(Exception):
+            self.compile_with_errors(
+                builds, monkeypatch, Exception("Latex compilation failed.")
+            )
+        assert [fmt for _, _, fmt in builds] == [True]
+        assert "format" in Cache(config.cache_dir).stats()["stages"]
+
+    def test_format_is_kept_when_the_retry_fails(self, dumps, builds, monkeypatch):
+        error = lbp_exceptions.LatexFormatError("The format could not be loaded.")
+        with pytest.raises(lbp_exceptions.LatexFormatError):
+            self.compile_with_errors(builds, monkeypatch, error, retry_fails=True)
+        assert [fmt for _, _, fmt in builds] == [True, False]
+        assert "format" in Cache(config.cache_dir).stats()["stages"]
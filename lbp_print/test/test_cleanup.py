@@ -0,0 +1,99 @@
+import logging
+import os
+import random
+import re
+
+import pytest
+
+from lbp_print import cleanup
+from lbp_print import config
+
+golden_dir = os.path.join(config.module_dir, "test", "assets", "cleanup")
+
+# The cleanup rules as they were applied before the passes were fused. The output of
+# `cleanup.whitespace_cleanup` must stay identical to applying these in order.
+LEGACY_RULES = [
+    (r" ?{ ?", r"{"),
+    (r" }", r"}"),
+    (r" ([.,?!:;]+)", r"\1"),
+    (r" (\\edtext{})", r"\1"),
+    (r"}(\\edtext{[^}]+})", r"} \1"),
+    (r" +", " "),
+    (r"} ([.,?!:;]+)", r"}\1"),
+    (r"^ +", r""),
+    (r" %$", "%"),
+    (r"\( ", r"("),
+    (r" \)", r")"),
+    (r"([_\^])", r"\\\1"),
+    (r'"([^"]+?)"', r"\\enquote{\1}"),
+]
+
+
+def legacy_cleanup(buffer: str) -> str:
+    for pattern, replacement in LEGACY_RULES:
+        buffer = re.sub(pattern, replacement, buffer, flags=re.MULTILINE)
+    return buffer
+
+
+class TestGoldenFiles:
+    @pytest.mark.parametrize(
+        "name",
+        sorted(
+            f[: -len(".tex")]
+            for f in os.listdir(golden_dir)
+            if not f.endswith(".expected.tex")
+        ),
+    )
+    def test_output_matches_golden_file(self, name):
+        with open(os.path.join(golden_dir, name + ".tex")) as f:
+            source = f.read()
+        with open(os.path.join(golden_dir, name + ".expected.tex")) as f:
+            expected = f.read()
+        assert cleanup.whitespace_cleanup(source) == expected
+
+
+class TestLegacyEquivalence:
+
+    tokens = [
+        " ",
+        "  ",
+        "{",
+        "}",
+        ".",
+        ";",
+        "\\edtext{}",
+        "\\edtext{a}",
+        "\\edtext{ b }",
+        "\\edtext {",
+        "a",
+        "%",
+        "\n",
+        "(",
+        ")",
+        "_",
+        "^",
+        '"',
+        "\t",
+    ]
+
+    def test_random_buffers(self):
+        rng = random.Random(49)
+        for _ in range(5000):
+            buffer = "".join(rng.choice(self.tokens) for _ in range(rng.randint(0, 30)))
+            assert cleanup.whitespace_cleanup(buffer) == legacy_cleanup(buffer), buffer
+
+
+class TestEnquote:
+    def test_balanced_quotes(self, caplog):
+        assert cleanup.enquote('a "b" c "d"') == "a \\enquote{b} c \\enquote{d}"
+        assert not caplog.records
+
+    def test_unbalanced_quote_is_reported(self, caplog):
+        with caplog.at_level(logging.WARNING):
+            assert cleanup.enquote('one\n"two" "three') == 'one\n\\enquote{two} "three'
+        assert "line 2" in caplog.text
+
+    def test_empty_quotes_are_reported(self, caplog):
+        with caplog.at_level(logging.WARNING):
+            assert cleanup.enquote('""a"') == '"\\enquote{a}'
+        assert len(caplog.records) == 1
@@ -1,8 +1,13 @@
 import json
 import os
 
+import pytest
+
 from lbp_print import cli
 from lbp_print import config
+from lbp_print import exceptions as lbp_exceptions
+from lbp_print import watch
+from lbp_print.core import Cache, Document, Tex
 
 
 class TestCliConfig:
@@ -69,3 +74,222 @@ class TestSetupArgs:
         assert args["--config-file"] == os.path.join(expanded, ".lbp_print.json")
         assert args["--output"] == os.path.join(expanded, "Desktop")
         assert args["<recipe>"] == os.path.join(os.getcwd(), "recipe.json")
+
+
+class TestCacheCommand:
+    def test_parse_size(self):
+        assert cli.parse_size("500") == 500
+        assert cli.parse_size("2K") == 2048
+        assert cli.parse_size("1.5m") == 1536 * 1024
+        assert cli.parse_size("1GB") == 1024 ** 3
+
+    @pytest.fixture
+    def cache(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(config, "cache_dir", str(tmpdir))
+        cache = Cache(str(tmpdir))
+        for num, size in enumerate([1024, 2048, 4096]):
+            cache.write("x" * size, digest=str(num), suffix=".tex", resource="res")
+        cache.update_registry({"0.tex": dict(cache.entries["0.tex"], accessed=0)})
+        return cache
+
+    def args(self, command, max_size=None, max_age=None):
+        args = {name: name == command for name in ("stats", "prune", "verify")}
+        return dict(args, **{"--max-size": max_size, "--max-age": max_age})
+
+    def test_stats(self, cache, capsys):
+        cli.cache_command(self.args("stats"))
+        output = capsys.readouterr().out
+        assert f"Cache dir: {cache.dir}" in output
+        assert "Entries: 3 (7.0K)" in output
+        assert "tex: 3 (7.0K)" in output
+
+    def test_prune_by_age(self, cache):
+        cli.cache_command(self.args("prune", max_age="1"))
+        assert sorted(Cache(cache.dir).entries) == ["1.tex", "2.tex"]
+        assert not os.path.exists(os.path.join(cache.dir, "0.tex"))
+
+    def test_prune_by_size(self, cache):
+        cli.cache_command(self.args("prune", max_size="5K"))
+        assert sorted(Cache(cache.dir).entries) == ["2.tex"]
+
+    def test_prune_requires_a_limit(self, cache, caplog):
+        cli.cache_command(self.args("prune"))
+        assert "requires --max-size" in caplog.text
+        assert len(Cache(cache.dir).entries) == 3
+
+    def test_verify(self, cache, caplog):
+        os.remove(os.path.join(cache.dir, "1.tex"))
+        cli.cache_command(self.args("verify"))
+        assert "1.tex was missing." in caplog.text
+        assert sorted(Cache(cache.dir).entries) == ["0.tex", "2.tex"]
+
+    def test_main_runs_the_cache_command(self, cache, tmpdir, monkeypatch, capsys):
+        monkeypatch.setattr(
+            "sys.argv",
+            [
+                "lbp_print",
+                "cache",
+                "stats",
+                "--cache-dir",
+                cache.dir,
+                "--config-file",
+                str(tmpdir.join("missing.json")),
+            ],
+        )
+        cli.main()
+        assert "Entries: 3" in capsys.readouterr().out
+
+
+class TestParallelProcessing:
+
+    assets = os.path.join(config.module_dir, "test", "assets")
+
+    def args(self, files):
+        return {
+            "--scta": False,
+            "--local": True,
+            "<file>": files,
+            "--xslt": os.path.join(self.assets, "simple.xslt"),
+            "--xslt-parameters": None,
+            "--no-cache": True,
+            "--no-samewords": True,
+            "--engine": "lxml",
+        }
+
+    def test_parallel_output_matches_serial(self, tmpdir, monkeypatch):
+        monkeypatch.chdir(tmpdir)
+        files = [
+            os.path.join(self.assets, "da-49-l1q1.xml"),
+            os.path.join(self.assets, "da-49-l1q1-modified.xml"),
+        ]
+        args = self.args(files)
+        parallel = []
+        for result in cli.process_parallel(args, files, "tex", jobs=2):
+            with open(result) as f:
+                parallel.append(f.read())
+            os.remove(result)
+        serial = []
+        for result in (cli.process_item(args, f, "tex") for f in files):
+            with open(result) as f:
+                serial.append(f.read())
+        assert parallel == serial
+
+    def test_failures_are_collected(self, tmpdir, monkeypatch):
+        monkeypatch.chdir(tmpdir)
+        files = [
+            os.path.join(self.assets, "missing.xml"),
+            os.path.join(self.assets, "da-49-l1q1.xml"),
+        ]
+        with pytest.raises(lbp_exceptions.BatchError) as excinfo:
+            cli.process_parallel(self.args(files), files, "tex", jobs=2)
+        assert [identifier for identifier, _ in excinfo.value.failures] == files[:1]
+        assert len(os.listdir(tmpdir)) == 1
+
+    def test_pdf_without_cache_outlives_the_worker(self, tmpdir, monkeypatch):
+        def latexmk(self, input_file, output_dir, fmt=False):
+            name = os.path.splitext(os.path.basename(input_file))[0] + ".pdf"
+            with open(os.path.join(output_dir, name), "w") as f:
+                f.write("%PDF")
+            return os.path.join(output_dir, name)
+
+        monkeypatch.chdir(tmpdir)
+        monkeypatch.setattr(Tex, "latexmk", latexmk)
+        files = [
+            os.path.join(self.assets, "da-49-l1q1.xml"),
+            os.path.join(self.assets, "da-49-l1q1-modified.xml"),
+        ]
+        results = cli.process_parallel(self.args(files), files, "pdf", jobs=2)
+        for result in results:
+            assert os.path.dirname(os.path.abspath(result)) == str(tmpdir)
+            assert open(result).read() == "%PDF"
+
+
+class TestBook:
+
+    assets = os.path.join(config.module_dir, "test", "assets")
+
+    def test_book_from_command_line(self, tmpdir, monkeypatch):
+        monkeypatch.chdir(tmpdir)
+        monkeypatch.setattr(
+            "sys.argv",
+            [
+                "lbp_print",
+                "tex",
+                "--no-cache",
+                "--engine",
+                "lxml",
+                "--xslt",
+                os.path.join(self.assets, "simple.xslt"),
+                "--config-file",
+                str(tmpdir.join("missing.json")),
+                "--book",
+                "edition",
+                "--local",
+                os.path.join(self.assets, "da-49-l1q1.xml"),
+                os.path.join(self.assets, "da-49-l1q1-modified.xml"),
+            ],
+        )
+        cli.main()
+        # Without a cache, the items and the book are written to the working dir.
+        outputs = [path.read() for path in tmpdir.listdir(lambda p: p.ext == ".tex")]
+        assert len(outputs) == 3
+        assert [tex.count("\\beginnumbering") for tex in outputs].count(2) == 1
+        assert tmpdir.join("edition.tex").read().count("\\beginnumbering") == 2
+
+    def test_cached_book_is_named_after_the_book(self, tmpdir, monkeypatch):
+        def latexmk(self, input_file, output_dir, fmt=False):
+            pdf = os.path.join(output_dir, "document.pdf")
+            with open(pdf, "w") as f:
+                f.write("%PDF")
+            return pdf
+
+        monkeypatch.chdir(tmpdir)
+        monkeypatch.setattr(config, "cache_dir", str(tmpdir.mkdir("cache")))
+        monkeypatch.setattr(Document, "latexmk", latexmk)
+        args = {
+            "--scta": False,
+            "--local": True,
+            "--xslt": os.path.join(self.assets, "simple.xslt"),
+            "--xslt-parameters": None,
+            "--no-cache": False,
+            "--no-samewords": True,
+            "--engine": "lxml",
+            "--book": "edition",
+        }
+        items = [
+            cli.resolve(args, os.path.join(self.assets, name))
+            for name in ("da-49-l1q1.xml", "da-49-l1q1-modified.xml")
+        ]
+        cli.build(args, items, "pdf")
+        assert tmpdir.join("edition.pdf").read() == "%PDF"
+
+
+class TestWatchItems:
+
+    assets = os.path.join(config.module_dir, "test", "assets")
+
+    def test_only_changed_items_are_rebuilt(self, tmpdir, monkeypatch):
+        monkeypatch.chdir(tmpdir)
+        files = []
+        for name in ("first.xml", "second.xml"):
+            tmpdir.join(name).write(
+                open(os.path.join(self.assets, "da-49-l1q1.xml")).read()
+            )
+            files.append(str(tmpdir.join(name)))
+        args = {
+            "--scta": False,
+            "--local": True,
+            "--xslt": os.path.join(self.assets, "simple.xslt"),
+            "--xslt-parameters": None,
+            "--no-cache": True,
+            "--no-samewords": True,
+            "--engine": "lxml",
+        }
+        built = []
+        monkeypatch.setattr(
+            cli, "build", lambda args, items, output_format: built.append(items)
+        )
+        monkeypatch.setattr(watch, "watch", lambda files, rebuild: rebuild([files[1]]))
+        items = [cli.resolve(args, name) for name in files]
+        cli.watch_items(args, files, items, "tex")
+        assert [item.input for item in built[0]] == [files[1]]
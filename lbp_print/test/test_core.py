@@ -2,9 +2,9 @@ import os
 import shutil
 
 import pytest
-import lxml
+import lxml.etree
 
-from lbp_print.core import LocalResource, RemoteResource, UrlResource, Tex
+from lbp_print.core import Cache, LocalResource, RemoteResource, UrlResource, Tex
 from lbp_print import config
 from lbp_print import exceptions as lbp_exceptions
 
@@ -59,8 +59,12 @@ class TestCache:
         """Show that a document is stored in the cache after processing."""
         path = os.path.join(config.module_dir, "test", "assets", "da-49-l1q1.xml")
         res = LocalResource(path)
-        Tex(res).process(output_format="tex")
-        assert os.path.isfile(os.path.join(config.cache_dir, res.digest + ".tex"))
+        tex = Tex(res)
+        tex.process(output_format="tex")
+        assert os.path.isfile(os.path.join(config.cache_dir, tex.tex_digest + ".tex"))
+        assert os.path.isfile(
+            os.path.join(config.cache_dir, tex.transform_digest + ".raw.tex")
+        )
 
     def test_store_different_versions(self, cache_settings):
         """Show that a new vesion of a document gets added to the cache while keeping the old version too.
@@ -73,7 +77,7 @@ class TestCache:
         )
         modified_res = LocalResource(modified_path)
         Tex(modified_res).process(output_format="tex")
-        assert len(os.listdir(config.cache_dir)) == 2
+        assert len(Cache(config.cache_dir).entries) == 4
 
 
 class TestTexConversion:
@@ -98,10 +102,11 @@ class TestTexConversion:
             Tex(res, enable_caching=False).process(output_format="tex")
 
     def test_xml_syntax_error_raised(self):
-        """Test that the XML syntax error is caught and raised."""
+        """Test that the XML syntax error is caught and raised when the document is parsed."""
 
         path = os.path.join(
             config.module_dir, "test", "assets", "da-49-l1q1-invalid.xml"
         )
+        res = LocalResource(path)
         with pytest.raises(lxml.etree.XMLSyntaxError):
-            LocalResource(path)
+            res.tree
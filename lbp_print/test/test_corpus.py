@@ -0,0 +1,116 @@
+import os
+
+import lxml.etree
+import pytest
+
+from lbp_print import config, corpus
+from lbp_print.core import LocalResource, Tex
+
+XSLT = os.path.join(config.module_dir, "test", "assets", "simple.xslt")
+TEI_NS = corpus.TEI_NS
+
+
+def depth(app) -> int:
+    nested = app.findall(f"{TEI_NS}lem/{TEI_NS}app")
+    return 1 + max((depth(child) for child in nested), default=0)
+
+
+class TestGenerate:
+    def test_critical_document(self, tmpdir):
+        filename = corpus.generate(
+            str(tmpdir.join("critical.xml")), paragraphs=5, witnesses=4, depth=3
+        )
+        root = lxml.etree.parse(filename).getroot()
+        assert len(root.findall(f".//{TEI_NS}body//{TEI_NS}p")) == 5
+        assert [
+            witness.get(corpus.XML_ID) for witness in root.iter(TEI_NS + "witness")
+        ] == list("ABCD")
+        top = root.findall(f".//{TEI_NS}p/{TEI_NS}app")
+        assert top and {depth(app) for app in top} == {3}
+        for app in root.iter(TEI_NS + "app"):
+            assert app.find(TEI_NS + "lem") is not None
+            assert app.findall(TEI_NS + "rdg")
+
+    def test_diplomatic_document(self, tmpdir):
+        filename = corpus.generate(
+            str(tmpdir.join("diplomatic.xml")),
+            paragraphs=5,
+            document_type="diplomatic",
+            witnesses=3,
+        )
+        root = lxml.etree.parse(filename).getroot()
+        assert root.find(f"{TEI_NS}text").get("type") == "diplomatic"
+        assert len(list(root.iter(TEI_NS + "witness"))) == 1
+        assert not list(root.iter(TEI_NS + "app"))
+        assert list(root.iter(TEI_NS + "lb"))
+        assert list(root.iter(TEI_NS + "choice"))
+
+    @pytest.mark.parametrize("document_type", corpus.DOCUMENT_TYPES)
+    def test_schema_info(self, tmpdir, document_type):
+        filename = corpus.generate(
+            str(tmpdir.join("document.xml")),
+            paragraphs=1,
+            document_type=document_type,
+            schema_version="1.0.0",
+        )
+        resource = LocalResource(filename, custom_xslt=XSLT)
+        assert resource.get_schema_info() == {
+            "version": "1.0.0",
+            "type": document_type,
+        }
+
+    def test_settings_control_the_size(self, tmpdir):
+        sizes = [
+            os.path.getsize(corpus.generate(str(tmpdir.join(f"{num}.xml")), **settings))
+            for num, settings in enumerate(
+                [
+                    {"paragraphs": 100},
+                    {"paragraphs": 1000},
+                    {"paragraphs": 1000, "apparatus_density": 0.5},
+                    {"paragraphs": 1000, "apparatus_density": 0.5, "witnesses": 6},
+                ]
+            )
+        ]
+        assert sizes == sorted(sizes)
+        assert 8 < sizes[1] / sizes[0] < 12
+
+    def test_same_seed_gives_the_same_document(self, tmpdir):
+        corpus.generate(str(tmpdir.join("first.xml")), paragraphs=3, seed=1)
+        corpus.generate(str(tmpdir.join("second.xml")), paragraphs=3, seed=1)
+        corpus.generate(str(tmpdir.join("other.xml")), paragraphs=3, seed=2)
+        assert tmpdir.join("first.xml").read() == tmpdir.join("second.xml").read()
+        assert tmpdir.join("first.xml").read() != tmpdir.join("other.xml").read()
+
+    def test_conversion(self, tmpdir):
+        filename = corpus.generate(str(tmpdir.join("document.xml")), depth=2)
+        tex = Tex(
+            LocalResource(filename, custom_xslt=XSLT),
+            enable_caching=False,
+            annotate_samewords=False,
+            engine="lxml",
+            output_dir=str(tmpdir),
+        )
+        with open(tex.process(output_format="tex"), encoding="utf-8") as f:
+            buffer = f.read()
+        assert buffer.count("\\pstart") == corpus.PARAGRAPHS_PER_UNIT
+        assert "\\edtext{" in buffer
+
+    @pytest.mark.parametrize(
+        "settings",
+        [
+            {"document_type": "edition"},
+            {"apparatus_density": 1.5},
+            {"witnesses": 0},
+            {"depth": 0},
+        ],
+    )
+    def test_invalid_settings(self, tmpdir, settings):
+        with pytest.raises(ValueError):
+            corpus.generate(str(tmpdir.join("document.xml")), **settings)
+
+
+class TestSigla:
+    def test_sigla(self):
+        sigla = corpus.sigla(28)
+        assert sigla[:3] == ["A", "B", "C"]
+        assert sigla[25:] == ["Z", "A1", "B1"]
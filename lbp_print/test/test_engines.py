@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from lbp_print import config
+from lbp_print import engines
+from lbp_print.core import SaxonLog
+
+assets = os.path.join(config.module_dir, "test", "assets")
+xml_file = os.path.join(assets, "da-49-l1q1.xml")
+simple_xslt = os.path.join(assets, "simple.xslt")
+invalid_xslt = os.path.join(assets, "invalid.xslt")
+
+
+class TestLxmlEngine:
+    def test_transform_to_tex(self):
+        out, _ = engines.LxmlEngine().transform(xml_file, simple_xslt)
+        assert out.startswith(b"\\documentclass[12pt]{article}")
+        assert b"\\edtext{Item}{\\Afootnote{Item O,  B}}" in out
+
+    def test_parameters_are_passed(self):
+        out, _ = engines.LxmlEngine().transform(
+            xml_file, simple_xslt, ["fontsize=11pt"]
+        )
+        assert out.startswith(b"\\documentclass[11pt]{article}")
+
+    def test_compiled_stylesheet_is_reused(self):
+        engine = engines.LxmlEngine()
+        assert engine.compile(simple_xslt) is engine.compile(simple_xslt)
+        assert len(engine.stylesheets) == 1
+
+    def test_messages_are_reported_as_warnings(self, tmpdir):
+        xml = tmpdir.join("empty-app.xml")
+        xml.write(
+            '<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body><p>'
+            "<app><lem>a</lem></app></p></body></text></TEI>"
+        )
+        _, err = engines.LxmlEngine().transform(str(xml), simple_xslt)
+        log = SaxonLog(err)
+        assert "Apparatus entry without readings." in log.text
+        assert log.exit_code == 0
+
+    def test_invalid_stylesheet_is_an_error(self):
+        _, err = engines.LxmlEngine().transform(xml_file, invalid_xslt)
+        assert SaxonLog(err).exit_code == 1
+
+
+class TestEngineSelection:
+    def test_supported_versions(self):
+        assert engines.LxmlEngine().supports(simple_xslt)
+        assert not engines.LxmlEngine().supports(invalid_xslt)
+
+    def test_engines_are_shared(self):
+        assert engines.get_engine("lxml") is engines.get_engine("lxml")
+
+    def test_default_engine(self):
+        assert engines.get_engine().name == config.transform_engine
+
+    def test_unknown_engine(self):
+        with pytest.raises(ValueError):
+            engines.get_engine("xalan")
+
+    def test_auto_engine_uses_lxml_for_xslt_1(self):
+        out, _ = engines.get_engine("auto").transform(xml_file, simple_xslt)
+        assert out == engines.get_engine("lxml").transform(xml_file, simple_xslt)[0]
@@ -0,0 +1,42 @@
+from hashlib import blake2b
+
+import os
+
+from lbp_print import config
+from lbp_print import hashing
+
+xml_file = os.path.join(config.module_dir, "test", "assets", "da-49-l1q1.xml")
+xslt_file = os.path.join(config.module_dir, "test", "assets", "simple.xslt")
+
+
+class TestFileDigest:
+    def test_digest_matches_digest_of_full_content(self):
+        with open(xslt_file, "br") as f:
+            xslt_digest = blake2b(f.read(), digest_size=16).hexdigest()
+        with open(xml_file, "br") as f:
+            xml_digest = blake2b(
+                f.read(), digest_size=16, key=xslt_digest.encode("utf-8")
+            ).hexdigest()
+        assert hashing.file_digest(xslt_file) == xslt_digest
+        assert hashing.file_digest(xml_file, key=xslt_digest) == xml_digest
+
+    def test_large_file_is_hashed_in_chunks(self, tmpdir):
+        content = b"<p>text</p>" * (hashing.CHUNK_SIZE // 4)
+        p = tmpdir.join("large.xml")
+        p.write_binary(content)
+        assert (
+            hashing.file_digest(str(p)) == blake2b(content, digest_size=16).hexdigest()
+        )
+
+    def test_digest_is_memoized(self):
+        hashing.file_digest(xslt_file)
+        hits = hashing._file_digest.cache_info().hits
+        hashing.file_digest(xslt_file)
+        assert hashing._file_digest.cache_info().hits == hits + 1
+
+    def test_changed_file_is_rehashed(self, tmpdir):
+        p = tmpdir.join("changing.xslt")
+        p.write("first")
+        first = hashing.file_digest(str(p))
+        p.write("second version")
+        assert hashing.file_digest(str(p)) != first
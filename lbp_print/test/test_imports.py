@@ -0,0 +1,59 @@
+"""Guard the start-up time of the command line script.
+
+The imports are measured with `python -X importtime` in a new interpreter, so modules loaded
+by other tests do not count.
+"""
+
+import os
+import subprocess
+import sys
+
+from lbp_print import config
+
+XML = os.path.join(config.module_dir, "test", "assets", "da-49-l1q1.xml")
+XSLT = os.path.join(config.module_dir, "test", "assets", "simple.xslt")
+
+# Dependencies that are slow to import and only needed on some code paths.
+HEAVY = {"lbppy", "rdflib", "SPARQLWrapper", "samewords", "ssl", "http.client"}
+
+
+def import_times(code: str) -> dict:
+    """Run the code in a new interpreter.
+
+    :return: Dictionary of the cumulative import time in microseconds by module name.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    times = {}
+    for line in process.stderr.decode("utf-8").splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestImportTime:
+    def test_command_line_script(self):
+        times = import_times("import lbp_print.cli")
+        assert not HEAVY & set(times), (
+            f"lbp_print.cli takes {times['lbp_print.cli'] / 1000:.0f}ms to import and "
+            f"loads {', '.join(sorted(HEAVY & set(times)))}."
+        )
+        assert "lxml.etree" not in times
+
+    def test_local_conversion_without_samewords(self):
+        times = import_times(
+            "from lbp_print.core import LocalResource, Tex\n"
+            f"tex = Tex(LocalResource({XML!r}, custom_xslt={XSLT!r}), engine='lxml',\n"
+            "          enable_caching=False, annotate_samewords=False)\n"
+            "tex.clean(tex.transformed())"
+        )
+        assert "lxml.etree" in times
+        assert not HEAVY & set(
+            times
+        ), f"A local conversion loads {', '.join(sorted(HEAVY & set(times)))}."
@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+
+import pytest
+
+from lbp_print import config
+from lbp_print import exceptions as lbp_exceptions
+from lbp_print import latex
+
+
+class FakeResource:
+    def __init__(self, input):
+        self.input = input
+
+
+class FakeTex:
+    """Stand-in for `Tex` recording how many compilations run at the same time."""
+
+    lock = threading.Lock()
+
+    def __init__(self, name, running, fail=False):
+        self.name = name
+        self.resource = FakeResource(name + ".xml")
+        self.running = running
+        self.fail = fail
+
+    def compile(self, tex_file):
+        with self.lock:
+            self.running.append(1)
+            self.running.peak = max(self.running.peak, len(self.running))
+        time.sleep(0.05)
+        with self.lock:
+            self.running.pop()
+        if self.fail:
+            raise Exception("Latex compilation failed.")
+        return tex_file.replace(".tex", ".pdf")
+
+
+class Running(list):
+    peak = 0
+
+
+class TestDefaultJobs:
+    def test_configured_jobs(self, monkeypatch):
+        monkeypatch.setattr(config, "compile_jobs", 3)
+        assert latex.default_jobs() == 3
+
+    def test_jobs_are_limited_by_memory(self, monkeypatch):
+        monkeypatch.setattr(config, "compile_jobs", None)
+        monkeypatch.setattr(latex, "available_memory", lambda: 1024 ** 3)
+        monkeypatch.setattr(config, "compile_job_memory", 512 * 1024 ** 2)
+        assert 1 <= latex.default_jobs() <= 2
+
+    def test_available_memory_includes_the_page_cache(self, tmpdir):
+        meminfo = tmpdir.join("meminfo")
+        meminfo.write(
+            "MemTotal:       16314204 kB\n"
+            "MemFree:          412000 kB\n"
+            "MemAvailable:    9830400 kB\n"
+            "Cached:          8912000 kB\n"
+        )
+        assert latex.available_memory(str(meminfo)) == 9830400 * 1024
+
+    def test_available_memory_without_meminfo(self, tmpdir, monkeypatch):
+        pages = {"SC_AVPHYS_PAGES": 1000, "SC_PAGE_SIZE": 4096}
+        monkeypatch.setattr(os, "sysconf", pages.get, raising=False)
+        assert latex.available_memory(str(tmpdir.join("missing"))) == 1000 * 4096
+
+    def test_at_least_one_job(self, monkeypatch):
+        monkeypatch.setattr(config, "compile_jobs", None)
+        monkeypatch.setattr(latex, "available_memory", lambda: 0)
+        assert latex.default_jobs() == 1
+
+
+class TestCompileAll:
+    def test_results_are_in_order(self):
+        running = Running()
+        jobs = [(FakeTex(f"q{num}", running), f"q{num}.tex") for num in range(6)]
+        assert latex.compile_all(jobs, max_jobs=3) == [
+            f"q{num}.pdf" for num in range(6)
+        ]
+        assert running.peak == 3
+
+    def test_failure_does_not_stop_the_others(self):
+        running = Running()
+        compiled = []
+        jobs = [
+            (FakeTex("q0", running, fail=True), "q0.tex"),
+            (FakeTex("q1", running), "q1.tex"),
+            (FakeTex("q2", running), "q2.tex"),
+        ]
+        for tex, _ in jobs[1:]:
+            compile = tex.compile
+            tex.compile = lambda f, compile=compile: compiled.append(compile(f))
+        with pytest.raises(lbp_exceptions.BatchError) as excinfo:
+            latex.compile_all(jobs, max_jobs=1)
+        assert [identifier for identifier, _ in excinfo.value.failures] == ["q0.xml"]
+        assert compiled == ["q1.pdf", "q2.pdf"]
+
+
+class TestLatexOutput:
+    def test_only_warnings_and_errors_are_logged(self, caplog):
+        output = latex.LatexOutput("item")
+        lines = [
+            "Latexmk: Run number 1 of rule 'xelatex'",
+            "(/usr/share/texlive/texmf-dist/tex/latex/base/article.cls",
+            "LaTeX Warning: Reference `x' on page 1 undefined on input line 3.",
+            "Output written on document.xdv (2 pages).",
+            "Latexmk: Run number 2 of rule 'xelatex'",
+            "LaTeX Warning: Reference `x' on page 1 undefined on input line 3.",
+            "! Undefined control sequence.",
+            "<recently read> \\foo",
+            "l.12 \\foo",
+            "Output written on document.xdv (3 pages).",
+        ]
+        with caplog.at_level("INFO", logger="lbp_print"):
+            for line in lines:
+                output.line(line)
+        assert [record.getMessage() for record in caplog.records] == [
+            "[item] LaTeX Warning: Reference `x' on page 1 undefined on input line 3.",
+            "[item] ! Undefined control sequence.",
+            "[item] l.12 \\foo",
+        ]
+        assert output.summary() == "2 XeLaTeX passes, 3 pages, 1 warnings, 1 errors."
+
+    @pytest.mark.parametrize(
+        "line",
+        [
+            "I can't find the format file `document.fmt'!",
+            "---! ./document.fmt was written by xetex-2019",
+            "(Fatal format file error; I'm stymied)",
+        ],
+    )
+    def test_format_errors_are_detected(self, line):
+        output = latex.LatexOutput("item")
+        output.line("! Undefined control sequence.")
+        assert not output.format_error
+        output.line(line)
+        assert output.format_error
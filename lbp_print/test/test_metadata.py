@@ -0,0 +1,91 @@
+import os
+import shutil
+import time
+
+import pytest
+
+from lbp_print import config
+from lbp_print import exceptions as lbp_exceptions
+from lbp_print import hashing
+from lbp_print import metadata
+from lbp_print import network
+from lbp_print.core import RemoteResource
+
+
+@pytest.fixture
+def cache_dir(tmpdir, monkeypatch):
+    monkeypatch.setattr(config, "cache_dir", str(tmpdir))
+    monkeypatch.setattr(config, "offline", False)
+    return tmpdir
+
+
+class TestMetadataCache:
+    def test_stored_value_is_returned(self, cache_dir):
+        cache = metadata.get_cache()
+        cache.set("scta:da-49-l1q1", {"url": "http://example.org/a.xml"})
+        assert metadata.get_cache().get("scta:da-49-l1q1") == {
+            "url": "http://example.org/a.xml"
+        }
+
+    def test_expired_value_is_not_returned(self, cache_dir):
+        cache = metadata.get_cache()
+        cache.set("scta:da-49-l1q1", {"url": "http://example.org/a.xml"})
+        assert cache.get("scta:da-49-l1q1", ttl=-1) is None
+
+    def test_offline_ignores_expiry(self, cache_dir, monkeypatch):
+        cache = metadata.get_cache()
+        cache.set("scta:da-49-l1q1", {"url": "http://example.org/a.xml"})
+        monkeypatch.setattr(config, "offline", True)
+        assert cache.get("scta:da-49-l1q1", ttl=-1) is not None
+
+    def test_lookup_is_cached(self, cache_dir):
+        calls = []
+
+        def resolve():
+            calls.append(1)
+            return {"url": "http://example.org/a.xml"}
+
+        assert metadata.lookup("key", resolve) == metadata.lookup("key", resolve)
+        assert len(calls) == 1
+
+    def test_offline_lookup_of_missing_key(self, cache_dir, monkeypatch):
+        monkeypatch.setattr(config, "offline", True)
+        with pytest.raises(lbp_exceptions.OfflineError):
+            metadata.lookup("key", lambda: {})
+
+    def test_no_cache_without_cache_dir(self, monkeypatch):
+        monkeypatch.setattr(config, "cache_dir", None)
+        assert metadata.get_cache() is None
+        assert metadata.lookup("key", lambda: {"value": 1}) == {"value": 1}
+
+
+class TestOfflineResolution:
+
+    url = "http://scta.invalid/da-49-l1q1.xml"
+    xml = os.path.join(config.module_dir, "test", "assets", "da-49-l1q1.xml")
+    xslt = os.path.join(config.module_dir, "test", "assets", "simple.xslt")
+
+    def test_remote_resource_from_cache(self, cache_dir, monkeypatch):
+        metadata.get_cache().set(
+            "scta:da-49-l1q1",
+            {"url": self.url, "schema_info": {"version": "1.0.0", "type": "critical"}},
+        )
+        digest = hashing.file_digest(self.xml)
+        shutil.copyfile(self.xml, os.path.join(network.download_dir(), digest))
+        metadata.get_cache().set(f"download:{self.url}", {"digest": digest})
+
+        def fail(self, input_id):
+            raise AssertionError("SCTA was queried.")
+
+        monkeypatch.setattr(RemoteResource, "_resolve", fail)
+        monkeypatch.setattr(config, "offline", True)
+        start = time.time()
+        res = RemoteResource("da-49-l1q1", custom_xslt=self.xslt)
+        assert time.time() - start < 1
+        assert res.content_digest == digest
+        assert hashing.file_digest(res.file) == digest
+
+    def test_offline_download_of_unknown_url(self, cache_dir, monkeypatch):
+        monkeypatch.setattr(config, "offline", True)
+        with pytest.raises(lbp_exceptions.OfflineError):
+            network.download(self.url, str(cache_dir.join("download.xml")))
@@ -0,0 +1,50 @@
+import os
+import shutil
+
+from lbp_print.core import LocalResource
+from lbp_print import config
+from lbp_print import hashing
+
+
+class TestSchemaDetection:
+
+    xslt = os.path.join(config.module_dir, "test", "assets", "simple.xslt")
+
+    def test_schema_info_read_from_header_only(self):
+        """The syntax error in the body is not reached when reading the schema info."""
+        path = os.path.join(
+            config.module_dir, "test", "assets", "da-49-l1q1-invalid.xml"
+        )
+        res = LocalResource(path, custom_xslt=self.xslt)
+        assert res.get_schema_info() == {"version": "1.0.0", "type": "critical"}
+        assert res._tree is None
+
+    def test_missing_schema_ref(self, tmpdir):
+        p = tmpdir.join("no-schema.xml")
+        p.write(
+            '<TEI xmlns="http://www.tei-c.org/ns/1.0"><teiHeader><encodingDesc/>'
+            "</teiHeader><text><schemaRef n='lbp-critical-1.0.0'/></text></TEI>"
+        )
+        assert LocalResource(str(p), custom_xslt=self.xslt).get_schema_info() is None
+
+    def test_tree_is_parsed_once(self):
+        path = os.path.join(config.module_dir, "test", "assets", "da-49-l1q1.xml")
+        res = LocalResource(path, custom_xslt=self.xslt)
+        assert res.tree is res.tree
+
+
+class TestLocalSnapshot:
+
+    path = os.path.join(config.module_dir, "test", "assets", "da-49-l1q1.xml")
+    xslt = os.path.join(config.module_dir, "test", "assets", "simple.xslt")
+
+    def test_edits_after_hashing_are_not_converted(self, tmpdir):
+        source = tmpdir.join("source.xml")
+        shutil.copyfile(self.path, str(source))
+        res = LocalResource(str(source), custom_xslt=self.xslt)
+        content = source.read()
+        source.write(content.replace("Quaestio", "Question"))
+        with open(res.file, encoding="utf-8") as f:
+            assert f.read() == content
+        assert res.content_digest == hashing.file_digest(res.file)
+        assert res.source_id == str(source)
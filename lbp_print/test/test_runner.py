@@ -0,0 +1,55 @@
+import sys
+
+import pytest
+
+from lbp_print import runner
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+class TestRun:
+    def test_output_is_captured(self):
+        returncode, out, err = runner.run(
+            python(
+                "import sys; print('out'); print('err', file=sys.stderr); sys.exit(3)"
+            )
+        )
+        assert returncode == 3
+        assert out.strip() == b"out"
+        assert err.strip() == b"err"
+
+    def test_lines_are_passed_to_callback(self):
+        lines = []
+        runner.run(
+            python("import sys; sys.stdout.write('one\\r\\ntwo\\nthree')"),
+            on_line=lines.append,
+        )
+        assert lines == ["one", "two", "three"]
+
+    def test_output_is_logged_to_file(self, tmpdir):
+        log_file = str(tmpdir.join("run.log"))
+        _, out, err = runner.run(
+            python("import sys; print('out'); print('err', file=sys.stderr)"),
+            log_file=log_file,
+            capture=False,
+        )
+        assert out == err == b""
+        assert sorted(tmpdir.join("run.log").read().split()) == ["err", "out"]
+
+    def test_large_output_on_both_pipes(self):
+        # Larger than the pipe buffers, so reading only one pipe at a time would block.
+        code = (
+            "import sys\n"
+            "for _ in range(2000):\n"
+            "    sys.stdout.write('o' * 100 + '\\n'); sys.stderr.write('e' * 100 + '\\n')"
+        )
+        lines = []
+        _, out, err = runner.run(python(code), on_line=lines.append)
+        assert len(out) == len(err) == 2000 * 101
+        assert len(lines) == 4000
+
+    def test_missing_program(self):
+        with pytest.raises(OSError):
+            runner.run(["lbp-print-missing-program"])
@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+
+from lbp_print import config
+from lbp_print import saxon
+from lbp_print.core import LocalResource, SaxonLog
+
+
+class TestSaxonWorker:
+
+    path = os.path.join(config.module_dir, "test", "assets", "da-49-l1q1.xml")
+
+    def test_worker_output_matches_single_process(self):
+        res = LocalResource(self.path)
+        worker = saxon.SaxonWorker()
+        try:
+            out, err = worker.transform(res.file, res.xslt)
+        finally:
+            worker.close()
+        expected_out, expected_err = saxon.run_saxon(res.file, res.xslt)
+        assert out == expected_out
+        assert SaxonLog(err).text == SaxonLog(expected_err).text
+
+    def test_worker_handles_multiple_jobs(self):
+        res = LocalResource(self.path)
+        worker = saxon.SaxonWorker()
+        try:
+            first, _ = worker.transform(res.file, res.xslt)
+            second, _ = worker.transform(res.file, res.xslt)
+            assert first == second
+            assert worker.running()
+        finally:
+            worker.close()
+
+    def test_worker_reports_compilation_errors(self):
+        xslt_file = os.path.join(config.module_dir, "test", "assets", "invalid.xslt")
+        res = LocalResource(self.path, custom_xslt=xslt_file)
+        worker = saxon.SaxonWorker()
+        try:
+            _, err = worker.transform(res.file, res.xslt)
+            assert SaxonLog(err).exit_code == 1
+            # The worker survives a failed job.
+            assert worker.running()
+        finally:
+            worker.close()
+
+
+class TestGetWorker:
+    def test_threads_share_one_worker(self, monkeypatch):
+        class Worker:
+            created = 0
+
+            def __init__(self):
+                Worker.created += 1
+                self.pid = os.getpid()
+                time.sleep(0.1)
+
+            def close(self):
+                pass
+
+        monkeypatch.setattr(saxon, "SaxonWorker", Worker)
+        monkeypatch.setattr(saxon, "_worker", None)
+        workers = []
+        threads = [
+            threading.Thread(target=lambda: workers.append(saxon.get_worker()))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert Worker.created == 1
+        assert len(set(map(id, workers))) == 1
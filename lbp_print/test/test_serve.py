@@ -0,0 +1,131 @@
+import http.client
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from lbp_print import api
+from lbp_print import config
+from lbp_print import serve
+
+ASSETS = os.path.join(config.module_dir, "test", "assets")
+XML = os.path.join(ASSETS, "da-49-l1q1.xml")
+
+
+@pytest.fixture
+def service(tmpdir):
+    """Run a render service for local files on a free port."""
+    options = api.Options(
+        source="local",
+        xslt=os.path.join(ASSETS, "simple.xslt"),
+        engine="lxml",
+        annotate_samewords=False,
+        cache_dir=str(tmpdir.join("cache")),
+        jobs=2,
+    )
+    render_service = serve.RenderService(options)
+    server = serve.RenderServer(("127.0.0.1", 0), render_service)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+    render_service.close()
+
+
+def request(port, method, path, body=None):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    connection.request(method, path, body=json.dumps(body) if body else None)
+    response = connection.getresponse()
+    content = response.read()
+    connection.close()
+    return response, content
+
+
+class TestRenderService:
+    def test_render_tex(self, service):
+        response, content = request(service, "POST", "/render", {"item": XML})
+        assert response.status == 200
+        assert response.getheader("Content-Type").startswith("application/x-tex")
+        assert content.startswith(b"\\documentclass")
+        assert json.loads(response.getheader("X-Lbp-Cache-Hits"))["tex"] is False
+        assert "transform" in json.loads(response.getheader("X-Lbp-Timings"))
+
+        response, cached = request(service, "POST", "/render", {"item": XML})
+        assert cached == content
+        assert json.loads(response.getheader("X-Lbp-Cache-Hits"))["tex"] is True
+
+    def test_identical_requests_share_a_job(self, service, monkeypatch):
+        calls = []
+        build_item = api.build_item
+
+        def slow_build_item(*args, **kwargs):
+            calls.append(args[0])
+            time.sleep(0.2)
+            return build_item(*args, **kwargs)
+
+        monkeypatch.setattr(api, "build_item", slow_build_item)
+        responses = []
+        threads = [
+            threading.Thread(
+                target=lambda: responses.append(
+                    request(service, "POST", "/render", {"item": XML})
+                )
+            )
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert calls == [XML]
+        assert [response.status for response, _ in responses] == [200, 200, 200]
+        # The job is finished by a callback right after its result is set.
+        for _ in range(50):
+            response, status = request(service, "GET", "/status")
+            if json.loads(status)["jobs"] == 0:
+                break
+            time.sleep(0.01)
+        assert json.loads(status) == {
+            "requests": 3,
+            "deduplicated": 2,
+            "done": 1,
+            "failed": 0,
+            "jobs": 0,
+        }
+
+    def test_invalid_requests(self, service):
+        for body in ({"file": XML}, {"item": XML, "format": "docx"}):
+            response, content = request(service, "POST", "/render", body)
+            assert response.status == 400
+            assert "error" in json.loads(content)
+        response, _ = request(service, "GET", "/missing")
+        assert response.status == 404
+
+    def test_malformed_requests(self, service):
+        for body in (
+            {"item": XML, "source": ["local"]},
+            {"item": XML, "format": 1},
+            {"item": XML, "xslt_parameters": {"key": "value"}},
+            ["item"],
+        ):
+            response, content = request(service, "POST", "/render", body)
+            assert response.status == 400
+            assert "error" in json.loads(content)
+
+    def test_failed_build(self, service, tmpdir):
+        response, content = request(
+            service, "POST", "/render", {"item": str(tmpdir.join("missing.xml"))}
+        )
+        assert response.status == 500
+        assert "is not a file" in json.loads(content)["error"]
+
+    def test_local_files_require_local_service(self):
+        render_service = serve.RenderService(api.Options(source="scta"))
+        with pytest.raises(ValueError):
+            render_service.job_options({"item": XML, "source": "local"})
+        render_service.close()
@@ -1,5 +1,4 @@
 import os
-import tempfile
 
 from lbp_print.core import Tex, LocalResource, RemoteResource, UrlResource
 
@@ -9,11 +8,7 @@ class TestWhiteSpaceCleanup:
     local = LocalResource(os.path.join("lbp_print", "test", "assets", "da-49-l1q1.xml"))
 
     def clean(self, content: str) -> str:
-        with tempfile.NamedTemporaryFile(mode="w+") as fh:
-            fh.writelines(content)
-            fh.seek(0)
-            Tex(self.local).whitespace_cleanup(fh.name)
-            return fh.read()
+        return Tex(self.local).whitespace_cleanup(content)
 
     def test_whitespace_cleanup(self):
         assert self.clean("test { test") == "test{test"
@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+
+from lbp_print import watch
+
+
+def modify(path, content):
+    """Write to the file and make sure its modification time changes."""
+    path.write(content)
+    stat = os.stat(str(path))
+    os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+class TestWatcher:
+    def test_changed_content_is_reported(self, tmpdir):
+        source = tmpdir.join("source.xml")
+        source.write("<TEI/>")
+        watcher = watch.Watcher([str(source)])
+        assert watcher.changed() == []
+        modify(source, "<TEI>changed</TEI>")
+        assert watcher.changed() == [str(source)]
+        assert watcher.changed() == []
+
+    def test_save_without_changes_is_ignored(self, tmpdir):
+        source = tmpdir.join("source.xml")
+        source.write("<TEI/>")
+        watcher = watch.Watcher([str(source)])
+        modify(source, "<TEI/>")
+        assert watcher.changed() == []
+
+    def test_missing_file_is_reported_when_back(self, tmpdir):
+        source = tmpdir.join("source.xml")
+        source.write("<TEI/>")
+        watcher = watch.Watcher([str(source)])
+        source.remove()
+        assert watcher.changed() == []
+        modify(source, "<TEI>back</TEI>")
+        assert watcher.changed() == [str(source)]
+
+
+class TestWatch:
+    def test_rebuild_on_change(self, tmpdir):
+        source = tmpdir.join("source.xml")
+        source.write("<TEI/>")
+        rebuilds = []
+        done = threading.Event()
+
+        def rebuild(changed):
+            rebuilds.append(changed)
+            if len(rebuilds) == 1:
+                raise Exception("Failing rebuilds do not end the watch.")
+            done.set()
+
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=watch.watch,
+            args=([str(source)], rebuild),
+            kwargs={"interval": 0.01, "stop": stop},
+        )
+        thread.start()
+        time.sleep(0.05)
+        modify(source, "<TEI>first</TEI>")
+        time.sleep(0.05)
+        modify(source, "<TEI>second</TEI>")
+        assert done.wait(5)
+        stop.set()
+        thread.join()
+        assert rebuilds == [[str(source)], [str(source)]]
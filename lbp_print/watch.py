@@ -0,0 +1,104 @@
+"""Rebuilding local items when their files change.
+
+The files are polled every `config.watch_interval` seconds, which works on every platform
+and file system without extra dependencies. A file whose modification time or size
+changed is hashed again, and it only counts as changed when its content digest differs,
+so saving a file without changes does not trigger a rebuild.
+
+Watching runs in the same process for the whole session, so the transformation engines,
+the Saxon worker and the compiled stylesheets stay loaded between rebuilds, and the stage
+keys of the cache make sure that only the stages whose input changed are run again.
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+import logging
+import os
+import threading
+
+from lbp_print import config
+from lbp_print import hashing
+
+logger = logging.getLogger("lbp_print.watch")
+
+
+class Watcher:
+    """Track the content of a set of files."""
+
+    def __init__(self, files: List[str]) -> None:
+        self.files = [os.path.abspath(filename) for filename in files]
+        self.stats: Dict[str, Optional[Tuple[int, int]]] = {}
+        self.digests: Dict[str, Optional[str]] = {}
+        for filename in self.files:
+            self.stats[filename] = self.stat(filename)
+            self.digests[filename] = self.digest(filename)
+
+    @staticmethod
+    def stat(filename: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def digest(filename: str) -> Optional[str]:
+        try:
+            return hashing.file_digest(filename)
+        except OSError:
+            return None
+
+    def changed(self) -> List[str]:
+        """Return the files whose content changed since the last call.
+
+        A file that is missing, for instance while an editor replaces it, is not reported
+        until it is back.
+        """
+        changed = []
+        for filename in self.files:
+            stat = self.stat(filename)
+            if stat is None or stat == self.stats[filename]:
+                continue
+            self.stats[filename] = stat
+            digest = self.digest(filename)
+            if digest is None or digest == self.digests[filename]:
+                logger.debug(f"{filename} was saved without changes.")
+                continue
+            self.digests[filename] = digest
+            changed.append(filename)
+        return changed
+
+
+def watch(
+    files: List[str],
+    rebuild: Callable[[List[str]], None],
+    interval: float = None,
+    stop: threading.Event = None,
+) -> None:
+    """Call `rebuild` with the changed files whenever the content of some of the files
+    changes, until `stop` is set or the process is interrupted.
+
+    A failing rebuild is logged and does not end the watch, so an error in a file can be
+    fixed and saved again.
+
+    :param interval: Seconds between polls. Defaults to `config.watch_interval`.
+    """
+    interval = interval or config.watch_interval
+    stop = stop or threading.Event()
+    watcher = Watcher(files)
+    logger.info(
+        f"Watching {len(watcher.files)} files for changes. Press Ctrl-C to stop."
+    )
+    while not stop.wait(interval):
+        changed = watcher.changed()
+        if not changed:
+            continue
+        logger.info(
+            "Changed: " + ", ".join(os.path.basename(name) for name in changed) + "."
+        )
+        try:
+            rebuild(changed)
+        except Exception as e:
+            logger.error(f"The rebuild failed.\n{type(e).__name__}: {e}")
+        else:
+            logger.info("Rebuild done. Watching for changes.")